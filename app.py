@@ -1,6 +1,7 @@
 import streamlit as st
-from modules.rag_chain import get_rag_chain
-import os
+from modules.rag_chain import get_rag_chain, stream_answer, DEFINITION_TEMPLATE, QUESTION_TEMPLATE, SUMMARY_TEMPLATE
+from modules.shards import get_store
+from modules.catalog import get_catalog
 
 # Page configuration
 st.set_page_config(
@@ -17,13 +18,13 @@ Ask about specific terms, concepts, or any legal questions, and get answers grou
 """)
 
 # Check if vectorstore exists
-if not os.path.exists("vectorstore"):
+if not get_store().vectorstore_exists():
     st.error("⚠️ No documents have been ingested yet. Please run `python ingest.py <document_path>` first.")
     st.stop()
 
-# Initialize RAG chain
+# Initialize RAG chain (shared across reruns; reloads only when the index changes)
 try:
-    qa_chain = get_rag_chain()
+    get_rag_chain()
     st.success("✅ Document knowledge base loaded successfully!")
 except Exception as e:
     st.error(f"❌ Error loading document knowledge base: {str(e)}")
@@ -43,48 +44,71 @@ if query_type == "General Question":
         "What would you like to know about your legal documents?",
         placeholder="e.g., What are the key obligations in this contract?"
     )
+    question_template = QUESTION_TEMPLATE
+    document_source = None
 elif query_type == "Term Definition":
     st.subheader("📖 Define a Legal Term")
     query = st.text_input(
         "Enter a legal term to define:",
         placeholder="e.g., force majeure, consideration, tort"
     )
-    if query:
-        query = f"Define and explain the legal term '{query}' based on the document content"
+    # Defined terms are answered from the index built at ingestion; add
+    # "explain" to the question for the LLM's explanation instead
+    question_template = DEFINITION_TEMPLATE
+    document_source = None
 else:  # Document Summary
     st.subheader("📋 Document Summary")
+    sources = {document["name"]: document["source"] for document in get_catalog().list(status="indexed")}
+    document_name = st.selectbox("Document to summarize:", ["All Documents", *sources])
     query = st.text_input(
         "What aspect would you like summarized?",
         placeholder="e.g., main clauses, key parties, important dates"
     )
-    if query:
-        query = f"Provide a summary of {query} from the document"
+    # A selected document is answered from its summary tree built after
+    # ingestion; all documents are summarized from retrieval by the LLM
+    question_template = SUMMARY_TEMPLATE
+    document_source = sources.get(document_name)
 
 # Process query when submitted
 if query:
     st.markdown("---")
     
-    with st.spinner("🔍 Searching through your documents..."):
-        try:
-            result = qa_chain.invoke({"query": query})
-            
-            # Display answer
-            st.markdown("### 📝 Answer:")
-            st.write(result["result"])
-            
-            # Display source documents
-            if result.get("source_documents"):
-                st.markdown("### 📚 Source Documents:")
-                for i, doc in enumerate(result["source_documents"], 1):
-                    with st.expander(f"📄 Source {i} (Page {getattr(doc, 'metadata', {}).get('page', 'Unknown')})"):
-                        st.write(doc.page_content)
-                        if hasattr(doc, 'metadata') and doc.metadata:
-                            st.caption(f"**Metadata:** {doc.metadata}")
-            else:
-                st.info("No specific source documents found for this query.")
-                
-        except Exception as e:
-            st.error(f"❌ Error processing your query: {str(e)}")
+    try:
+        # The mode's template is part of the answer cache key, so asking to
+        # define the same term again is answered from the cache
+        answer_stream = stream_answer(query, document_source, question_template=question_template)
+        with st.spinner("🔍 Searching through your documents..."):
+            sources_event = next(answer_stream)
+        source_documents = sources_event["documents"]
+
+        # Display answer as it is generated
+        st.markdown("### 📝 Answer:")
+        placeholder = st.empty()
+        answer = ""
+        for event in answer_stream:
+            answer += event["text"]
+            placeholder.markdown(answer + "▌")
+        placeholder.markdown(answer)
+        if sources_event["cached"] == "definitions":
+            st.caption("⚡ Answered from the document's defined terms")
+        elif sources_event["cached"] == "summary":
+            st.caption("⚡ Answered from the precomputed document summary")
+        elif sources_event["cached"]:
+            st.caption("⚡ Answered from cache")
+
+        # Display source documents
+        if source_documents:
+            st.markdown("### 📚 Source Documents:")
+            for i, doc in enumerate(source_documents, 1):
+                with st.expander(f"📄 Source {i} (Page {getattr(doc, 'metadata', {}).get('page', 'Unknown')})"):
+                    st.write(doc.page_content)
+                    if hasattr(doc, 'metadata') and doc.metadata:
+                        st.caption(f"**Metadata:** {doc.metadata}")
+        else:
+            st.info("No specific source documents found for this query.")
+
+    except Exception as e:
+        st.error(f"❌ Error processing your query: {str(e)}")
 
 # Footer with usage instructions
 st.markdown("---")
@@ -96,11 +120,10 @@ st.markdown("""
 - Request summaries of specific sections or topics
 """)
 
-# Check if documents exist
-if os.path.exists("data"):
-    data_files = [f for f in os.listdir("data") if f.endswith(('.pdf', '.txt'))]
-    if data_files:
-        st.sidebar.markdown("---")
-        st.sidebar.markdown("### 📁 Available Documents:")
-        for file in data_files:
-            st.sidebar.text(f"• {file}")
+# List the indexed documents (from the catalog kept by ingestion, not a rescan of data/)
+indexed_documents = get_catalog().list(status="indexed")
+if indexed_documents:
+    st.sidebar.markdown("---")
+    st.sidebar.markdown("### 📁 Available Documents:")
+    for document in indexed_documents:
+        st.sidebar.text(f"• {document['name']}")
@@ -1,30 +1,122 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
-import os
+import json
 import shutil
 from pathlib import Path
 import sys
-from typing import Optional
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
 class QueryRequest(BaseModel):
     query: str
     document_filter: str = None  # Optional document name to filter by
+    query_type: str = "general"  # "general", "term" (the query is a term to define) or "summary"
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    document_filter: str = None  # Optional document name to filter by
+    document_filters: List[str] = None  # Ask every query of each of these documents
 
 # Add the parent directory to the path to import modules
 sys.path.append(str(Path(__file__).parent.parent))
 
-from modules.rag_chain import get_rag_chain
-from modules.loader import load_document
-from modules.splitter import split_documents
-from modules.embeddings import get_embeddings
-from langchain_community.vectorstores import FAISS
-from config import VECTORSTORE_PATH
+from modules.rag_chain import get_rag_chain, aanswer_batch, aanswer_query, astream_answer, QUERY_TEMPLATES
+from modules.shards import ShardNodes, get_store
+from modules.vectorstore import start_snapshot_watcher, stop_snapshot_watcher
+from modules.executor import PoolSaturated, get_cpu_executor, get_llm_limiter
+from modules.answer_cache import get_answer_cache
+from modules.telemetry import REGISTRY, parse_traceparent, span
+from modules.jobs import JobWorkers, get_job_queue
+from modules.catalog import get_catalog
+from modules.terms import get_term_index
+from modules.summaries import SummaryWorker, get_summary_store
+from config import VECTORSTORE_PATH, BATCH_MAX_ITEMS, INDEX_SHARDS, INGEST_JOB_WORKERS, SUMMARY_WORKERS
+
+_job_workers: Optional[JobWorkers] = None
+_shard_nodes: Optional[ShardNodes] = None
+_summary_worker: Optional[SummaryWorker] = None
+
+@asynccontextmanager
+async def lifespan(app):
+    # Ingestion runs in worker processes that drain the job queue
+    global _job_workers, _shard_nodes, _summary_worker
+    if INDEX_SHARDS > 1:
+        # Each shard is searched and written by its own node process
+        _shard_nodes = ShardNodes(INDEX_SHARDS)
+        _shard_nodes.start()
+    if INGEST_JOB_WORKERS > 0:
+        _job_workers = JobWorkers(INGEST_JOB_WORKERS)
+        _job_workers.start()
+    if SUMMARY_WORKERS > 0:
+        # Summary trees of ingested documents are built in the background
+        _summary_worker = SummaryWorker(SUMMARY_WORKERS)
+        _summary_worker.start()
+    # New base snapshots from merges (here or in the workers) are loaded in the background
+    start_snapshot_watcher()
+    # Stores indexed before the catalog existed: list what is already searchable
+    catalog = get_catalog()
+    if not catalog.list(limit=1) and get_store().vectorstore_exists():
+        print(f"📚 Catalogued {catalog.backfill(get_store())} indexed documents")
+    try:
+        yield
+    finally:
+        stop_snapshot_watcher()
+        if _summary_worker is not None:
+            _summary_worker.stop()
+            _summary_worker = None
+        if _job_workers is not None:
+            _job_workers.stop()
+            _job_workers = None
+        if _shard_nodes is not None:
+            _shard_nodes.stop()
+            _shard_nodes = None
 
-app = FastAPI(title="LegalView API", version="1.0.0")
+app = FastAPI(title="LegalView API", version="1.0.0", lifespan=lifespan)
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "legalview_request_seconds", "HTTP request latency, until the last byte is sent", ["method", "route", "status"]
+)
+
+class TelemetryMiddleware:
+    """
+    Time each request until its response (streamed or not) is complete, as
+    the root span of its trace; a W3C ``traceparent`` header makes it a
+    child of the caller's span instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers") or [])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        with span("request", parent=parent, method=scope["method"], path=scope["path"]) as request_span:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                # The matched route template keeps label cardinality bounded
+                route = getattr(scope.get("route"), "path", "unmatched")
+                request_span.set(route=route, status=status["code"])
+                REQUEST_SECONDS.observe(
+                    time.perf_counter() - started, method=scope["method"], route=route, status=str(status["code"])
+                )
+
+app.add_middleware(TelemetryMiddleware)
 
 # CORS middleware
 app.add_middleware(
@@ -43,44 +135,98 @@ def resolve_document_source(filter_value: Optional[str]) -> Optional[str]:
     """
     Map a user-provided document filter to the stored source metadata value.
     Returns the relative path stored in the vector store (e.g. 'data/file.pdf')
-    or None if no specific filter should be applied.
+    or None if no specific filter should be applied. Raises 404 for unknown
+    documents and 409 for ones that are not indexed (yet).
     """
-    if not filter_value:
-        return None
-    candidate = filter_value.strip()
-    if not candidate or candidate.lower() in {"all documents", "all"}:
-        return None
-
-    # Try to match against files in the data directory
-    candidate_lower = candidate.lower()
-    for path in DATA_DIR.glob("*"):
-        if path.is_file():
-            if candidate_lower == path.name.lower():
-                return str(Path("data") / path.name)
-            if candidate_lower in path.name.lower():
-                return str(Path("data") / path.name)
-    return None
-
-# Initialize RAG chain
+    # An indexed lookup in the catalog: exact name, then name prefix
+    catalog = get_catalog()
+    document_source = catalog.resolve(filter_value)
+    if filter_value and not document_source:
+        document = catalog.lookup(filter_value)
+        if document is not None:
+            raise HTTPException(
+                status_code=409, detail=f"Document {document['name']} is {document['status']}, not indexed"
+            )
+        raise HTTPException(status_code=404, detail=f"Requested document not found: {filter_value}")
+    return document_source
+
+def query_template(query_type: str) -> str:
+    """The question template of a query mode; terms and summaries are answered from indexes when found"""
+    if query_type not in QUERY_TEMPLATES:
+        raise HTTPException(status_code=400, detail=f"Unknown query type {query_type!r}")
+    return QUERY_TEMPLATES[query_type]
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request, exc: PoolSaturated):
+    """Shed load instead of queueing behind slow requests"""
+    # A full LLM queue means too many concurrent questions (429); a full CPU
+    # pool means the server itself is out of capacity (503)
+    status_code = 429 if exc.pool == "llm" else 503
+    return JSONResponse(status_code=status_code, content=exc.to_dict(), headers={"Retry-After": "1"})
+
+def save_upload(source, file_path: Path):
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+
+def serialize_document(document):
+    return {
+        "name": document["name"],
+        "display_name": document["display_name"],  # Name without extension
+        "size": document["size"],
+        "type": document["type"],
+        "uploaded": document["uploaded_at"],
+        "path": document["source"],
+        "status": document["status"],
+        "pages": document["pages"],
+        "chunks": document["chunks"],
+        "ingested": document["ingested_at"],
+        "error": document["error"],
+    }
+
+def serialize_sources(docs):
+    return [
+        {
+            "content": doc.page_content[:200] + "...",
+            "metadata": doc.metadata
+        }
+        for doc in docs
+    ]
+
+# Warm up the shared embedding model and index so the first query is fast
 try:
-    qa_chain = get_rag_chain()
+    get_rag_chain()
     print("✅ RAG chain initialized successfully")
 except Exception as e:
     print(f"❌ Error initializing RAG chain: {e}")
     print("⚠️ Starting backend without RAG chain - file uploads will work but queries won't")
-    qa_chain = None
 
 @app.get("/")
 async def read_root():
     return {"message": "LegalView API is running"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage latencies, ingestion, index, caches, pools, memory"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "rag_chain": qa_chain is not None}
+    return {
+        "status": "healthy",
+        "rag_chain": get_store().vectorstore_exists(),
+        "pools": {
+            "cpu": get_cpu_executor().stats(),
+            "llm": get_llm_limiter().stats(),
+        },
+        "answer_cache": get_answer_cache().stats() if get_answer_cache() else None,
+        "ingest_workers": _job_workers.stats() if _job_workers else None,
+        "shards": _shard_nodes.stats() if _shard_nodes else None,
+        "summaries": get_summary_store().stats(),
+    }
 
-@app.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload a document file"""
+@app.post("/upload", status_code=202)
+async def upload_file(file: UploadFile = File(...), priority: int = Form(0)):
+    """Upload a document file and queue it for indexing"""
     try:
         # Validate file type
         allowed_types = [".pdf", ".txt", ".doc", ".docx"]
@@ -91,55 +237,65 @@ async def upload_file(file: UploadFile = File(...)):
         
         # Save file to data directory
         file_path = DATA_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        await get_cpu_executor().run(save_upload, file.file, file_path)
+        await get_cpu_executor().run(get_catalog().record_upload, str(file_path), file_path.stat().st_size)
         
-        # Process the document
-        try:
-            docs = load_document(str(file_path))
-            chunks = split_documents(docs)
-            
-            # Update vectorstore
-            embeddings = get_embeddings()
-            if os.path.exists(VECTORSTORE_PATH):
-                vectorstore = FAISS.load_local(VECTORSTORE_PATH, embeddings, allow_dangerous_deserialization=True)
-                vectorstore.add_documents(chunks)
-            else:
-                vectorstore = FAISS.from_documents(chunks, embeddings)
-            
-            vectorstore.save_local(VECTORSTORE_PATH)
-            
-            return {
-                "message": "File uploaded and processed successfully",
-                "filename": file.filename,
-                "chunks": len(chunks)
-            }
-            
-        except Exception as e:
-            # Remove the file if processing failed
-            if file_path.exists():
-                file_path.unlink()
-            raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+        # Indexing happens in the job workers; poll /jobs/{job_id} for progress.
+        # The enqueue waits on the jobs database's write lock, so it runs off the event loop.
+        job = await get_cpu_executor().run(get_job_queue().enqueue, str(file_path), file.filename, priority=priority)
+        return {
+            "message": "File uploaded and queued for processing",
+            "filename": file.filename,
+            "job_id": job["id"],
+            "status": job["status"],
+            "priority": job["priority"]
+        }
             
+    except (HTTPException, PoolSaturated):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = 50):
+    """Recent ingestion jobs, newest first"""
+    # Queue reads are SQLite calls that can wait on the workers' write lock
+    jobs = await get_cpu_executor().run(get_job_queue().list, limit=limit, status=status)
+    return {"jobs": jobs}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress of an ingestion job"""
+    job = await get_cpu_executor().run(get_job_queue().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/retry")
+async def retry_job(job_id: str):
+    """Queue a failed ingestion job again"""
+    queue = get_job_queue()
+    job = await get_cpu_executor().run(queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "failed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}, only failed jobs can be retried")
+    return await get_cpu_executor().run(queue.retry, job_id)
+
 @app.post("/query")
 async def query_documents(request: QueryRequest):
     """Query the RAG system"""
-    if not qa_chain:
+    if not get_store().vectorstore_exists():
         raise HTTPException(status_code=500, detail="RAG chain not initialized")
 
+    question_template = query_template(request.query_type)
     document_source = resolve_document_source(request.document_filter)
-    if request.document_filter and not document_source:
-        raise HTTPException(status_code=404, detail="Requested document not found")
     
     try:
-        chain_to_use = qa_chain
-        if document_source:
-            chain_to_use = get_rag_chain(document_source=document_source)
-
-        result = chain_to_use.invoke({"query": request.query})
+        # Retrieval runs on the CPU pool and the LLM call is awaited, so a
+        # slow completion no longer blocks other clients; repeated questions
+        # are served from the answer cache without taking an LLM slot
+        result = await aanswer_query(request.query, document_source, question_template)
         
         # Filter sources by document if specified
         sources = result.get("source_documents", [])
@@ -150,36 +306,118 @@ async def query_documents(request: QueryRequest):
                 or (document_source and doc.metadata.get("source") == document_source)
             ]
         
-        return {
-            "answer": result["result"],
-            "sources": [
-                {
-                    "content": doc.page_content[:200] + "...",
-                    "metadata": doc.metadata
-                }
-                for doc in sources
-            ],
-            "document_filter": request.document_filter
-        }
+        with span("serialize"):
+            return JSONResponse({
+                "answer": result["result"],
+                "sources": serialize_sources(sources),
+                "document_filter": request.document_filter,
+                "cached": result.get("cached")
+            })
+    except PoolSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """
+    Query the RAG system and stream the result as Server-Sent Events:
+    a "sources" event as soon as retrieval finishes, then "token" events
+    while the answer is generated, then "done" (or "error").
+    """
+    if not get_store().vectorstore_exists():
+        raise HTTPException(status_code=500, detail="RAG chain not initialized")
+
+    question_template = query_template(request.query_type)
+    document_source = resolve_document_source(request.document_filter)
+
+    # Reject up front; once the stream has started the status code is sent
+    get_llm_limiter().check()
+
+    async def events():
+        try:
+            async for item in astream_answer(request.query, document_source, question_template):
+                if item["event"] == "sources":
+                    with span("serialize"):
+                        event = sse_event("sources", {
+                            "sources": serialize_sources(item["documents"]),
+                            "document_filter": request.document_filter,
+                            "cached": item["cached"]
+                        })
+                    yield event
+                else:
+                    yield sse_event("token", {"text": item["text"]})
+            yield sse_event("done", {})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Error processing query: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/query/batch")
+async def query_documents_batch(request: BatchQueryRequest):
+    """
+    Answer many queries (e.g. a review checklist) in one request, optionally
+    against each of several documents. Streams Server-Sent Events: a "result"
+    event per query and document as soon as its answer is ready (in
+    completion order, tagged with the query's "index"), an "error" event for
+    a query that failed, then "done".
+    """
+    if not get_store().vectorstore_exists():
+        raise HTTPException(status_code=500, detail="RAG chain not initialized")
+
+    filters = request.document_filters or [request.document_filter]
+    document_sources = [resolve_document_source(document_filter) for document_filter in filters]
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries given")
+    if len(request.queries) * len(document_sources) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"A batch may ask at most {BATCH_MAX_ITEMS} queries across all documents")
+
+    get_llm_limiter().check()
+
+    async def events():
+        answered = 0
+        try:
+            async for item in aanswer_batch(request.queries, document_sources):
+                data = {"index": item["index"], "query": item["question"], "document": item["document_source"]}
+                if "error" in item:
+                    yield sse_event("error", dict(data, detail=f"Error processing query: {item['error']}"))
+                    continue
+                answered += 1
+                with span("serialize"):
+                    event = sse_event("result", dict(
+                        data,
+                        answer=item["result"],
+                        sources=serialize_sources(item["source_documents"]),
+                        cached=item["cached"],
+                    ))
+                yield event
+            yield sse_event("done", {"answered": answered, "total": len(request.queries) * len(document_sources)})
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Error processing batch: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/documents")
-async def list_documents():
-    """List all uploaded documents"""
+async def list_documents(status: Optional[str] = None, prefix: Optional[str] = None, limit: int = 10000):
+    """List uploaded documents from the catalog, optionally by status or name prefix"""
     try:
-        files = []
-        for file_path in DATA_DIR.glob("*"):
-            if file_path.is_file():
-                files.append({
-                    "name": file_path.name,
-                    "display_name": file_path.stem,  # Name without extension
-                    "size": file_path.stat().st_size,
-                    "type": file_path.suffix,
-                    "uploaded": file_path.stat().st_mtime,
-                    "path": str(file_path)
-                })
-        return {"documents": files}
+        catalog = get_catalog()
+        if prefix:
+            documents = catalog.find_prefix(prefix, limit=limit, status=status)
+        else:
+            documents = catalog.list(status=status, limit=limit)
+        return {"documents": [serialize_document(document) for document in documents]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -187,21 +425,33 @@ async def list_documents():
 async def get_document_info(document_name: str):
     """Get information about a specific document"""
     try:
-        file_path = DATA_DIR / document_name
-        if not file_path.exists():
+        document = get_catalog().get(document_name)
+        if document is None:
             raise HTTPException(status_code=404, detail="Document not found")
         
-        return {
-            "name": file_path.name,
-            "display_name": file_path.stem,
-            "size": file_path.stat().st_size,
-            "type": file_path.suffix,
-            "uploaded": file_path.stat().st_mtime,
-            "path": str(file_path)
-        }
+        info = serialize_document(document)
+        info["vector_ranges"] = document["vector_ranges"]
+        info["shard"] = document["shard"]
+        info["content_hash"] = document["content_hash"]
+        return info
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/documents/{document_name}/summary")
+async def get_document_summary(document_name: str):
+    """The document's summary tree: the document summary at "root", section summaries in levels[0]"""
+    document = get_catalog().get(document_name)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    tree = get_summary_store().tree(document["source"])
+    if tree is None:
+        summary = get_summary_store().document(document["source"])
+        status = summary["status"] if summary else "not queued"
+        raise HTTPException(status_code=404, detail=f"No summary yet (status: {status})")
+    return tree
+
 @app.get("/documents/{filename}/download")
 async def download_document(filename: str):
     """Download a document"""
@@ -210,7 +460,6 @@ async def download_document(filename: str):
         if not file_path.exists():
             raise HTTPException(status_code=404, detail="Document not found")
         
-        from fastapi.responses import FileResponse
         return FileResponse(
             path=str(file_path),
             filename=filename,
@@ -220,7 +469,7 @@ async def download_document(filename: str):
         raise HTTPException(status_code=500, detail=f"Error downloading document: {str(e)}")
 
 @app.delete("/documents/{filename}")
-async def delete_document(filename: str):
+async def remove_document(filename: str):
     """Delete a document"""
     try:
         file_path = DATA_DIR / filename
@@ -229,16 +478,24 @@ async def delete_document(filename: str):
         
         # Remove the file
         file_path.unlink()
+        cpu = get_cpu_executor()
+        for index in (get_catalog(), get_term_index(), get_summary_store()):
+            await cpu.run(index.remove, str(Path("data") / filename))
         
-        # Rebuild the vectorstore to remove the deleted document
+        # Hide the document's chunks from search; compaction reclaims them later
+        removed_chunks = 0
         try:
-            from ingest import main as ingest_main
-            ingest_main()
+            removed_chunks = await get_cpu_executor().run(get_store().delete_document, str(Path("data") / filename))
             print(f"✅ Vectorstore updated after deleting {filename}")
         except Exception as e:
             print(f"⚠️ Warning: Could not update vectorstore after deletion: {e}")
         
-        return {"message": f"Document {filename} deleted successfully"}
+        return {
+            "message": f"Document {filename} deleted successfully",
+            "removed_chunks": removed_chunks
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting document: {str(e)}")
 
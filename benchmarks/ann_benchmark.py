@@ -0,0 +1,166 @@
+"""
+Compare vector index backends: recall@k against exact (flat) search,
+queries per second and resident memory, for each backend and query-time
+setting (nprobe for IVF-PQ, efSearch for HNSW), loaded into RAM or
+memory-mapped.
+
+Each index is searched in a fresh process so its memory is measured on its
+own. Vectors are synthetic (clustered, like sentence embeddings) unless
+--from-store takes them from the current vectorstore.
+
+Examples:
+  python benchmarks/ann_benchmark.py --vectors 200000
+  python benchmarks/ann_benchmark.py --types ivfpq --nprobe 4 16 64 --mmap
+  python benchmarks/ann_benchmark.py --from-store --json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from modules import ann
+
+
+def rss_mb() -> float:
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synthetic_vectors(count: int, dim: int, clusters: int = 256, seed: int = 7) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.35 * rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def store_vectors() -> np.ndarray:
+    import modules.vectorstore as vectorstore
+    return vectorstore._get_index().vectors()
+
+
+def _measure(path, queries_path, truth_path, k, mmap, nprobe, ef_search, results):
+    """Child process: load one index and time queries against it."""
+    before = rss_mb()
+    started = time.perf_counter()
+    index = ann.read_index(path, mmap=mmap)
+    load_seconds = time.perf_counter() - started
+    loaded = rss_mb()
+    queries = np.load(queries_path)
+    truth = np.load(truth_path)
+    params = ann.search_parameters(index, nprobe=nprobe, ef_search=ef_search)
+    index.search(queries[:10], k, params=params)  # warm up
+    found, latencies = [], []
+    for query in queries:
+        started = time.perf_counter()
+        found.append(index.search(query[None, :], k, params=params)[1][0])
+        latencies.append(time.perf_counter() - started)
+    elapsed = sum(latencies)
+    recall = np.mean([len(set(row) & set(expected)) / k for row, expected in zip(found, truth)])
+    results.put({
+        "load_seconds": load_seconds,
+        "recall": float(recall),
+        "qps": len(queries) / elapsed,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "load_rss_mb": loaded - before,
+        "rss_mb": rss_mb() - before,  # after searching: includes pages touched and search buffers
+    })
+
+
+def run(args):
+    vectors = store_vectors() if args.from_store else synthetic_vectors(args.vectors, args.dim)
+    rng = np.random.default_rng(11)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    print(f"{len(vectors)} vectors of dim {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    truth = exact.search(queries, args.k)[1]
+
+    context = multiprocessing.get_context("spawn")
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        queries_path = os.path.join(directory, "queries.npy")
+        truth_path = os.path.join(directory, "truth.npy")
+        np.save(queries_path, queries)
+        np.save(truth_path, truth)
+        for kind in args.types:
+            if not ann.can_build(kind, len(vectors)):
+                print(f"{kind}: needs {ann.min_training_size(kind, len(vectors))} vectors to train, skipped")
+                continue
+            started = time.perf_counter()
+            index = ann.create_index(kind, vectors)
+            index.add(vectors)
+            build_seconds = time.perf_counter() - started
+            path = os.path.join(directory, f"{kind}.faiss")
+            faiss.write_index(index, path)
+            del index
+            settings = {"ivfpq": [(n, None) for n in args.nprobe], "hnsw": [(None, e) for e in args.ef_search]}
+            for mmap in ([False, True] if args.mmap else [False]):
+                for nprobe, ef_search in settings.get(kind, [(None, None)]):
+                    results = context.Queue()
+                    process = context.Process(
+                        target=_measure,
+                        args=(path, queries_path, truth_path, args.k, mmap, nprobe, ef_search, results),
+                    )
+                    process.start()
+                    row = results.get()
+                    process.join()
+                    row.update({
+                        "index": kind,
+                        "mmap": mmap,
+                        "nprobe": nprobe,
+                        "ef_search": ef_search,
+                        "build_seconds": build_seconds,
+                        "file_mb": os.path.getsize(path) / 2 ** 20,
+                    })
+                    report.append(row)
+    return report
+
+
+def print_report(report, k):
+    print(f"{'index':<7}{'mmap':<6}{'param':<12}{'recall@' + str(k):>10}{'QPS':>10}{'p50 ms':>9}"
+          f"{'RSS load':>9}{'RSS MB':>9}{'file MB':>9}{'build s':>9}{'load s':>8}")
+    for row in report:
+        param = f"nprobe={row['nprobe']}" if row["nprobe"] else f"ef={row['ef_search']}" if row["ef_search"] else "-"
+        print(f"{row['index']:<7}{str(row['mmap']):<6}{param:<12}{row['recall']:>10.3f}{row['qps']:>10.0f}"
+              f"{row['p50_ms']:>9.3f}{row['load_rss_mb']:>9.1f}{row['rss_mb']:>9.1f}{row['file_mb']:>9.1f}{row['build_seconds']:>9.1f}"
+              f"{row['load_seconds']:>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark flat, IVF-PQ and HNSW indexes: recall vs flat, QPS and memory",
+        epilog=__doc__.split("Examples:")[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--vectors", type=int, default=100000, help="synthetic vectors to index")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic vector dimension (MiniLM: 384)")
+    parser.add_argument("--from-store", action="store_true", help="use the vectors of the current vectorstore")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=list(ann.INDEX_TYPES), choices=ann.INDEX_TYPES)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--mmap", action="store_true", help="also measure each index memory-mapped")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, args.k)
@@ -0,0 +1,103 @@
+"""
+Compare embedding backends (fp32 torch, int8 dynamic quantization, ONNX
+Runtime): document encode throughput, single-query latency, model load
+time and cosine parity with the fp32 vectors.
+
+Texts are chunks of the synthetic contracts (see
+splitter_benchmark.iter_contracts), so lengths vary like real ingestion
+batches. The model is loaded from the local Hugging Face cache or a path
+given with --model; nothing is downloaded.
+
+Examples:
+  python benchmarks/embedding_benchmark.py
+  python benchmarks/embedding_benchmark.py --backends torch int8 --threads 4 --batch-size 64
+  python benchmarks/embedding_benchmark.py --model ./models/all-MiniLM-L6-v2 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("HF_HUB_OFFLINE", "1")  # use the locally cached model or fail, never download
+
+import config
+from modules.embeddings import EMBEDDING_BACKENDS, SentenceEmbeddings, parity_check
+from modules.splitter import get_splitter
+from benchmarks.splitter_benchmark import iter_contracts
+
+
+def sample_chunks(count: int, seed: int = 7):
+    chunks = []
+    splitter = get_splitter()
+    for doc, _ in iter_contracts(count, seed):
+        chunks.extend(chunk.page_content for chunk in splitter.split_documents([doc]))
+        if len(chunks) >= count:
+            break
+    return chunks[:count]
+
+
+def measure(backend: str, model: str, texts, queries, batch_size: int, threads: int, reference=None) -> dict:
+    started = time.perf_counter()
+    embeddings = SentenceEmbeddings(model, backend=backend, batch_size=batch_size, threads=threads)
+    row = {"backend": backend, "load_seconds": time.perf_counter() - started}
+    embeddings.embed_documents(texts[:batch_size])  # warm up
+    started = time.perf_counter()
+    embeddings.embed_documents(texts)
+    row["docs_per_second"] = len(texts) / (time.perf_counter() - started)
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        embeddings.embed_query(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+    row["query_p50_ms"] = statistics.median(latencies)
+    if reference is not None:
+        row.update(parity_check(embeddings, reference, texts[:256], min_cosine=0.0))
+    return row, embeddings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare embedding backends: throughput, query latency and parity with fp32",
+        epilog=__doc__.split("Examples:")[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL, help="model name in the local cache, or a path")
+    parser.add_argument("--backends", nargs="+", choices=EMBEDDING_BACKENDS, default=["torch", "int8"])
+    parser.add_argument("--texts", type=int, default=2000, help="chunks encoded per backend")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=config.EMBEDDING_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=config.EMBEDDING_THREADS, help="intra-op threads, 0 = default")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    texts = sample_chunks(args.texts)
+    queries = [f"What does the agreement say about {text.split()[-1]}?" for text in texts[:args.queries]]
+    # The fp32 model is the reference for parity; measure it first
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    report, reference = [], None
+    for backend in backends:
+        try:
+            row, embeddings = measure(backend, args.model, texts, queries, args.batch_size, args.threads, reference)
+        except (ImportError, OSError) as e:
+            report.append({"backend": backend, "error": str(e)})
+            continue
+        if reference is None:
+            reference = embeddings
+        report.append(row)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        baseline = report[0].get("docs_per_second")
+        print(f"{len(texts)} chunks, batch size {args.batch_size}, threads {args.threads or 'default'}")
+        print(f"{'backend':<8}{'load s':>8}{'docs/s':>10}{'speedup':>9}{'query ms':>10}{'min cos':>9}{'mean cos':>10}")
+        for row in report:
+            if "error" in row:
+                print(f"{row['backend']:<8}  {row['error']}")
+                continue
+            speedup = row["docs_per_second"] / baseline if baseline else float("nan")
+            print(f"{row['backend']:<8}{row['load_seconds']:>8.2f}{row['docs_per_second']:>10.1f}{speedup:>8.2f}x"
+                  f"{row['query_p50_ms']:>10.2f}{row.get('min_cosine', 1.0):>9.4f}{row.get('mean_cosine', 1.0):>10.4f}")
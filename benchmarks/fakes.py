@@ -0,0 +1,60 @@
+"""
+Offline stand-ins for the embedding model and the LLM, so benchmarks run
+without network access and give the same answers on every run.
+"""
+import re
+import time
+import zlib
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import SimpleChatModel
+
+_TOKEN = re.compile(r"\w+")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Bag-of-words vectors: each lowercased token is hashed (CRC32, stable
+    across processes) to a signed dimension, and the sum is L2-normalized.
+    Texts sharing words end up close, so retrieval behaves plausibly, at a
+    small fraction of the cost of a real model.
+    """
+
+    def __init__(self, size: int = 384):
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in _TOKEN.findall(text.lower()):
+            code = zlib.crc32(token.encode())
+            vector[code % self.size] += 1.0 if code & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class EchoLLM(SimpleChatModel):
+    """
+    Deterministic chat model: answers with the first line of the context in
+    its prompt, after sleeping ``latency`` seconds to stand in for the API.
+    """
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def _call(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = messages[-1].content if messages else ""
+        context = prompt.split("Context:", 1)[-1].strip()
+        return "According to the documents: " + context.splitlines()[0][:200] if context else "Not found in the documents."
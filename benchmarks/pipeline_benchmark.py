@@ -0,0 +1,340 @@
+"""
+End-to-end benchmark of the ingestion and query paths, fully offline.
+
+A synthetic corpus of contracts (see splitter_benchmark.iter_contracts) is
+written to a temporary data directory and ingested with ingest.ingest() into
+a temporary store, using the hashing embedding stub (or the locally cached
+MiniLM with --embeddings minilm) and a deterministic echo LLM. The index is
+then loaded in a fresh process, where load time, memory and the latency of
+every query path are measured: vector, lexical and hybrid search, scoped
+search, a full answer through the RAG chain (answer cache off) and a batch
+answer, plus the size of the assembled prompt context and how often it
+holds the expected sentence.
+
+The report is JSON-serializable: {"config": ..., "metrics": {name: value}}.
+--save writes it; --baseline compares against a saved report and exits
+with status 1 if any metric is worse than --tolerance (relative). Settings
+read from the environment (INDEX_TYPE, SPLITTER_MODE, RETRIEVAL_MODE, ...)
+are recorded in the config and apply to the benchmarked code as usual.
+
+Examples:
+  python benchmarks/pipeline_benchmark.py --documents 1000
+  python benchmarks/pipeline_benchmark.py --documents 200 --baseline benchmarks/baselines/pipeline-200.json
+  INDEX_TYPE=hnsw python benchmarks/pipeline_benchmark.py --documents 100000 --workers 8 --save hnsw-100k.json
+  python benchmarks/pipeline_benchmark.py --embeddings minilm --llm-latency 0.5 --json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+import config
+from benchmarks.ann_benchmark import rss_mb
+from benchmarks.fakes import EchoLLM, HashingEmbeddings
+from benchmarks.splitter_benchmark import directory_size, iter_contracts
+
+# Metrics where a larger value is an improvement; for all others smaller is better
+HIGHER_IS_BETTER = ("per_second", "qps")
+# Metrics that describe the workload rather than its performance
+NOT_COMPARED = ("chunks", "documents", "queries")
+# Absolute changes too small to count as a regression, by metric unit suffix
+NOISE_FLOORS = {"ms": 1.0, "seconds": 0.05, "mb": 1.0}
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS of this process in MB. VmHWM, unlike ru_maxrss, is not inherited across exec by spawned children."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if platform.system() == "Darwin" else peak / 1024
+
+
+def use_offline_models(embeddings: str, llm_latency: float):
+    """Install the embedding stub (or cached MiniLM) and echo LLM; caches off so every call does the work."""
+    import modules.answer_cache as answer_cache
+    import modules.embeddings as embeddings_module
+    import modules.rag_chain as rag_chain
+
+    if embeddings == "minilm":
+        os.environ["HF_HUB_OFFLINE"] = "1"  # use the locally cached model or fail, never download
+        try:
+            # EMBEDDING_BACKEND (torch, int8, onnx) applies as in the backend
+            embeddings_module._embeddings = embeddings_module.load_embedding_model()
+        except OSError as e:
+            raise SystemExit(f"{config.EMBEDDING_MODEL} is not in the local Hugging Face cache ({e}); use --embeddings stub")
+    else:
+        embeddings_module._embeddings = HashingEmbeddings()
+    answer_cache.ANSWER_CACHE_ENABLED = False
+    rag_chain._llm = EchoLLM(latency=llm_latency)
+    rag_chain._chain = None
+
+
+def write_corpus(directory: str, documents: int, queries: int, seed: int):
+    """Write the contracts as text files; returns a sample of ``queries`` labeled queries."""
+    rng = random.Random(seed)
+    sample, seen = [], 0
+    for doc, doc_queries in iter_contracts(documents, seed):
+        path = os.path.join(directory, os.path.basename(doc.metadata["source"]))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(doc.page_content)
+        for query in doc_queries:
+            # Reservoir sampling keeps queries spread over the whole corpus
+            seen += 1
+            entry = {"query": query["query"], "expected": query["expected"], "document": path}
+            if len(sample) < queries:
+                sample.append(entry)
+            elif rng.random() < queries / seen:
+                sample[rng.randrange(queries)] = entry
+    return sample
+
+
+def latency_metrics(prefix: str, latencies) -> dict:
+    latencies = np.asarray(latencies) * 1000
+    return {
+        f"{prefix}_p50_ms": float(np.percentile(latencies, 50)),
+        f"{prefix}_p95_ms": float(np.percentile(latencies, 95)),
+        f"{prefix}_p99_ms": float(np.percentile(latencies, 99)),
+        f"{prefix}_qps": float(len(latencies) / (latencies.sum() / 1000)) if latencies.sum() else 0.0,
+    }
+
+
+def _timed(fn, items):
+    latencies = []
+    for item in items:
+        started = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def measure_ingest(data_dir: str, store_dir: str, workers: int, batch_size: int, commit_size: int) -> dict:
+    import ingest
+    import modules.vectorstore as vectorstore
+
+    vectorstore.VECTORSTORE_PATH = store_dir
+    vectorstore.reset_vectorstore()
+    before = rss_mb()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # per-file progress lines
+        stats = ingest.ingest(data_dir, workers=workers, batch_size=batch_size, commit_size=commit_size)
+    seconds = time.perf_counter() - started
+    if stats is None or stats.files_failed:
+        raise RuntimeError(f"ingestion failed: {stats and stats.summary()}")
+    if vectorstore._merge_thread is not None:
+        vectorstore._merge_thread.join()
+    return {
+        "documents": stats.files_done,
+        "chunks": stats.chunks,
+        "ingest_seconds": seconds,
+        "ingest_docs_per_second": stats.files_done / seconds,
+        "ingest_chunks_per_second": stats.chunks / seconds,
+        "ingest_embed_seconds": stats.embed_seconds,
+        "ingest_write_seconds": stats.write_seconds,  # segment appends and the final merge (index build)
+        "ingest_rss_mb": rss_mb() - before,
+        "ingest_peak_rss_mb": peak_rss_mb(),
+        "index_disk_mb": directory_size(store_dir) / 2 ** 20,
+    }
+
+
+def _measure_queries(store_dir, queries, options, results):
+    """Child process: load the store cold, then time each query path."""
+    try:
+        results.put(measure_queries(store_dir, queries, options))
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def measure_queries(store_dir: str, queries, options: dict) -> dict:
+    use_offline_models(options["embeddings"], options["llm_latency"])
+    import modules.vectorstore as vectorstore
+    from modules.rag_chain import _context_tokens, aanswer_batch, answer_query, retrieve_context
+
+    vectorstore.VECTORSTORE_PATH = store_dir
+    vectorstore.reset_vectorstore()
+    metrics = {}
+    before = rss_mb()
+    started = time.perf_counter()
+    vectorstore.get_vectorstore()
+    metrics["index_load_seconds"] = time.perf_counter() - started
+    metrics["index_load_rss_mb"] = rss_mb() - before
+
+    texts = [query["query"] for query in queries]
+    k = options["k"]
+    vectorstore.similarity_search(texts[0], k=k)  # warm up the embedding stub and lexical index
+    vectorstore.hybrid_search(texts[0], k=k)
+    for mode, search in (
+        ("vector", vectorstore.similarity_search),
+        ("lexical", vectorstore.lexical_search),
+        ("hybrid", vectorstore.hybrid_search),
+    ):
+        found = []
+        latencies = _timed(lambda text: found.append(search(text, k=k)), texts)
+        metrics.update(latency_metrics(f"query_{mode}", latencies))
+        hits = sum(any(query["expected"] in doc.page_content for doc, _ in docs) for query, docs in zip(queries, found))
+        metrics[f"query_{mode}_hit_rate"] = hits / len(queries)
+    scoped = _timed(lambda query: vectorstore.hybrid_search(query["query"], k=k, document_source=query["document"]), queries)
+    metrics.update(latency_metrics("query_hybrid_scoped", scoped))
+
+    answers = texts[:options["answers"]]
+    metrics.update(latency_metrics("answer", _timed(answer_query, answers)))
+    # The context the LLM is given: its size, and whether it holds the answer
+    contexts = [retrieve_context(text) for text in texts]
+    metrics["context_tokens"] = sum(_context_tokens(docs) for docs in contexts) / len(contexts)
+    hits = sum(any(query["expected"] in doc.page_content for doc in docs) for query, docs in zip(queries, contexts))
+    metrics["context_hit_rate"] = hits / len(queries)
+
+    async def run_batch():
+        return [item async for item in aanswer_batch(answers)]
+
+    started = time.perf_counter()
+    answered = asyncio.run(run_batch())
+    metrics["answer_batch_seconds"] = time.perf_counter() - started
+    metrics["answer_batch_per_second"] = len(answered) / metrics["answer_batch_seconds"]
+    metrics["query_rss_mb"] = rss_mb() - before
+    metrics["query_peak_rss_mb"] = peak_rss_mb()
+    return metrics
+
+
+def run(args) -> dict:
+    report = {
+        "config": {
+            "documents": args.documents,
+            "queries": args.queries,
+            "answers": args.answers,
+            "seed": args.seed,
+            "embeddings": args.embeddings,
+            "embedding_backend": config.EMBEDDING_BACKEND,
+            "llm_latency": args.llm_latency,
+            "k": args.k,
+            "workers": args.workers,
+            "batch_size": args.batch_size,
+            "commit_size": args.commit_size,
+            "index_type": config.INDEX_TYPE,
+            "index_mmap": config.INDEX_MMAP,
+            "splitter_mode": config.SPLITTER_MODE,
+            "retrieval_mode": config.RETRIEVAL_MODE,
+            "python": platform.python_version(),
+            "faiss": faiss.__version__,
+            "cpus": os.cpu_count(),
+        },
+        "metrics": {},
+    }
+    use_offline_models(args.embeddings, args.llm_latency)
+    with tempfile.TemporaryDirectory() as directory:
+        data_dir = os.path.join(directory, "data")
+        store_dir = os.path.join(directory, "vectorstore")
+        os.makedirs(data_dir)
+        started = time.perf_counter()
+        queries = write_corpus(data_dir, args.documents, args.queries, args.seed)
+        report["metrics"]["corpus_seconds"] = time.perf_counter() - started
+        report["metrics"].update(measure_ingest(data_dir, store_dir, args.workers, args.batch_size, args.commit_size))
+
+        # A fresh process, so load time and memory are those of a cold start
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        options = {"embeddings": args.embeddings, "llm_latency": args.llm_latency, "k": args.k, "answers": args.answers}
+        process = context.Process(target=_measure_queries, args=(store_dir, queries, options, results))
+        process.start()
+        measured = results.get()
+        process.join()
+        if "error" in measured:
+            raise RuntimeError(f"query benchmark failed: {measured['error']}")
+        report["metrics"]["queries"] = len(queries)
+        report["metrics"].update(measured)
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float):
+    """Rows of (metric, baseline, current, relative change, regressed) for metrics in both reports."""
+    rows = []
+    for name, current in report["metrics"].items():
+        previous = baseline["metrics"].get(name)
+        if previous is None or name in NOT_COMPARED:
+            continue
+        change = (current - previous) / previous if previous else 0.0
+        higher_is_better = any(marker in name for marker in HIGHER_IS_BETTER) or name.endswith("hit_rate")
+        worse = -change if higher_is_better else change
+        # Changes below 1 ms, 50 ms of a phase or 1 MB are noise, not regressions
+        floor = NOISE_FLOORS.get(name.rsplit("_", 1)[-1], 0.0)
+        small = abs(current - previous) < floor
+        rows.append((name, previous, current, change, worse > tolerance and not small))
+    return rows
+
+
+def print_report(report: dict):
+    print(", ".join(f"{key}={value}" for key, value in report["config"].items()))
+    for name, value in report["metrics"].items():
+        print(f"  {name:<32}{value:>14.3f}" if isinstance(value, float) else f"  {name:<32}{value:>14}")
+
+
+def print_comparison(rows, tolerance: float):
+    print(f"\n{'metric':<32}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, previous, current, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<32}{previous:>12.3f}{current:>12.3f}{change:>+9.1%}{flag}")
+    regressions = sum(row[4] for row in rows)
+    print(f"\n{regressions} regression(s) beyond {tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Offline end-to-end benchmark: ingest throughput, index load, query latency and memory",
+        epilog=__doc__.split("Examples:")[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--documents", type=int, default=1000, help="synthetic contracts to ingest (10 to 100000)")
+    parser.add_argument("--queries", type=int, default=200, help="labeled queries timed per search mode")
+    parser.add_argument("--answers", type=int, default=20, help="questions answered through the RAG chain")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--embeddings", choices=["stub", "minilm"], default="stub",
+                        help="hashing stub, or the MiniLM model from the local Hugging Face cache")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds the echo LLM sleeps per call")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=config.INGEST_WORKERS, help="ingestion parser processes")
+    parser.add_argument("--batch-size", type=int, default=config.EMBED_BATCH_SIZE)
+    parser.add_argument("--commit-size", type=int, default=config.INGEST_COMMIT_SIZE)
+    parser.add_argument("--save", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="compare against a report saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change counted as a regression")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        differing = {
+            key: (baseline["config"].get(key), value) for key, value in report["config"].items()
+            if key not in ("python", "faiss", "cpus") and baseline["config"].get(key) != value
+        }
+        if differing:
+            print(f"\nWarning: the baseline was run with different settings: {differing}")
+        rows = compare(report, baseline, args.tolerance)
+        print_comparison(rows, args.tolerance)
+        sys.exit(1 if any(row[4] for row in rows) else 0)
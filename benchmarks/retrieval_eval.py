@@ -0,0 +1,177 @@
+"""
+Retrieval quality and latency report.
+
+Measures recall@k of vector, lexical (BM25) and hybrid retrieval against a
+labeled query set, plus BM25 search latency at scale.
+
+A query set is a JSONL file, one query per line:
+
+    {"query": "What does clause 7.3 say about notice?", "expected": "written notice", "document": "data/msa.pdf"}
+
+A hit counts as relevant if its text contains ``expected``; ``document`` is
+optional and scopes the search. Without --queries, a synthetic contract corpus
+with its own labeled queries is generated in a temporary store.
+
+Examples:
+  python benchmarks/retrieval_eval.py --queries my_queries.jsonl
+  python benchmarks/retrieval_eval.py --synthetic 200 --fake-embeddings
+  python benchmarks/retrieval_eval.py --lexical-scale 1000000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain.schema import Document
+
+import modules.vectorstore as vectorstore
+from modules.bm25 import BM25Index
+from modules.retriever import SEARCH_FUNCTIONS
+
+PARTIES = ["Acme Holdings", "Borealis Capital", "Cobalt Logistics", "Dunmore Health", "Everline Media",
+           "Fairhaven Estates", "Granite Works", "Harbor Analytics", "Ironleaf Foods", "Juniper Telecom"]
+TOPICS = ["payment of fees", "confidential information", "termination for convenience", "limitation of liability",
+          "governing law", "assignment", "notices", "indemnification", "insurance", "audit rights"]
+TERMS = ["Effective Date", "Deliverables", "Territory", "Licensed Materials", "Service Levels",
+         "Change of Control", "Permitted Purpose", "Affiliate", "Business Day", "Personal Data"]
+
+
+def synthetic_corpus(documents: int, seed: int = 7):
+    """Contracts with numbered clauses and defined terms, and queries that need exact terms."""
+    rng = random.Random(seed)
+    chunks, queries = [], []
+    for number in range(documents):
+        source = f"data/contract_{number:05d}.txt"
+        party = f"{rng.choice(PARTIES)} {number}"
+        for section in range(1, 6):
+            for clause in range(1, 4):
+                topic = rng.choice(TOPICS)
+                marker = f"{party} clause {section}.{clause} marker"
+                text = (
+                    f"Section {section}.{clause} ({topic}). {party} and the Counterparty agree that "
+                    f"{topic} shall be handled as set out in this clause. {marker}."
+                )
+                chunks.append(Document(page_content=text, metadata={"source": source}))
+                if rng.random() < 0.1:
+                    queries.append({"query": f"What does section {section}.{clause} of the {party} contract say?", "expected": marker})
+        term = rng.choice(TERMS)
+        definition = f'"{term}" means the {term.lower()} agreed with {party} under schedule {number}.'
+        chunks.append(Document(page_content=f"Definitions. {definition}", metadata={"source": source}))
+        queries.append({"query": f"How is {term} defined for {party}?", "expected": definition, "document": source})
+    return chunks, queries
+
+
+def load_queries(path: str):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(queries, ks):
+    """recall@k and latency per retrieval mode over the current vectorstore."""
+    report = {}
+    depth = max(ks)
+    for mode, search in SEARCH_FUNCTIONS.items():
+        found = {k: 0 for k in ks}
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            hits = search(query["query"], k=depth, document_source=query.get("document"))
+            latencies.append(time.perf_counter() - started)
+            texts = [doc.page_content for doc, _ in hits]
+            for k in ks:
+                if any(query["expected"] in text for text in texts[:k]):
+                    found[k] += 1
+        report[mode] = {
+            "recall": {k: found[k] / len(queries) for k in ks},
+            "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+            "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+        }
+    return report
+
+
+def lexical_scale(chunks: int, queries: int = 200, seed: int = 7):
+    """Build a BM25 index over ``chunks`` synthetic chunks and time queries against it."""
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(50000)] + [word for topic in TOPICS for word in topic.split()]
+
+    def text():
+        return " ".join(rng.choice(vocabulary) for _ in range(rng.randint(40, 160)))
+
+    started = time.perf_counter()
+    index = BM25Index()
+    batch = 10000
+    for start in range(0, chunks, batch):
+        index.add(text() for _ in range(min(batch, chunks - start)))
+    build_seconds = time.perf_counter() - started
+    latencies = []
+    for _ in range(queries):
+        query = f"section {rng.randint(1, 20)}.{rng.randint(1, 9)} {rng.choice(vocabulary)} {rng.choice(vocabulary)} {rng.choice(TOPICS)}"
+        started = time.perf_counter()
+        index.search(query, 20)
+        latencies.append(time.perf_counter() - started)
+    return {
+        "chunks": chunks,
+        "build_seconds": build_seconds,
+        "p50_ms": 1000 * float(np.percentile(latencies, 50)),
+        "p95_ms": 1000 * float(np.percentile(latencies, 95)),
+    }
+
+
+def print_report(report, ks):
+    header = "mode      " + "".join(f"recall@{k:<4}" for k in ks) + "   p50 ms   p95 ms"
+    print(header)
+    for mode, row in report.items():
+        recalls = "".join(f"{row['recall'][k]:<11.3f}" for k in ks)
+        print(f"{mode:<10}{recalls}{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report recall@k and latency of vector, BM25 and hybrid retrieval",
+        epilog=__doc__.split("Examples:")[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--queries", help="labeled query set (JSONL) to run against the current vectorstore")
+    parser.add_argument("--synthetic", type=int, default=100, help="documents in the synthetic corpus")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use a deterministic stub instead of the embedding model")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5, 10])
+    parser.add_argument("--lexical-scale", type=int, default=0, help="also time BM25 search over this many chunks")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.fake_embeddings:
+        import modules.embeddings as embeddings_module
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings_module._embeddings = DeterministicFakeEmbedding(size=384)
+
+    results = {}
+    if args.queries:
+        queries = load_queries(args.queries)
+        results["retrieval"] = evaluate(queries, args.k)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            vectorstore.VECTORSTORE_PATH = directory
+            chunks, queries = synthetic_corpus(args.synthetic)
+            print(f"Synthetic corpus: {len(chunks)} chunks, {len(queries)} labeled queries")
+            vectorstore.add_documents(chunks)
+            results["retrieval"] = evaluate(queries, args.k)
+            vectorstore.reset_vectorstore()
+    if args.lexical_scale:
+        results["lexical_scale"] = lexical_scale(args.lexical_scale)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results["retrieval"], args.k)
+        if "lexical_scale" in results:
+            scale = results["lexical_scale"]
+            print(
+                f"BM25 over {scale['chunks']} chunks: built in {scale['build_seconds']:.1f}s, "
+                f"p50 {scale['p50_ms']:.2f} ms, p95 {scale['p95_ms']:.2f} ms"
+            )
@@ -0,0 +1,114 @@
+"""
+Measure search throughput of the sharded store: the same synthetic corpus
+is loaded into 1, 2, ... shards (one node process each) and searched by
+concurrent clients through ShardRouter, so the QPS gain per shard (bounded
+by the number of cores) and the per-query fan-out overhead can be compared.
+
+Vectors are synthetic (see ann_benchmark.synthetic_vectors) and queries
+are passed as vectors, so no embedding model is loaded.
+
+Examples:
+  python benchmarks/shard_benchmark.py --vectors 200000 --shards 1 2 4
+  python benchmarks/shard_benchmark.py --clients 16 --deadline-ms 100 --json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain.schema import Document
+
+from modules import shards, vectorstore
+from benchmarks.ann_benchmark import synthetic_vectors
+
+
+def load_corpus(router: shards.ShardRouter, vectors: np.ndarray, chunks_per_document: int, batch: int = 20000):
+    for start in range(0, len(vectors), batch):
+        chunks = [
+            Document(page_content=f"chunk {i}", metadata={"source": f"data/doc-{i // chunks_per_document}.pdf"})
+            for i in range(start, min(start + batch, len(vectors)))
+        ]
+        router.add_embedded_documents(chunks, vectors[start:start + batch], schedule=False)
+    router.merge_segments()
+
+
+def run_clients(router: shards.ShardRouter, queries: np.ndarray, clients: int, k: int) -> dict:
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client(rows):
+        for row in rows:
+            started = time.perf_counter()
+            try:
+                router.batch_search(["q"], k=k, search_type="vector", vectors=queries[row:row + 1])
+            except shards.ShardError as e:
+                errors.append(str(e))
+                continue
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=client, args=(range(n, len(queries), clients),)) for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "qps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "failed": len(errors),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Search throughput of the sharded store by shard count",
+        epilog=__doc__.split("Examples:")[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8, help="concurrent query threads")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--chunks-per-document", type=int, default=50)
+    parser.add_argument("--deadline-ms", type=float, default=5000)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.vectors, args.dim)
+    rng = np.random.default_rng(11)
+    queries = vectors[rng.choice(len(vectors), args.queries)] + 0.05 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+    report = []
+    for count in args.shards:
+        with tempfile.TemporaryDirectory() as directory:
+            vectorstore.VECTORSTORE_PATH = directory
+            with shards.ShardNodes(count):
+                router = shards.ShardRouter(count, addresses=[], deadline_ms=args.deadline_ms)
+                started = time.perf_counter()
+                load_corpus(router, vectors, args.chunks_per_document)
+                row = {"shards": count, "load_seconds": time.perf_counter() - started}
+                router.batch_search(["warm-up"], k=args.k, search_type="vector", vectors=queries[:1])
+                row.update(run_clients(router, queries, args.clients, args.k))
+                report.append(row)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.vectors} vectors of dim {args.dim}, {args.clients} clients, k={args.k}, {os.cpu_count()} CPUs")
+        baseline = report[0]["qps"]
+        print(f"{'shards':<8}{'load s':>8}{'QPS':>10}{'speedup':>9}{'p50 ms':>9}{'p95 ms':>9}{'failed':>8}")
+        for row in report:
+            print(f"{row['shards']:<8}{row['load_seconds']:>8.1f}{row['qps']:>10.0f}{row['qps'] / baseline:>8.2f}x"
+                  f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['failed']:>8}")
@@ -0,0 +1,190 @@
+"""
+Compare the recursive (fixed window + overlap) and legal (clause-aligned)
+splitters: chunk count and size, redundant text stored, index size on disk,
+and retrieval hit rate.
+
+A query is a hit at k if a top-k chunk contains its expected sentence, and
+complete if that chunk also holds the whole clause the sentence belongs to,
+i.e. the clause was not cut in half. Without --data a synthetic corpus of
+contracts (articles, numbered clauses, sub-clauses, definitions) with its own
+labeled queries is generated; with --data only the size figures are reported.
+
+Examples:
+  python benchmarks/splitter_benchmark.py --fake-embeddings
+  python benchmarks/splitter_benchmark.py --documents 200 --legal-overlap 100
+  python benchmarks/splitter_benchmark.py --data data/ --json
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+
+import modules.vectorstore as vectorstore
+from modules.loader import load_document
+from modules.legal_splitter import LegalStructureSplitter
+from modules.retriever import SEARCH_FUNCTIONS
+from modules.splitter import SPLITTER_MODES, get_splitter
+from benchmarks.retrieval_eval import PARTIES, TOPICS, TERMS
+
+FILLER = [
+    "The obligations in this clause survive expiry of the Agreement",
+    "Each party shall act in good faith and with reasonable diligence",
+    "Any failure to comply shall be notified to the other party in writing",
+    "Nothing in this clause limits the rights of either party at law",
+    "The Supplier shall keep complete and accurate records for this purpose",
+    "Costs incurred under this clause are borne by the party incurring them",
+]
+
+
+def iter_contracts(documents: int, seed: int = 7):
+    """Yield (contract, its labeled queries) one document at a time, so large corpora need not fit in memory."""
+    rng = random.Random(seed)
+    for number in range(documents):
+        queries = []
+        party = f"{rng.choice(PARTIES)} {number}"
+        lines = [f"AGREEMENT BETWEEN {party.upper()} AND THE COUNTERPARTY", "This Agreement is dated today."]
+        lines += ["ARTICLE I", "DEFINITIONS"]
+        for term in rng.sample(TERMS, 4):
+            lines.append(f'"{term}" means the {term.lower()} agreed with {party} under this Agreement.')
+        for article in range(2, 6):
+            lines.append(f"ARTICLE {article}")
+            for section in range(1, rng.randint(3, 6)):
+                topic = rng.choice(TOPICS)
+                marker = f"{party} clause {article}.{section} marker on {topic}."
+                clause = [f"{article}.{section} {topic.title()}. {marker}"]
+                clause += [f"{rng.choice(FILLER)}." for _ in range(rng.randint(1, 8))]
+                if rng.random() < 0.3:
+                    clause += [f"({letter}) {rng.choice(FILLER).lower()};" for letter in "abc"[:rng.randint(2, 3)]]
+                lines += clause
+                if rng.random() < 0.25:
+                    queries.append({
+                        "query": f"What does clause {article}.{section} of the {party} agreement say about {topic}?",
+                        "expected": marker,
+                        "clause": "\n".join(clause),
+                    })
+        yield Document(page_content="\n".join(lines), metadata={"source": f"data/agreement_{number:05d}.txt"}), queries
+
+
+def synthetic_contracts(documents: int, seed: int = 7):
+    """Whole contract texts, and queries labeled with a sentence and the clause it belongs to."""
+    docs, queries = [], []
+    for doc, doc_queries in iter_contracts(documents, seed):
+        docs.append(doc)
+        queries.extend(doc_queries)
+    return docs, queries
+
+
+def load_corpus(path: str):
+    files = [path] if os.path.isfile(path) else sorted(
+        glob.glob(os.path.join(path, "*.pdf")) + glob.glob(os.path.join(path, "*.txt"))
+    )
+    docs = []
+    for file in files:
+        docs.extend(load_document(file))
+    return docs
+
+
+def _normalized(text: str) -> str:
+    return " ".join(text.split())
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def measure(mode: str, docs, queries, ks, legal_overlap: int):
+    started = time.perf_counter()
+    splitter = get_splitter(mode)
+    if mode == "legal" and legal_overlap:
+        splitter = LegalStructureSplitter(chunk_size=splitter.chunk_size, chunk_overlap=legal_overlap)
+    chunks = splitter.split_documents(docs)
+    split_seconds = time.perf_counter() - started
+    sizes = [len(chunk.page_content) for chunk in chunks]
+    row = {
+        "splitter": mode,
+        "chunks": len(chunks),
+        "mean_chars": sum(sizes) / len(sizes),
+        "max_chars": max(sizes),
+        "stored_ratio": sum(sizes) / sum(len(doc.page_content) for doc in docs),
+        "with_section": sum("section" in chunk.metadata for chunk in chunks) / len(chunks),
+        "split_seconds": split_seconds,
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        vectorstore.VECTORSTORE_PATH = directory
+        vectorstore.reset_vectorstore()
+        started = time.perf_counter()
+        vectorstore.add_documents(chunks)
+        vectorstore.merge_segments()
+        row["index_seconds"] = time.perf_counter() - started
+        row["index_mb"] = directory_size(directory) / 2 ** 20
+        if queries:
+            depth = max(ks)
+            for search_mode, search in SEARCH_FUNCTIONS.items():
+                hits = {k: 0 for k in ks}
+                complete = {k: 0 for k in ks}
+                for query in queries:
+                    texts = [_normalized(doc.page_content) for doc, _ in search(query["query"], k=depth)]
+                    clause = _normalized(query["clause"])
+                    for k in ks:
+                        matching = [text for text in texts[:k] if query["expected"] in text]
+                        hits[k] += bool(matching)
+                        complete[k] += any(clause in text for text in matching)
+                row[search_mode] = {
+                    "hit": {k: hits[k] / len(queries) for k in ks},
+                    "complete": {k: complete[k] / len(queries) for k in ks},
+                }
+        vectorstore.reset_vectorstore()
+    return row
+
+
+def print_report(report, ks):
+    print(f"{'splitter':<10}{'chunks':>8}{'mean ch':>9}{'max ch':>8}{'stored x':>10}{'section':>9}{'index MB':>10}{'index s':>9}")
+    for row in report:
+        print(f"{row['splitter']:<10}{row['chunks']:>8}{row['mean_chars']:>9.0f}{row['max_chars']:>8}{row['stored_ratio']:>10.2f}"
+              f"{row['with_section']:>9.0%}{row['index_mb']:>10.2f}{row['index_seconds']:>9.2f}")
+    for search_mode in SEARCH_FUNCTIONS:
+        if search_mode not in report[0]:
+            continue
+        print(f"\n{search_mode} retrieval: hit@k / complete clause@k")
+        for row in report:
+            cells = "  ".join(f"@{k} {row[search_mode]['hit'][k]:.3f}/{row[search_mode]['complete'][k]:.3f}" for k in ks)
+            print(f"  {row['splitter']:<10}{cells}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the recursive and legal-structure splitters",
+        epilog=__doc__.split("Examples:")[1],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--data", help="file or directory of documents to split instead of the synthetic corpus")
+    parser.add_argument("--documents", type=int, default=100, help="contracts in the synthetic corpus")
+    parser.add_argument("--legal-overlap", type=int, default=0, help="overlap for the legal splitter, in characters")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use a deterministic stub instead of the embedding model")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 3, 5])
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    if args.fake_embeddings:
+        import modules.embeddings as embeddings_module
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings_module._embeddings = DeterministicFakeEmbedding(size=384)
+
+    if args.data:
+        docs, queries = load_corpus(args.data), []
+    else:
+        docs, queries = synthetic_contracts(args.documents)
+    report = [measure(mode, docs, queries, args.k, args.legal_overlap) for mode in SPLITTER_MODES]
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{len(docs)} documents, {len(queries)} labeled queries")
+        print_report(report, args.k)
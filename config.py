@@ -12,3 +12,131 @@ EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 # Default to an available Gemini model (full model name expected by the SDK)
 LLM_MODEL = os.getenv("LLM_MODEL", "models/gemini-2.5-flash")
 VECTORSTORE_PATH = "vectorstore"
+# Embedding engine: "torch" (fp32), "int8" (dynamically quantized Linear
+# layers) or "onnx" (ONNX Runtime; needs onnxruntime and optimum). Non-fp32
+# backends are checked against fp32 on load and fall back to it when any
+# sample's cosine similarity is below EMBEDDING_PARITY_MIN_COSINE.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))  # texts per forward pass
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))  # intra-op threads, 0 = library default
+EMBEDDING_PARITY_CHECK = os.getenv("EMBEDDING_PARITY_CHECK", "true").lower() != "false"
+EMBEDDING_PARITY_MIN_COSINE = float(os.getenv("EMBEDDING_PARITY_MIN_COSINE", "0.99"))
+# Content-hash keyed cache of chunk embeddings, reused across ingests and uploads
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() != "false"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "vectorstore/embedding_cache")
+# Answer cache: repeated (or near-identical, by cosine similarity of the query
+# embedding) questions are answered without retrieval or an LLM call
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() != "false"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "vectorstore/answer_cache")
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))  # seconds
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+# Number of append-only segments to accumulate before merging them into the base index
+SEGMENT_MERGE_THRESHOLD = int(os.getenv("SEGMENT_MERGE_THRESHOLD", "8"))
+# Fraction of deleted (tombstoned) vectors that triggers a background compaction
+TOMBSTONE_COMPACTION_RATIO = float(os.getenv("TOMBSTONE_COMPACTION_RATIO", "0.1"))
+
+# Vector index backend: "flat" (exact), "ivfpq" (IVF lists + product
+# quantization) or "hnsw". Non-flat indexes are trained when segments are
+# merged, once enough vectors exist; until then the index stays flat.
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = about 4 * sqrt(vectors)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))  # lists scanned per query
+PQ_M = int(os.getenv("PQ_M", "48"))  # sub-quantizers (bytes per vector at 8 bits)
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# Memory-map the base index instead of reading it into RAM
+INDEX_MMAP = os.getenv("INDEX_MMAP", "false").lower() == "true"
+# Base snapshots: serving processes poll the manifest and hot-swap to a new
+# snapshot in the background; superseded snapshots are kept until every
+# reader has had time to move off them
+SNAPSHOT_POLL_INTERVAL = float(os.getenv("SNAPSHOT_POLL_INTERVAL", "2.0"))  # seconds
+SNAPSHOT_RETAIN = int(os.getenv("SNAPSHOT_RETAIN", "2"))  # newest snapshots never pruned
+SNAPSHOT_GRACE_SECONDS = float(os.getenv("SNAPSHOT_GRACE_SECONDS", "120"))
+
+# Retrieval: "hybrid" fuses BM25 and vector ranks (reciprocal rank fusion),
+# "vector" and "lexical" use one side only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # hits taken from each side before fusing
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Ingestion pipeline
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Chunks written to the index per segment during bulk ingestion
+INGEST_COMMIT_SIZE = int(os.getenv("INGEST_COMMIT_SIZE", "2048"))
+# Chunking: "recursive" cuts fixed CHUNK_SIZE windows with CHUNK_OVERLAP;
+# "legal" cuts at article/section/clause/definition boundaries, with optional overlap
+SPLITTER_MODE = os.getenv("SPLITTER_MODE", "recursive")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+LEGAL_CHUNK_OVERLAP = int(os.getenv("LEGAL_CHUNK_OVERLAP", "0"))
+# PDFs with at least PDF_PARALLEL_MIN_PAGES pages are extracted across
+# PDF_WORKERS processes, PDF_PAGE_BATCH pages per task
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+PDF_PAGE_BATCH = int(os.getenv("PDF_PAGE_BATCH", "16"))
+
+# Backend concurrency: CPU-bound work runs on a sized thread pool and LLM
+# calls are capped; requests beyond the queue limits are rejected (503/429)
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 1)))
+CPU_QUEUE_LIMIT = int(os.getenv("CPU_QUEUE_LIMIT", "32"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_QUEUE_LIMIT = int(os.getenv("LLM_QUEUE_LIMIT", "32"))
+# Tracing: finished spans are appended to this file as OTLP/JSON when set
+# (metrics are always served in-process at /metrics)
+TRACE_OTLP_FILE = os.getenv("TRACE_OTLP_FILE", "")
+# Batch queries (/query/batch): LLM calls one batch may have in flight, and
+# the most questions x documents it may ask
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+# Ingestion jobs: uploads are queued in a SQLite database and indexed by
+# INGEST_JOB_WORKERS worker processes (0 = run no workers in the backend);
+# failed jobs are retried with exponential backoff from JOB_RETRY_DELAY
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", "2"))
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "vectorstore/jobs.db")
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "5"))  # seconds
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))  # seconds an idle worker waits
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "300"))  # silence before a running job is reclaimed
+# Context assembly: CONTEXT_CANDIDATES chunks are retrieved, reranked by MMR
+# (relevance vs. redundancy, weighted by CONTEXT_MMR_LAMBDA), neighbouring
+# chunks of a document are merged without their overlap, and the result is
+# packed into CONTEXT_TOKEN_BUDGET prompt tokens (estimated at 4 characters
+# per token). A budget of 0 sends the top 3 chunks as-is.
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "12"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "700"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Sharding: with INDEX_SHARDS > 1 documents are spread over that many stores
+# under VECTORSTORE_PATH/shards by a hash of their source, each served by a
+# node process on a local socket (or by remote nodes at SHARD_ADDRESSES,
+# comma-separated host:port, one per shard). Searches fan out to every shard
+# and merge; shards that miss SHARD_DEADLINE_MS are left out of the result.
+# SHARD_AUTHKEY authenticates TCP nodes and has no default: nodes and the
+# backend refuse host:port addresses without it. Local nodes use a random
+# key generated in VECTORSTORE_PATH/shards unless it is set.
+INDEX_SHARDS = int(os.getenv("INDEX_SHARDS", "1"))
+SHARD_ADDRESSES = [address for address in os.getenv("SHARD_ADDRESSES", "").split(",") if address]
+SHARD_DEADLINE_MS = float(os.getenv("SHARD_DEADLINE_MS", "500"))
+SHARD_AUTHKEY = os.getenv("SHARD_AUTHKEY", "").encode() or None
+# Document catalog: what has been uploaded and indexed (name, hash, page and
+# chunk counts, vector positions, status), kept by ingestion in SQLite
+CATALOG_DB_PATH = os.getenv("CATALOG_DB_PATH", "vectorstore/catalog.db")
+# Defined terms: definitions declared in documents ('"Term" means ...') are
+# indexed at ingestion and "define X" questions answered from the index;
+# terms are matched by alias, then fuzzily at TERM_FUZZY_CUTOFF similarity
+TERMS_DB_PATH = os.getenv("TERMS_DB_PATH", "vectorstore/terms.db")
+TERM_FUZZY_CUTOFF = float(os.getenv("TERM_FUZZY_CUTOFF", "0.85"))
+# Document summaries: a summary tree per document (section summaries combined
+# about SUMMARY_FANOUT at a time up to one document summary) is built in the
+# background after ingestion by SUMMARY_WORKERS backend threads, with at most
+# SUMMARY_LLM_CONCURRENCY LLM calls per worker at once; "stub" replaces the
+# LLM with a deterministic local summarizer (tests, offline use)
+SUMMARY_BACKEND = os.getenv("SUMMARY_BACKEND", "llm")
+SUMMARIES_DB_PATH = os.getenv("SUMMARIES_DB_PATH", "vectorstore/summaries.db")
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "1"))
+SUMMARY_LLM_CONCURRENCY = int(os.getenv("SUMMARY_LLM_CONCURRENCY", "4"))
+SUMMARY_SECTION_CHUNKS = int(os.getenv("SUMMARY_SECTION_CHUNKS", "8"))  # about this many chunks per section
+SUMMARY_FANOUT = int(os.getenv("SUMMARY_FANOUT", "8"))
@@ -69,7 +69,9 @@ const ChatInterface = ({ documents }: ChatInterfaceProps) => {
       // Connect to your actual backend API
       const response = await axios.post('http://localhost:8001/query', {
         query: inputValue,
-        document_filter: selectedDocument || undefined
+        document_filter: selectedDocument || undefined,
+        // Defined terms and summaries are answered from indexes built at ingestion
+        query_type: queryType
       })
       
       const aiResponse: Message = {
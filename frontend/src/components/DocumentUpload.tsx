@@ -9,11 +9,24 @@ interface DocumentUploadProps {
 
 interface UploadedFile {
   file: File
-  status: 'uploading' | 'success' | 'error'
+  status: 'uploading' | 'processing' | 'success' | 'error'
   progress: number
+  stage?: string
+  jobId?: string
   error?: string
 }
 
+interface IngestJob {
+  id: string
+  status: 'queued' | 'running' | 'succeeded' | 'failed'
+  progress: number
+  stage?: string
+  error?: string
+}
+
+const API_URL = 'http://localhost:8001'
+const JOB_POLL_MS = 1000
+
 const DocumentUpload = ({ onDocumentUploaded }: DocumentUploadProps) => {
   const [uploadedFiles, setUploadedFiles] = useState<UploadedFile[]>([])
 
@@ -39,54 +52,61 @@ const DocumentUpload = ({ onDocumentUploaded }: DocumentUploadProps) => {
     multiple: true
   })
 
+  const updateFile = (file: File, changes: Partial<UploadedFile>) => {
+    setUploadedFiles(prev =>
+      prev.map(f => (f.file === file ? { ...f, ...changes } : f))
+    )
+  }
+
+  // Poll the ingestion job until the worker finishes indexing the file
+  const watchJob = async (file: File, jobId: string) => {
+    while (true) {
+      await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS))
+      let job: IngestJob
+      try {
+        job = (await axios.get<IngestJob>(`${API_URL}/jobs/${jobId}`)).data
+      } catch (error) {
+        console.error('Job status error:', error)
+        continue
+      }
+      if (job.status === 'succeeded') {
+        updateFile(file, { status: 'success', progress: 100, stage: undefined })
+        onDocumentUploaded(file.name)
+        return
+      }
+      if (job.status === 'failed') {
+        updateFile(file, { status: 'error', error: job.error || 'Processing failed' })
+        return
+      }
+      updateFile(file, { progress: Math.round(job.progress * 100), stage: job.stage })
+    }
+  }
+
   const handleUpload = async (files: File[]) => {
     for (const file of files) {
       try {
         const formData = new FormData()
         formData.append('file', file)
-        
-        // Simulate upload progress
-        const progressInterval = setInterval(() => {
-          setUploadedFiles(prev => 
-            prev.map(f => 
-              f.file === file 
-                ? { ...f, progress: Math.min(f.progress + 10, 90) }
-                : f
-            )
-          )
-        }, 200)
-
-        // Upload to backend API
-        const response = await axios.post('http://localhost:8001/upload', formData, {
+
+        // The backend answers once the file is saved; indexing runs as a job
+        const response = await axios.post(`${API_URL}/upload`, formData, {
           headers: {
             'Content-Type': 'multipart/form-data',
           },
+          onUploadProgress: event => {
+            if (event.total) {
+              updateFile(file, { progress: Math.round((event.loaded / event.total) * 100) })
+            }
+          },
         })
-        
-        clearInterval(progressInterval)
-        
-        setUploadedFiles(prev => 
-          prev.map(f => 
-            f.file === file 
-              ? { ...f, status: 'success', progress: 100 }
-              : f
-          )
-        )
-        
-        onDocumentUploaded(file.name)
-        
-        // Show success message
-        console.log('Upload successful:', response.data)
-        
+
+        const jobId: string = response.data.job_id
+        updateFile(file, { status: 'processing', progress: 0, stage: response.data.status, jobId })
+        watchJob(file, jobId)
+
       } catch (error) {
         console.error('Upload error:', error)
-        setUploadedFiles(prev => 
-          prev.map(f => 
-            f.file === file 
-              ? { ...f, status: 'error', error: 'Upload failed - check if backend is running' }
-              : f
-          )
-        )
+        updateFile(file, { status: 'error', error: 'Upload failed - check if backend is running' })
       }
     }
   }
@@ -172,6 +192,20 @@ const DocumentUpload = ({ onDocumentUploaded }: DocumentUploadProps) => {
                     <span className="text-sm font-medium text-slate-600 dark:text-slate-300">{uploadedFile.progress}%</span>
                   </div>
                 )}
+
+                {uploadedFile.status === 'processing' && (
+                  <div className="flex items-center space-x-3">
+                    <div className="w-24 bg-slate-200 dark:bg-slate-700 rounded-full h-2">
+                      <div
+                        className="bg-gradient-to-r from-indigo-600 to-violet-600 dark:from-indigo-500 dark:to-violet-500 h-2 rounded-full transition-all duration-300"
+                        style={{ width: `${uploadedFile.progress}%` }}
+                      />
+                    </div>
+                    <span className="text-sm font-medium text-slate-600 dark:text-slate-300">
+                      {uploadedFile.stage === 'queued' ? 'Queued' : `Processing ${uploadedFile.progress}%`}
+                    </span>
+                  </div>
+                )}
                 
                 {uploadedFile.status === 'success' && (
                   <div className="flex items-center space-x-2 text-green-600 dark:text-green-300 bg-green-50 dark:bg-green-500/10 px-3 py-2 rounded-xl">
@@ -1,90 +1,303 @@
-from modules.loader import load_document
-from modules.splitter import split_documents
+from modules.loader import iter_document, pdf_page_count
+from modules.splitter import iter_split
 from modules.embeddings import get_embeddings
-from langchain_community.vectorstores import FAISS
-from langchain.schema import Document
-from config import VECTORSTORE_PATH
+from modules.shards import ShardNodes, get_store, shard_for
+from modules.catalog import get_catalog
+from modules.summaries import get_summary_store
+from modules.terms import get_term_index
+from config import VECTORSTORE_PATH, INGEST_WORKERS, EMBED_BATCH_SIZE, INGEST_COMMIT_SIZE, INDEX_TYPE, INDEX_SHARDS, PDF_PARALLEL_MIN_PAGES
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+import argparse
+import time
 import sys
 import os
 import glob
 
-def ingest_file(file_path):
+SUPPORTED_EXTENSIONS = ['*.pdf', '*.txt']
+
+
+class IngestStats:
+    """Counters and per-stage timings for one ingestion run"""
+
+    def __init__(self, total_files):
+        self.total_files = total_files
+        self.files_done = 0
+        self.files_failed = 0
+        self.files_unchanged = 0
+        self.chunks = 0
+        self.pages = 0
+        self.slowest_page = (0.0, None, None)  # (seconds, file, page)
+        self.load_split_seconds = 0.0  # summed across worker processes
+        self.embed_seconds = 0.0
+        self.write_seconds = 0.0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def chunks_per_second(self):
+        return self.chunks / self.elapsed if self.elapsed > 0 else 0.0
+
+    def progress(self):
+        return (
+            f"[{self.files_done}/{self.total_files} files] {self.chunks} chunks embedded, "
+            f"{self.chunks_per_second:.1f} chunks/s"
+        )
+
+    def summary(self):
+        return "\n".join([
+            f"files: {self.files_done - self.files_failed - self.files_unchanged} ingested, "
+            f"{self.files_unchanged} unchanged, {self.files_failed} failed",
+            f"chunks: {self.chunks}",
+            f"elapsed: {self.elapsed:.2f}s ({self.chunks_per_second:.1f} chunks/s)",
+            f"pages: {self.pages} extracted, slowest {self.slowest_page[0]:.3f}s "
+            f"({self.slowest_page[1]} page {self.slowest_page[2]})",
+            f"load+split: {self.load_split_seconds:.2f}s (worker time)",
+            f"embed: {self.embed_seconds:.2f}s",
+            f"index write: {self.write_seconds:.2f}s",
+        ])
+
+    def record_pages(self, path, timings):
+        """Add per-page extraction timings, (page, seconds), for one file"""
+        self.pages += len(timings)
+        for page, seconds in timings:
+            if seconds > self.slowest_page[0]:
+                self.slowest_page = (seconds, path, page)
+
+
+class _IngestFile:
+    """
+    One file's chunks in flight. They may be embedded while the file is still
+    being read, but are committed only once it is fully read and known to be
+    new or changed (``keep``), so its old chunks are tombstoned first.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks = []
+        self.keep = None
+        self.embedded = 0
+
+
+def ingest_file(file_path, timings=None):
     """Ingest a single file and return its chunks"""
-    print(f"📄 Processing: {file_path}")
+    # Whole files already run one per worker process: no page pool inside them
+    return list(iter_split(iter_document(file_path, workers=1, timings=timings)))
+
+
+def _load_and_split(file_path):
+    """Worker entry point: returns (path, chunks, seconds, error, page timings)"""
+    started = time.perf_counter()
+    timings = []
     try:
-        docs = load_document(file_path)
-        chunks = split_documents(docs)
-        print(f"   ✅ Split into {len(chunks)} chunks")
-        return chunks
+        chunks = ingest_file(file_path, timings)
+        return file_path, chunks, time.perf_counter() - started, None, timings
     except Exception as e:
-        print(f"   ❌ Error processing {file_path}: {str(e)}")
-        return []
+        return file_path, [], time.perf_counter() - started, str(e), timings
 
-def ingest(file_path):
-    """Ingest documents from file path or directory"""
-    all_chunks = []
-    
+
+def _is_large_pdf(file_path):
+    try:
+        return file_path.endswith(".pdf") and pdf_page_count(file_path) >= PDF_PARALLEL_MIN_PAGES
+    except Exception:
+        return False  # unreadable: let the worker report the error
+
+
+def collect_files(file_path):
     if os.path.isfile(file_path):
-        # Single file
-        chunks = ingest_file(file_path)
-        all_chunks.extend(chunks)
-    elif os.path.isdir(file_path):
-        # Directory - process all supported files
-        supported_extensions = ['*.pdf', '*.txt']
-        for ext in supported_extensions:
-            files = glob.glob(os.path.join(file_path, ext))
-            for file in files:
-                chunks = ingest_file(file)
-                all_chunks.extend(chunks)
-    else:
-        print(f"❌ Error: {file_path} is not a valid file or directory")
-        return
-    
-    if not all_chunks:
-        print("❌ No documents were successfully processed")
+        return [file_path]
+    if os.path.isdir(file_path):
+        files = []
+        for ext in SUPPORTED_EXTENSIONS:
+            files.extend(sorted(glob.glob(os.path.join(file_path, ext))))
+        return files
+    return None
+
+
+def _parsed_files(files, workers):
+    """
+    Yield load_and_split results as they finish. Parsing runs in a process
+    pool with a bounded number of files in flight, so memory stays flat and
+    workers keep parsing while the caller embeds.
+    """
+    if workers <= 1 or len(files) <= 1:
+        for file in files:
+            yield _load_and_split(file)
         return
-    
-    print(f"\n🔍 Generating embeddings for {len(all_chunks)} chunks...")
-    try:
-        embeddings = get_embeddings()
-        
-        # Create or update vectorstore
-        if os.path.exists(VECTORSTORE_PATH):
-            print("📚 Loading existing vectorstore...")
-            try:
-                vectorstore = FAISS.load_local(VECTORSTORE_PATH, embeddings, allow_dangerous_deserialization=True)
-                vectorstore.add_documents(all_chunks)
-                print("   ✅ Updated existing vectorstore")
-            except Exception as e:
-                print(f"   ⚠️ Could not load existing vectorstore: {str(e)}")
-                print("   🔄 Creating new vectorstore...")
-                vectorstore = FAISS.from_documents(all_chunks, embeddings)
-        else:
-            print("📚 Creating new vectorstore...")
-            vectorstore = FAISS.from_documents(all_chunks, embeddings)
-            print("   ✅ Created new vectorstore")
-        
-        # Save the vectorstore
-        vectorstore.save_local(VECTORSTORE_PATH)
-        print(f"💾 Vectorstore saved to {VECTORSTORE_PATH}")
-        print(f"✅ Successfully processed {len(all_chunks)} document chunks")
-        
-    except Exception as e:
-        print(f"❌ Error creating vectorstore: {str(e)}")
+    # spawn: workers must not inherit the parent's torch thread pool
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = set()
+        remaining = iter(files)
+        for file in remaining:
+            pending.add(executor.submit(_load_and_split, file))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                next_file = next(remaining, None)
+                if next_file is not None:
+                    pending.add(executor.submit(_load_and_split, next_file))
+                yield future.result()
+
+
+def ingest(file_path, workers=INGEST_WORKERS, batch_size=EMBED_BATCH_SIZE, commit_size=INGEST_COMMIT_SIZE):
+    """
+    Ingest documents from file path or directory.
+
+    Files are parsed and split in parallel, chunks are embedded in batches of
+    ``batch_size`` as they arrive, and every ``commit_size`` chunks are written
+    to the index as one segment. Large PDFs are extracted across the page pool
+    instead and streamed, so embedding starts on their first pages. Returns the run's IngestStats, or None if the
+    path is invalid.
+    """
+    files = collect_files(file_path)
+    if files is None:
+        print(f"Error: {file_path} is not a valid file or directory")
+        return None
+
+    stats = IngestStats(len(files))
+    store = get_store()
+    embeddings = get_embeddings()
+    batch = []  # (chunk, file) waiting to be embedded
+    embedded = []  # (chunk, vector, file) waiting to be committed
+    searchable = []  # (source, chunks) of files indexed or already current, catalogued once merged
+    catalog = get_catalog()
+
+    def embed_batch():
+        batch[:] = [(chunk, file) for chunk, file in batch if file.keep is not False]
+        if batch:
+            started = time.perf_counter()
+            vectors = embeddings.embed_documents([chunk.page_content for chunk, _ in batch])
+            stats.embed_seconds += time.perf_counter() - started
+            stats.chunks += len(batch)
+            for (chunk, file), vector in zip(batch, vectors):
+                file.embedded += 1
+                embedded.append((chunk, vector, file))
+        batch.clear()
+
+    def commit(force=False):
+        ready = [entry for entry in embedded if entry[2].keep is not None]
+        if not ready or (not force and len(ready) < commit_size):
+            return
+        embedded[:] = [entry for entry in embedded if entry[2].keep is None]
+        kept = [(chunk, vector) for chunk, vector, file in ready if file.keep]
+        if kept:
+            started = time.perf_counter()
+            store.add_embedded_documents([chunk for chunk, _ in kept], [vector for _, vector in kept], schedule=False)
+            stats.write_seconds += time.perf_counter() - started
+
+    def enqueue(chunk, file):
+        batch.append((chunk, file))
+        if len(batch) >= batch_size:
+            embed_batch()
+            commit()
+
+    def finish(file, error):
+        """Decide whether a fully read file is indexed; its chunks become committable"""
+        stats.files_done += 1
+        file.keep = False
+        if error:
+            stats.files_failed += 1
+            print(f"Error processing {file.path}: {error}")
+            catalog.record_failed(file.path, str(error))
+        elif file.chunks:
+            source = file.chunks[0].metadata.get("source", file.path)
+            if store.is_document_current(source, file.chunks):
+                stats.files_unchanged += 1
+            else:
+                # Changed file: hide its old chunks; unchanged ones hit the embedding cache
+                store.delete_document(source)
+                file.keep = True
+            searchable.append((source, file.chunks))
+        if not file.keep:
+            stats.chunks -= file.embedded
+        print(stats.progress())
+
+    large = [path for path in files if workers > 1 and _is_large_pdf(path)]
+    small = [path for path in files if path not in large]
+    for path, chunks, seconds, error, timings in _parsed_files(small, workers):
+        stats.load_split_seconds += seconds
+        stats.record_pages(path, timings)
+        file = _IngestFile(path)
+        file.chunks = chunks
+        finish(file, error)
+        if file.keep:
+            for chunk in chunks:
+                enqueue(chunk, file)
+
+    # Large PDFs are extracted across the page pool and streamed: their first
+    # pages are split and embedded while later ones are still being parsed
+    for path in large:
+        file = _IngestFile(path)
+        timings = []
+        error = None
+        try:
+            for chunk in iter_split(iter_document(path, workers=workers, timings=timings)):
+                file.chunks.append(chunk)
+                enqueue(chunk, file)
+        except Exception as e:
+            error = str(e)
+        stats.load_split_seconds += sum(seconds for _, seconds in timings)
+        stats.record_pages(path, timings)
+        finish(file, error)
+
+    embed_batch()
+    commit(force=True)
+
+    if stats.chunks:
+        # Also trains the INDEX_TYPE index once there are enough vectors
+        started = time.perf_counter()
+        store.merge_segments()
+        stats.write_seconds += time.perf_counter() - started
+    elif not stats.files_unchanged:
+        print("No documents were successfully processed")
+    # Positions are final once merged; the catalog lists what is now searchable
+    terms = get_term_index()
+    summaries = get_summary_store()
+    for source, chunks in searchable:
+        catalog.record_indexed(
+            source, chunks, vector_ranges=store.document_ranges(source),
+            shard=shard_for(source, INDEX_SHARDS) if INDEX_SHARDS > 1 else None,
+        )
+        terms.index_document(source, chunks)
+        summaries.submit(source, chunks)  # built by the backend's summary worker, or `python -m modules.summaries`
+    return stats
+
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python ingest.py <path_to_file_or_directory>")
-        print("Examples:")
-        print("  python ingest.py data/contract.pdf")
-        print("  python ingest.py data/")
-        sys.exit(1)
-    
-    file_path = sys.argv[1]
-    print(f"🚀 Starting document ingestion from: {file_path}")
-    print("=" * 50)
-    
-    ingest(file_path)
-    
-    print("=" * 50)
-    print("🎉 Ingestion complete!")
+    parser = argparse.ArgumentParser(
+        description="Ingest documents into the vectorstore",
+        epilog="Examples:\n  python ingest.py data/contract.pdf\n  python ingest.py data/",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("path", help="file or directory to ingest")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="parser processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="chunks per embedding call")
+    parser.add_argument("--commit-size", type=int, default=INGEST_COMMIT_SIZE, help="chunks per index segment")
+    parser.add_argument("--rebuild-index", action="store_true", help=f"retrain the {INDEX_TYPE} index afterwards")
+    args = parser.parse_args()
+
+    print(f"Ingesting {args.path} into {VECTORSTORE_PATH} ({args.workers} workers, batch size {args.batch_size})")
+    # Sharded stores are written through their nodes; start any that are not already running
+    nodes = ShardNodes() if INDEX_SHARDS > 1 else None
+    if nodes is not None:
+        nodes.start()
+    try:
+        stats = ingest(args.path, workers=args.workers, batch_size=args.batch_size, commit_size=args.commit_size)
+        if stats is None:
+            sys.exit(1)
+        print(stats.summary())
+        if args.rebuild_index:
+            started = time.perf_counter()
+            if get_store().rebuild_index():
+                print(f"Rebuilt {INDEX_TYPE} index in {time.perf_counter() - started:.2f}s")
+            else:
+                print(f"Not enough vectors to train a {INDEX_TYPE} index yet")
+    finally:
+        if nodes is not None:
+            nodes.stop()
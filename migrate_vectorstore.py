@@ -0,0 +1,19 @@
+"""
+Convert a vectorstore saved by LangChain's FAISS.save_local (index.faiss +
+pickled index.pkl) to the native, pickle-free layout, in place.
+
+The pickle is loaded once here, so only migrate stores you wrote yourself.
+"""
+from modules.vectorstore import migrate_vectorstore
+from config import VECTORSTORE_PATH
+import argparse
+import time
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+    parser.add_argument("--keep-legacy", action="store_true", help="keep index.pkl as index.pkl.bak")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    chunks = migrate_vectorstore(keep_legacy=args.keep_legacy)
+    print(f"Migrated {chunks} chunks in {VECTORSTORE_PATH} in {time.perf_counter() - started:.1f}s")
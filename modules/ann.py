@@ -0,0 +1,157 @@
+"""
+FAISS index backends for the vectorstore: exact flat search, IVF with
+product quantization, and HNSW. Picks the index for INDEX_TYPE, trains it,
+builds per-query search parameters (nprobe / efSearch), and reads indexes
+memory-mapped when INDEX_MMAP is set.
+"""
+import math
+from typing import Optional, Sequence
+
+import faiss
+import numpy as np
+
+from config import (
+    INDEX_MMAP,
+    IVF_NLIST,
+    IVF_NPROBE,
+    PQ_M,
+    PQ_NBITS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_EF_SEARCH,
+)
+
+INDEX_TYPES = ("flat", "ivfpq", "hnsw")
+# Vectors used to train an IVF-PQ index, per coarse centroid and in total
+TRAINING_POINTS_PER_LIST = 39
+MAX_TRAINING_POINTS = 200000
+
+
+def index_type(index: faiss.Index) -> str:
+    """Backend name of a FAISS index ("flat", "ivfpq" or "hnsw")."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivfpq"
+    return "flat"
+
+
+def nlist_for(count: int) -> int:
+    """Number of IVF lists: IVF_NLIST if set, else about 4 * sqrt(count)."""
+    if IVF_NLIST:
+        return IVF_NLIST
+    return max(1, min(65536, int(4 * math.sqrt(count))))
+
+
+def pq_subquantizers(dim: int) -> int:
+    """Largest divisor of ``dim`` not above PQ_M (PQ needs dim % m == 0)."""
+    return max(m for m in range(1, min(PQ_M, dim) + 1) if dim % m == 0)
+
+
+def min_training_size(kind: str, count: int) -> int:
+    """Vectors needed before an index of this type is worth building."""
+    if kind == "ivfpq":
+        return max(TRAINING_POINTS_PER_LIST * nlist_for(count), 2 ** PQ_NBITS * TRAINING_POINTS_PER_LIST)
+    return 0
+
+
+def can_build(kind: str, count: int) -> bool:
+    return count >= min_training_size(kind, count)
+
+
+def create_index(kind: str, vectors: np.ndarray, seed: int = 1234) -> faiss.Index:
+    """
+    Build an empty, trained L2 index of type ``kind`` for vectors like
+    ``vectors`` (which are only used for training).
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {kind!r}; expected one of {INDEX_TYPES}")
+    dim = vectors.shape[1]
+    if kind == "flat":
+        return faiss.IndexFlatL2(dim)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+    nlist = nlist_for(len(vectors))
+    index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, pq_subquantizers(dim), PQ_NBITS)
+    sample = vectors
+    if len(vectors) > MAX_TRAINING_POINTS:
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), MAX_TRAINING_POINTS, replace=False)]
+    index.train(np.ascontiguousarray(sample, dtype=np.float32))
+    return index
+
+
+def writable_copy(index: faiss.Index) -> faiss.Index:
+    """
+    A copy of ``index`` that owns its memory. clone_index() would keep viewing
+    the file of a memory-mapped index, and resizing a view aborts the process.
+    """
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def empty_like(index: faiss.Index) -> faiss.Index:
+    """An empty index with the same type and training as ``index``."""
+    kind = index_type(index)
+    if kind == "flat":
+        return faiss.IndexFlatL2(index.d)
+    if kind == "hnsw":
+        # HNSW has no training; a fresh graph is cheaper than copy + reset
+        hnsw = faiss.downcast_index(index)
+        fresh = faiss.IndexHNSWFlat(index.d, hnsw.hnsw.nb_neighbors(1))
+        fresh.hnsw.efConstruction = hnsw.hnsw.efConstruction
+        return fresh
+    copy = writable_copy(index)
+    copy.reset()
+    return copy
+
+
+def reconstruct(index: faiss.Index, positions: Optional[Sequence[int]] = None) -> np.ndarray:
+    """
+    Stored vectors at ``positions`` (all if None). Exact for flat and HNSW,
+    decoded from the PQ codes for IVF-PQ.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.no():
+        ivf.make_direct_map()
+    if positions is None:
+        return index.reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), dtype=np.float32)
+    positions = np.asarray(positions, dtype=np.int64)
+    if not len(positions):
+        return np.empty((0, index.d), dtype=np.float32)
+    return index.reconstruct_batch(positions)
+
+
+def search_parameters(
+    index: faiss.Index,
+    selector=None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+):
+    """SearchParameters for ``index`` with an optional id selector and query-time knobs."""
+    kind = index_type(index)
+    if kind == "ivfpq":
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or IVF_NPROBE
+    elif kind == "hnsw":
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or HNSW_EF_SEARCH
+    elif selector is None:
+        return None
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+
+def read_index(path: str, mmap: bool = INDEX_MMAP) -> faiss.Index:
+    """
+    Read an index file. With ``mmap`` its vectors/codes stay on disk and are
+    paged in on demand; such an index is read-only.
+    """
+    if mmap:
+        return faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    return faiss.read_index(path)
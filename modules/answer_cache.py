@@ -0,0 +1,322 @@
+import base64
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain.schema import Document
+
+from modules.catalog import get_catalog
+from modules.embedding_cache import content_hash
+from modules.embeddings import get_embeddings
+from modules.telemetry import REGISTRY
+from modules.shards import get_store
+from modules.vectorstore import embed_queries
+from config import (
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_PATH,
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_SIMILARITY,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+LOG_FILE = "answers.jsonl"
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case, collapse whitespace and drop surrounding quotes/punctuation."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.strip(" \"'`?!.")
+
+
+def _encode_vector(vector: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+
+class AnswerCache:
+    """
+    Cache of generated answers keyed by (query, document filter, prompt
+    version, model).
+
+    A lookup first tries the exact normalized query, then the most similar
+    cached query embedding in the same (filter, prompt version, model)
+    bucket above ``threshold`` cosine similarity. Each entry records a
+    fingerprint of every document it cites, so an answer is dropped as soon
+    as one of them is re-uploaded with new content or deleted. Answers to
+    questions over all documents are also keyed by the catalog's version,
+    so indexing or removing any document starts a new bucket for them;
+    answers scoped to one document outlive unrelated changes until they
+    expire after ``ttl`` seconds.
+
+    Entries live in memory in LRU order and are persisted to an append-only
+    log (answers.jsonl) shared by every process, which is rewritten once it
+    holds twice ``max_entries`` records.
+    """
+
+    def __init__(
+        self,
+        path: str = ANSWER_CACHE_PATH,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl: float = ANSWER_CACHE_TTL,
+        threshold: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.directory = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._log_read = 0  # bytes of the log already applied
+        self._log_inode = None
+        self._log_records = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.latency_saved = 0.0
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _apply(self, record: dict):
+        if "put" in record:
+            entry = record["put"]
+            entry["vector"] = _decode_vector(entry["vector"])
+            self._entries[entry["key"]] = entry
+            self._entries.move_to_end(entry["key"])
+        else:
+            self._entries.pop(record["drop"], None)
+        self._log_records += 1
+
+    def _sync(self):
+        """Apply log records appended (or a log rewritten) by other processes."""
+        try:
+            stat = os.stat(self._file(LOG_FILE))
+        except FileNotFoundError:
+            return
+        if stat.st_ino != self._log_inode or stat.st_size < self._log_read:
+            self._entries.clear()
+            self._log_read = self._log_records = 0
+            self._log_inode = stat.st_ino
+        if stat.st_size <= self._log_read:
+            return
+        with open(self._file(LOG_FILE), "rb") as f:
+            f.seek(self._log_read)
+            data = f.read(stat.st_size - self._log_read)
+        complete = data[:data.rfind(b"\n") + 1]  # skip a line still being written
+        for line in complete.splitlines():
+            if line.strip():
+                self._apply(json.loads(line))
+        self._log_read += len(complete)
+
+    def _append(self, records: List[dict]):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._file(".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._sync()
+            with open(self._file(LOG_FILE), "ab") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records).encode("utf-8"))
+            self._sync()
+            if self._log_records > 2 * self.max_entries:
+                self._rewrite()
+
+    def _rewrite(self):
+        """Replace the log with one record per live entry. Caller holds the file lock."""
+        tmp = self._file(LOG_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self._entries.values():
+                f.write(json.dumps({"put": dict(entry, vector=_encode_vector(entry["vector"]))}) + "\n")
+        os.replace(tmp, self._file(LOG_FILE))
+        self._log_inode = None
+        self._sync()
+
+    def _is_valid(self, entry: dict) -> bool:
+        if time.time() - entry["created"] > self.ttl:
+            return False
+        return all(get_store().document_fingerprint(source) == fingerprint for source, fingerprint in entry["cited"].items())
+
+    def _valid_or_drop(self, entry: dict) -> bool:
+        if self._is_valid(entry):
+            return True
+        self.invalidations += 1
+        self._entries.pop(entry["key"], None)
+        self._append([{"drop": entry["key"]}])
+        return False
+
+    @staticmethod
+    def _bucket(document_source: Optional[str], prompt_version: str, model: str) -> str:
+        # Any document can change an answer over all documents, not only the ones it cites
+        corpus = get_catalog().version() if document_source is None else None
+        return content_hash(json.dumps([document_source, prompt_version, model, corpus]))
+
+    @staticmethod
+    def _embed(text: str) -> np.ndarray:
+        vector = np.asarray(get_embeddings().embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, queries: List[str]) -> Dict[str, np.ndarray]:
+        """Unit vectors for several queries, keyed by query, from one embedding call."""
+        normalized = {query: normalize_query(query) for query in queries}
+        texts = list(dict.fromkeys(normalized.values()))
+        if not texts:
+            return {}
+        matrix = embed_queries(texts)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        rows = dict(zip(texts, matrix / np.where(norms, norms, 1)))
+        return {query: rows[text] for query, text in normalized.items()}
+
+    def get(
+        self,
+        query: str,
+        document_source: Optional[str],
+        prompt_version: str,
+        model: str,
+        vector: Optional[np.ndarray] = None,
+    ) -> Optional[dict]:
+        """
+        Return the cached result for ``query`` ({"result", "source_documents",
+        "cached"} where "cached" is "exact" or "semantic"), or None on a miss.
+        ``vector`` is the query's unit vector if the caller already has it
+        (see embed_many); otherwise it is embedded when a semantic match is tried.
+        """
+        normalized = normalize_query(query)
+        bucket = self._bucket(document_source, prompt_version, model)
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(content_hash(bucket + "\0" + normalized))
+            if entry is not None and self._valid_or_drop(entry):
+                self.exact_hits += 1
+                return self._hit(entry, "exact")
+
+            candidates = [entry for entry in self._entries.values() if entry["bucket"] == bucket]
+            if candidates:
+                if vector is None:
+                    vector = self._embed(normalized)
+                scores = np.stack([entry["vector"] for entry in candidates]) @ vector
+                for position in np.argsort(-scores):
+                    if scores[position] < self.threshold:
+                        break
+                    if self._valid_or_drop(candidates[position]):
+                        self.semantic_hits += 1
+                        return self._hit(candidates[position], "semantic")
+            self.misses += 1
+            return None
+
+    def _hit(self, entry: dict, match: str) -> dict:
+        self._entries.move_to_end(entry["key"])
+        self.latency_saved += entry["latency"]
+        return {
+            "result": entry["answer"],
+            "source_documents": [Document(**doc) for doc in entry["sources"]],
+            "cached": match,
+        }
+
+    def put(
+        self,
+        query: str,
+        document_source: Optional[str],
+        prompt_version: str,
+        model: str,
+        answer: str,
+        source_documents: List[Document],
+        latency: float,
+        vector: Optional[np.ndarray] = None,
+    ):
+        """Store an answer along with the fingerprints of the documents it cites."""
+        normalized = normalize_query(query)
+        bucket = self._bucket(document_source, prompt_version, model)
+        cited = {doc.metadata.get("source") for doc in source_documents if doc.metadata.get("source")}
+        if document_source:
+            cited.add(document_source)
+        entry = {
+            "key": content_hash(bucket + "\0" + normalized),
+            "bucket": bucket,
+            "query": normalized,
+            "vector": self._embed(normalized) if vector is None else vector,
+            "answer": answer,
+            "sources": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in source_documents],
+            "cited": {source: get_store().document_fingerprint(source) for source in sorted(cited)},
+            "created": time.time(),
+            "latency": latency,
+        }
+        with self._lock:
+            records = [{"put": dict(entry, vector=_encode_vector(entry["vector"]))}]
+            self._entries[entry["key"]] = entry
+            self._entries.move_to_end(entry["key"])
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                records.append({"drop": evicted})
+            self._append(records)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._sync()
+            return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if os.path.exists(self._file(LOG_FILE)):
+                os.remove(self._file(LOG_FILE))
+            self._log_read = self._log_records = 0
+            self._log_inode = None
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+        }
+
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Process-wide answer cache, or None when ANSWER_CACHE_ENABLED is off."""
+    global _answer_cache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = AnswerCache()
+    return _answer_cache
+
+
+def _answer_cache_collector():
+    if _answer_cache is None:
+        return
+    stats = _answer_cache.stats()
+    yield "legalview_answer_cache_lookups_total", "counter", "Answer cache lookups by outcome", [
+        ({"result": "exact"}, stats["exact_hits"]),
+        ({"result": "semantic"}, stats["semantic_hits"]),
+        ({"result": "miss"}, stats["misses"]),
+    ]
+    yield "legalview_answer_cache_hit_ratio", "gauge", "Share of answer cache lookups served from the cache", [({}, stats["hit_rate"])]
+    yield "legalview_answer_cache_entries", "gauge", "Answers held in the cache", [({}, stats["entries"])]
+    yield "legalview_answer_cache_saved_seconds_total", "counter", "LLM latency avoided by cache hits", [({}, stats["latency_saved_seconds"])]
+
+
+REGISTRY.add_collector(_answer_cache_collector)
@@ -0,0 +1,215 @@
+"""
+BM25 inverted index over the same chunks (and the same positions) as the
+FAISS index, so tombstones and per-document id selectors apply to both.
+
+A saved index is four files: the vocabulary (term -> slice of the postings),
+the concatenated posting ids and term frequencies, and the chunk lengths.
+The posting arrays are memory-mapped on load; chunks added afterwards go to
+small in-memory postings until the next save folds them in.
+"""
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+VOCAB_FILE = "bm25_vocab.json"
+POSTINGS_FILE = "bm25_postings.npy"
+FREQS_FILE = "bm25_freqs.npy"
+LENGTHS_FILE = "bm25_lengths.npy"
+FILES = (VOCAB_FILE, POSTINGS_FILE, FREQS_FILE, LENGTHS_FILE)
+
+# Keeps clause numbers ("4.2", "12(b)" -> "12", "b") and hyphenated terms whole
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or shall that the their "
+    "this to was were which will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class _GrowableArray:
+    """Append-only numpy buffer with amortized O(1) extends."""
+
+    def __init__(self, dtype, capacity: int = 4):
+        self._data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        needed = self.size + len(values)
+        if needed > len(self._data):
+            grown = np.empty(max(needed, 2 * len(self._data)), dtype=self._data.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:needed] = values
+        self.size = needed
+
+    def view(self) -> np.ndarray:
+        return self._data[:self.size]
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._vocab = {}  # term -> (start, count) in the saved posting arrays
+        self._postings = np.empty(0, dtype=np.int32)
+        self._freqs = np.empty(0, dtype=np.uint16)
+        self._added = {}  # term -> (_GrowableArray ids, _GrowableArray freqs)
+        self._lengths = _GrowableArray(np.uint32)
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return self._lengths.size
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "BM25Index":
+        index = cls()
+        index.add(texts)
+        return index
+
+    def add(self, texts: Iterable[str]):
+        """Index chunks at the next positions, in order."""
+        lengths = []
+        batch = {}  # term -> ([positions], [frequencies]), appended once per call
+        for position, text in enumerate(texts, len(self)):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, freq in Counter(tokens).items():
+                ids, freqs = batch.setdefault(term, ([], []))
+                ids.append(position)
+                freqs.append(min(freq, 65535))
+        for term, (ids, freqs) in batch.items():
+            if term not in self._added:
+                self._added[term] = (_GrowableArray(np.int32), _GrowableArray(np.uint16))
+            self._added[term][0].extend(ids)
+            self._added[term][1].extend(freqs)
+        self._lengths.extend(lengths)
+        self._total_length += sum(lengths)
+
+    def _term_postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        parts_ids, parts_freqs = [], []
+        if term in self._vocab:
+            start, count = self._vocab[term]
+            parts_ids.append(self._postings[start:start + count])
+            parts_freqs.append(self._freqs[start:start + count])
+        if term in self._added:
+            ids, freqs = self._added[term]
+            parts_ids.append(ids.view())
+            parts_freqs.append(freqs.view())
+        if not parts_ids:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint16)
+        if len(parts_ids) == 1:
+            return parts_ids[0], parts_freqs[0]
+        return np.concatenate(parts_ids), np.concatenate(parts_freqs)
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        allowed: Optional[np.ndarray] = None,
+        excluded: Optional[np.ndarray] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Top ``k`` (position, score) pairs for ``query``. ``allowed`` restricts
+        the search to the given positions; ``excluded`` hides positions
+        (both sorted int arrays).
+        """
+        count = len(self)
+        if count == 0 or k <= 0:
+            return []
+        average_length = self._total_length / count or 1.0
+        lengths = self._lengths.view()
+        all_ids, all_scores = [], []
+        for term in set(tokenize(query)):
+            ids, freqs = self._term_postings(term)
+            if not len(ids):
+                continue
+            idf = math.log(1 + (count - len(ids) + 0.5) / (len(ids) + 0.5))
+            freqs = freqs.astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * lengths[ids] / average_length)
+            all_ids.append(ids)
+            all_scores.append(idf * freqs * (self.k1 + 1) / (freqs + norm))
+        if not all_ids:
+            return []
+        ids = np.concatenate(all_ids)
+        scores = np.concatenate(all_scores)
+        if allowed is not None:
+            keep = np.isin(ids, allowed)
+            ids, scores = ids[keep], scores[keep]
+        if excluded is not None and len(excluded):
+            keep = ~np.isin(ids, excluded)
+            ids, scores = ids[keep], scores[keep]
+        if not len(ids):
+            return []
+        totals = np.bincount(ids, weights=scores)
+        candidates = np.flatnonzero(totals)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-totals[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-totals[candidates], kind="stable")]
+        return [(int(position), float(totals[position])) for position in candidates]
+
+    def compact(self, removed: Iterable[int]) -> "BM25Index":
+        """Drop ``removed`` positions and renumber the rest, as FAISS does on compaction."""
+        removed = np.fromiter(removed, dtype=np.int64)
+        keep = np.ones(len(self), dtype=bool)
+        keep[removed] = False
+        new_positions = np.cumsum(keep, dtype=np.int64) - 1
+        index = BM25Index(self.k1, self.b)
+        vocab, postings, freqs = {}, [], []
+        offset = 0
+        for term in sorted(set(self._vocab) | set(self._added)):
+            ids, term_freqs = self._term_postings(term)
+            mask = keep[ids]
+            if not mask.any():
+                continue
+            postings.append(new_positions[ids[mask]].astype(np.int32))
+            freqs.append(term_freqs[mask])
+            vocab[term] = (offset, len(postings[-1]))
+            offset += len(postings[-1])
+        index._vocab = vocab
+        if postings:
+            index._postings = np.concatenate(postings)
+            index._freqs = np.concatenate(freqs)
+        lengths = self._lengths.view()[keep]
+        index._lengths.extend(lengths)
+        index._total_length = int(lengths.sum())
+        return index
+
+    def save(self, directory: str):
+        vocab, postings, freqs = {}, [], []
+        offset = 0
+        for term in sorted(set(self._vocab) | set(self._added)):
+            ids, term_freqs = self._term_postings(term)
+            postings.append(ids)
+            freqs.append(term_freqs)
+            vocab[term] = [offset, len(ids)]
+            offset += len(ids)
+        empty = np.empty(0)
+        np.save(os.path.join(directory, POSTINGS_FILE), np.concatenate(postings or [empty]).astype(np.int32))
+        np.save(os.path.join(directory, FREQS_FILE), np.concatenate(freqs or [empty]).astype(np.uint16))
+        np.save(os.path.join(directory, LENGTHS_FILE), self._lengths.view())
+        with open(os.path.join(directory, VOCAB_FILE), "w") as f:
+            json.dump(vocab, f)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["BM25Index"]:
+        """Load a saved index with its postings memory-mapped, or None if there is none."""
+        if not all(os.path.exists(os.path.join(directory, name)) for name in FILES):
+            return None
+        index = cls()
+        with open(os.path.join(directory, VOCAB_FILE)) as f:
+            index._vocab = {term: tuple(span) for term, span in json.load(f).items()}
+        index._postings = np.load(os.path.join(directory, POSTINGS_FILE), mmap_mode="r")
+        index._freqs = np.load(os.path.join(directory, FREQS_FILE), mmap_mode="r")
+        lengths = np.load(os.path.join(directory, LENGTHS_FILE))
+        index._lengths.extend(lengths)
+        index._total_length = int(lengths.sum())
+        return index
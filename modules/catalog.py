@@ -0,0 +1,267 @@
+"""
+Persistent document catalog.
+
+One row per uploaded document in a SQLite database: its name, the source
+path its chunks are stored under, a hash of the file, page and chunk
+counts, the positions of its vectors in the index (in its shard when the
+store is sharded), when it was ingested and its status. Uploads add a
+``queued`` row and ingestion moves it to ``indexed`` or ``failed``, so the
+catalog lists exactly what can be searched without scanning data/ or
+statting files. Names are looked up through an index, exactly or by prefix.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from langchain.schema import Document
+
+from modules import vectorstore
+from modules.sqlite import SQLiteStore
+from modules.telemetry import REGISTRY
+from config import CATALOG_DB_PATH
+
+QUEUED, INDEXING, INDEXED, FAILED = "queued", "indexing", "indexed", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    source TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    display_name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER,
+    content_hash TEXT,
+    pages INTEGER,
+    chunks INTEGER,
+    vector_ranges TEXT,
+    shard INTEGER,
+    status TEXT NOT NULL,
+    error TEXT,
+    uploaded_at REAL NOT NULL,
+    ingested_at REAL
+);
+CREATE INDEX IF NOT EXISTS documents_name ON documents (name_key);
+CREATE INDEX IF NOT EXISTS documents_status ON documents (status, name_key);
+"""
+
+LOOKUPS = REGISTRY.counter("legalview_catalog_lookups_total", "Document filter lookups by outcome", ["result"])
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file's bytes, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _name_key(name: str) -> str:
+    return name.strip().lower()
+
+
+def _prefix_bound(prefix: str) -> str:
+    """The smallest string greater than every string starting with ``prefix``."""
+    return prefix + "\U0010ffff"
+
+
+class DocumentCatalog(SQLiteStore):
+    """The documents table, shared by the backend, the ingestion workers and ingest.py."""
+
+    def __init__(self, path: str = CATALOG_DB_PATH):
+        super().__init__(path, _SCHEMA)
+
+    @staticmethod
+    def _row(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        document = dict(row)
+        document.pop("name_key")
+        document["vector_ranges"] = json.loads(document["vector_ranges"]) if document["vector_ranges"] else []
+        return document
+
+    def record_upload(self, source: str, size: Optional[int] = None, status: str = QUEUED):
+        """Add or reset a document that is waiting to be indexed."""
+        path = Path(source)
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO documents (source, name, name_key, display_name, type, size, status, uploaded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(source) DO UPDATE SET size = excluded.size, status = excluded.status, "
+                "error = NULL, uploaded_at = excluded.uploaded_at",
+                (source, path.name, _name_key(path.name), path.stem, path.suffix, size, status, now),
+            )
+
+    def record_failed(self, source: str, error: str):
+        """Mark ``source`` as failed to index, adding its row if needed."""
+        if self.get_by_source(source) is None:
+            self.record_upload(source, os.path.getsize(source) if os.path.exists(source) else None, FAILED)
+        self.set_status(source, FAILED, error)
+
+    def set_status(self, source: str, status: str, error: Optional[str] = None):
+        with self._transaction() as db:
+            db.execute("UPDATE documents SET status = ?, error = ? WHERE source = ?", (status, error, source))
+
+    def record_indexed(self, source: str, chunks: Iterable[Document] = (), content_hash: Optional[str] = None,
+                       vector_ranges: Optional[List[List[int]]] = None, shard: Optional[int] = None):
+        """
+        Mark ``source`` as searchable, with the counts derived from its chunks
+        and the positions its vectors were written to. Adds the row if the
+        document was ingested without an upload (ingest.py).
+        """
+        chunks = list(chunks)
+        pages = {chunk.metadata.get("page") for chunk in chunks if chunk.metadata.get("page") is not None}
+        total = max((chunk.metadata.get("total_pages") or 0 for chunk in chunks), default=0)
+        size = os.path.getsize(source) if os.path.exists(source) else None
+        if content_hash is None and size is not None:
+            content_hash = file_hash(source)
+        if self.get_by_source(source) is None:
+            self.record_upload(source, size, INDEXING)
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE documents SET status = ?, error = NULL, size = COALESCE(?, size), content_hash = ?, "
+                "pages = ?, chunks = ?, vector_ranges = ?, shard = ?, ingested_at = ? WHERE source = ?",
+                (INDEXED, size, content_hash, total or len(pages) or (1 if chunks else 0), len(chunks),
+                 json.dumps(vector_ranges or []), shard, time.time(), source),
+            )
+
+    def update_ranges(self, source_ranges: Dict[str, List[List[int]]]):
+        with self._transaction() as db:
+            db.executemany(
+                "UPDATE documents SET vector_ranges = ? WHERE source = ?",
+                [(json.dumps(ranges), source) for source, ranges in source_ranges.items()],
+            )
+
+    def remove(self, source: str) -> bool:
+        with self._transaction() as db:
+            return db.execute("DELETE FROM documents WHERE source = ?", (source,)).rowcount > 0
+
+    def get_by_source(self, source: str) -> Optional[Dict[str, Any]]:
+        return self._row(self._connection().execute("SELECT * FROM documents WHERE source = ?", (source,)).fetchone())
+
+    def get(self, name: str, status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """The document with this file name (case-insensitive), or None."""
+        query = "SELECT * FROM documents WHERE name_key = ?"
+        params: List[Any] = [_name_key(name)]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        return self._row(self._connection().execute(query + " ORDER BY source LIMIT 1", params).fetchone())
+
+    def find_prefix(self, prefix: str, limit: int = 20, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Documents whose file name starts with ``prefix`` (case-insensitive), by name."""
+        key = _name_key(prefix)
+        query = "SELECT * FROM documents WHERE name_key >= ? AND name_key < ?"
+        params: List[Any] = [key, _prefix_bound(key)]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        rows = self._connection().execute(query + " ORDER BY name_key LIMIT ?", (*params, limit))
+        return [self._row(row) for row in rows]
+
+    def list(self, status: Optional[str] = None, limit: int = 10000) -> List[Dict[str, Any]]:
+        if status:
+            rows = self._connection().execute(
+                "SELECT * FROM documents WHERE status = ? ORDER BY name_key LIMIT ?", (status, limit)
+            )
+        else:
+            rows = self._connection().execute("SELECT * FROM documents ORDER BY name_key LIMIT ?", (limit,))
+        return [self._row(row) for row in rows]
+
+    def lookup(self, filter_value: Optional[str], status: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        The document a user's document filter names, among those with
+        ``status`` if given: an exact file name, an exact name without the
+        extension, or else the first name starting with it. None for no
+        match, and for filters that mean all documents.
+        """
+        if not filter_value:
+            return None
+        candidate = filter_value.strip()
+        if not candidate or candidate.lower() in {"all documents", "all"}:
+            return None
+        name = Path(candidate).name
+        # "lease" is both the stem of "lease.pdf" and a prefix of "lease-2024.pdf"; the stem wins
+        document = self.get(name, status)
+        if document is None:
+            matches = self.find_prefix(name + ".", limit=1, status=status) or self.find_prefix(name, limit=1, status=status)
+            document = matches[0] if matches else None
+        return document
+
+    def resolve(self, filter_value: Optional[str], status: Optional[str] = INDEXED) -> Optional[str]:
+        """
+        Map a user's document filter to the source its chunks are stored
+        under (see lookup). Only searchable (indexed) documents match by
+        default, so a filter never selects a document that is still queued
+        or failed. None means no such document, or search everything.
+        """
+        document = self.lookup(filter_value, status)
+        if filter_value:
+            LOOKUPS.inc(result="hit" if document else "miss")
+        return document["source"] if document else None
+
+    def backfill(self, store) -> int:
+        """
+        Add rows for documents that are in the index but not in the catalog
+        (stores ingested before the catalog existed). Returns how many were added.
+        """
+        known = {row["source"] for row in self._connection().execute("SELECT source FROM documents")}
+        added = 0
+        for source in store.list_sources():
+            if source in known:
+                continue
+            self.record_indexed(source, vector_ranges=store.document_ranges(source))
+            added += 1
+        return added
+
+    def version(self) -> str:
+        """Changes whenever a document becomes searchable or is removed."""
+        count, latest = self._connection().execute(
+            "SELECT COUNT(*), MAX(ingested_at) FROM documents WHERE status = ?", (INDEXED,)
+        ).fetchone()
+        return f"{count}:{latest or 0}"
+
+    def stats(self) -> Dict[str, int]:
+        counts = {status: 0 for status in (QUEUED, INDEXING, INDEXED, FAILED)}
+        counts.update(dict(self._connection().execute("SELECT status, COUNT(*) FROM documents GROUP BY status").fetchall()))
+        return counts
+
+
+_catalog: Optional[DocumentCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> DocumentCatalog:
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = DocumentCatalog()
+    return _catalog
+
+
+def _refresh_ranges(source_ids: Dict[str, List[int]]):
+    """Merge listener: compaction renumbered the vectors, so store the new positions."""
+    if _catalog is None and not os.path.exists(CATALOG_DB_PATH):
+        return  # nothing catalogued by this deployment
+    get_catalog().update_ranges({source: vectorstore.position_ranges(ids) for source, ids in source_ids.items()})
+
+
+vectorstore.add_merge_listener(_refresh_ranges)
+
+
+def _catalog_collector():
+    if _catalog is None:
+        return
+    yield "legalview_catalog_documents", "gauge", "Documents in the catalog by status", [
+        ({"status": status}, count) for status, count in _catalog.stats().items()
+    ]
+
+
+REGISTRY.add_collector(_catalog_collector)
@@ -0,0 +1,214 @@
+"""
+Pickle-free storage for chunk texts and metadata, addressed by vector
+position.
+
+Texts are concatenated UTF-8 in chunks.bin with an int64 offsets array
+(chunks.offsets.npy, n + 1 entries); both are memory-mapped, so opening a
+store costs the same at any size and a text is read only when its chunk is
+returned. Metadata is columnar: one dictionary-encoded column per key
+(meta.<i>.codes.npy, memory-mapped, -1 where the key is absent, plus the
+distinct values in meta.<i>.values.json, parsed on first use, or in a
+memory-mapped meta.<i>.values.npy for integer columns such as offsets, which
+have a value per chunk), listed in meta.columns.json.
+
+Every file is opened when the store is, so a store that is replaced on disk
+keeps serving the files it was opened with.
+"""
+import json
+import mmap
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+TEXTS_FILE = "chunks.bin"
+OFFSETS_FILE = "chunks.offsets.npy"
+COLUMNS_FILE = "meta.columns.json"
+
+
+def _codes_file(column: int) -> str:
+    return f"meta.{column}.codes.npy"
+
+
+def _values_file(column: int, integer: bool = False) -> str:
+    return f"meta.{column}.values.{'npy' if integer else 'json'}"
+
+
+def _is_integer_column(values: list) -> bool:
+    return bool(values) and all(type(value) is int and -2 ** 63 <= value < 2 ** 63 for value in values)
+
+
+def store_files(directory: str) -> List[str]:
+    """Names of the files making up the store saved in ``directory``."""
+    with open(os.path.join(directory, COLUMNS_FILE)) as f:
+        columns = json.load(f)
+    names = [TEXTS_FILE, OFFSETS_FILE, COLUMNS_FILE]
+    for column in range(len(columns)):
+        integer = os.path.exists(os.path.join(directory, _values_file(column, integer=True)))
+        names += [_codes_file(column), _values_file(column, integer)]
+    return names
+
+
+def exists(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, COLUMNS_FILE))
+
+
+class ChunkStore:
+    """
+    Chunk texts and metadata by position: a saved, memory-mapped part
+    followed by rows appended in memory since it was opened.
+    """
+
+    def __init__(self):
+        self._texts = None  # mmap of chunks.bin
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._columns: List[str] = []
+        self._codes: List[np.ndarray] = []
+        self._value_files: list = []  # open files, parsed into _values on first use
+        self._values: Dict[int, list] = {}
+        self._rows: Optional[np.ndarray] = None  # saved row of each position, after select()
+        self._added_texts: List[str] = []
+        self._added_metadatas: List[dict] = []
+
+    @classmethod
+    def open(cls, directory: str) -> "ChunkStore":
+        store = cls()
+        store._offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        if store._offsets[-1] > 0:
+            with open(os.path.join(directory, TEXTS_FILE), "rb") as f:
+                store._texts = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(os.path.join(directory, COLUMNS_FILE)) as f:
+            store._columns = json.load(f)
+        for column in range(len(store._columns)):
+            store._codes.append(np.load(os.path.join(directory, _codes_file(column)), mmap_mode="r"))
+            integer_path = os.path.join(directory, _values_file(column, integer=True))
+            if os.path.exists(integer_path):
+                store._values[column] = np.load(integer_path, mmap_mode="r")
+                store._value_files.append(None)
+            else:
+                store._value_files.append(open(os.path.join(directory, _values_file(column))))
+        return store
+
+    @property
+    def saved_count(self) -> int:
+        return len(self._rows) if self._rows is not None else len(self._offsets) - 1
+
+    def _row(self, position: int) -> int:
+        return int(self._rows[position]) if self._rows is not None else position
+
+    def __len__(self) -> int:
+        return self.saved_count + len(self._added_texts)
+
+    def _column_values(self, column: int) -> list:
+        if column not in self._values:
+            with self._value_files[column] as f:
+                self._values[column] = json.load(f)
+        return self._values[column]
+
+    def text(self, position: int) -> str:
+        if position >= self.saved_count:
+            return self._added_texts[position - self.saved_count]
+        row = self._row(position)
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return self._texts[start:end].decode("utf-8") if end > start else ""
+
+    def metadata(self, position: int) -> dict:
+        if position >= self.saved_count:
+            return dict(self._added_metadatas[position - self.saved_count])
+        row = self._row(position)
+        metadata = {}
+        for column, name in enumerate(self._columns):
+            code = int(self._codes[column][row])
+            if code >= 0:
+                metadata[name] = self._column_values(column)[code]
+                if isinstance(metadata[name], np.integer):
+                    metadata[name] = int(metadata[name])
+        return metadata
+
+    def document(self, position: int) -> Document:
+        # The id is the chunk's position, so its vector can be read back from the index
+        return Document(id=str(position), page_content=self.text(position), metadata=self.metadata(position))
+
+    def column(self, name: str) -> Tuple[np.ndarray, list]:
+        """
+        Dictionary-encoded values of one metadata key for every position:
+        (codes, values), with code -1 where the key is absent.
+        """
+        values = self._column_values(self._columns.index(name)) if name in self._columns else []
+        values = [int(value) for value in values] if isinstance(values, np.ndarray) else list(values)
+        codes = np.full(len(self), -1, dtype=np.int32)
+        if name in self._columns:
+            saved = self._codes[self._columns.index(name)]
+            codes[:self.saved_count] = saved[self._rows] if self._rows is not None else saved
+        lookup = {json.dumps(value, sort_keys=True): code for code, value in enumerate(values)}
+        for row, metadata in enumerate(self._added_metadatas, self.saved_count):
+            if name in metadata:
+                key = json.dumps(metadata[name], sort_keys=True)
+                if key not in lookup:
+                    lookup[key] = len(values)
+                    values.append(metadata[name])
+                codes[row] = lookup[key]
+        return codes, values
+
+    def append(self, texts: Sequence[str], metadatas: Sequence[dict]):
+        self._added_texts.extend(texts)
+        self._added_metadatas.extend(dict(metadata) for metadata in metadatas)
+
+    def select(self, positions: Sequence[int]) -> "ChunkStore":
+        """A store holding only ``positions`` (ascending), renumbered from 0; saved texts are not copied."""
+        positions = np.asarray(positions, dtype=np.int64)
+        saved = positions[positions < self.saved_count]
+        store = ChunkStore()
+        store._texts, store._offsets, store._columns = self._texts, self._offsets, self._columns
+        store._codes, store._value_files, store._values = self._codes, self._value_files, self._values
+        store._rows = self._rows[saved] if self._rows is not None else saved
+        for position in positions[len(saved):]:
+            store._added_texts.append(self._added_texts[position - self.saved_count])
+            store._added_metadatas.append(self._added_metadatas[position - self.saved_count])
+        return store
+
+    def rows(self, positions: Optional[Iterable[int]] = None) -> Iterable[Tuple[str, dict]]:
+        for position in (range(len(self)) if positions is None else positions):
+            yield self.text(position), self.metadata(position)
+
+    def save(self, directory: str, positions: Optional[Sequence[int]] = None):
+        """Write the rows at ``positions`` (default: all), in order, as a new store in ``directory``."""
+        write_store(directory, self.rows(positions))
+
+
+def write_store(directory: str, rows: Iterable[Tuple[str, dict]]):
+    """Write (text, metadata) rows as a store in ``directory``."""
+    offsets = [0]
+    columns: Dict[str, Tuple[List[int], Dict[str, int], list]] = {}
+    count = 0
+    with open(os.path.join(directory, TEXTS_FILE), "wb") as texts:
+        for text, metadata in rows:
+            data = text.encode("utf-8")
+            texts.write(data)
+            offsets.append(offsets[-1] + len(data))
+            for name, value in metadata.items():
+                if name not in columns:
+                    columns[name] = ([-1] * count, {}, [])
+                codes, lookup, values = columns[name]
+                key = json.dumps(value, sort_keys=True)
+                if key not in lookup:
+                    lookup[key] = len(values)
+                    values.append(value)
+                codes.append(lookup[key])
+            count += 1
+            for codes, _, _ in columns.values():
+                if len(codes) < count:
+                    codes.append(-1)
+    np.save(os.path.join(directory, OFFSETS_FILE), np.asarray(offsets, dtype=np.int64))
+    names = list(columns)
+    for column, name in enumerate(names):
+        codes, _, values = columns[name]
+        np.save(os.path.join(directory, _codes_file(column)), np.asarray(codes, dtype=np.int32))
+        if _is_integer_column(values):
+            np.save(os.path.join(directory, _values_file(column, integer=True)), np.asarray(values, dtype=np.int64))
+        else:
+            with open(os.path.join(directory, _values_file(column)), "w") as f:
+                json.dump(values, f)
+    with open(os.path.join(directory, COLUMNS_FILE), "w") as f:
+        json.dump(names, f)
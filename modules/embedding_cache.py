@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_CACHE_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+KEY_BYTES = 16
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of a chunk's text, used to key cached vectors and dedupe chunks."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_BYTES).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding cache keyed by (model name, chunk text hash).
+
+    Each model gets its own directory holding an append-only float32 matrix
+    (vectors.f32, memory-mapped for reads) and a parallel append-only file of
+    16-byte text digests (keys.bin). Vectors are written before their keys, so
+    a key on disk always points at a complete row.
+    """
+
+    def __init__(self, model_name: str, path: str = EMBEDDING_CACHE_PATH):
+        self.model_name = model_name
+        self.directory = os.path.join(path, re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name))
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._keys_read = 0  # bytes of keys.bin already indexed
+        self._dim = None
+        self._matrix = None
+        self.hits = 0
+        self.misses = 0
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _sync(self):
+        """Index keys appended since the last read (possibly by other processes)."""
+        if self._dim is None:
+            try:
+                with open(self._file("meta.json")) as f:
+                    self._dim = json.load(f)["dim"]
+            except FileNotFoundError:
+                return
+        try:
+            size = os.path.getsize(self._file("keys.bin"))
+        except FileNotFoundError:
+            return
+        if size <= self._keys_read:
+            return
+        with open(self._file("keys.bin"), "rb") as f:
+            f.seek(self._keys_read)
+            data = f.read(size - self._keys_read)
+        usable = len(data) - len(data) % KEY_BYTES
+        first_row = self._keys_read // KEY_BYTES
+        for offset in range(0, usable, KEY_BYTES):
+            self._rows[data[offset:offset + KEY_BYTES]] = first_row + offset // KEY_BYTES
+        self._keys_read += usable
+        self._matrix = None
+
+    def _vectors(self) -> np.ndarray:
+        if self._matrix is None:
+            rows = self._keys_read // KEY_BYTES
+            self._matrix = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(rows, self._dim))
+        return self._matrix
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached vectors for ``texts`` (None where missing)."""
+        with self._lock:
+            self._sync()
+            results = []
+            for text in texts:
+                row = self._rows.get(bytes.fromhex(content_hash(text)))
+                results.append(None if row is None else np.array(self._vectors()[row]))
+            found = sum(vector is not None for vector in results)
+            self.hits += found
+            self.misses += len(texts) - found
+            return results
+
+    def put_many(self, texts: List[str], vectors):
+        """Append vectors for texts not cached yet."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if not len(texts):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, open(self._file(".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._sync()
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                with open(self._file("meta.json"), "w") as f:
+                    json.dump({"model": self.model_name, "dim": self._dim}, f)
+            keys, rows = [], []
+            for text, vector in zip(texts, vectors):
+                key = bytes.fromhex(content_hash(text))
+                if key not in self._rows and key not in keys:
+                    keys.append(key)
+                    rows.append(vector)
+            if not keys:
+                return
+            # Align the vector file with the committed keys in case an earlier
+            # writer died between the two appends.
+            with open(self._file("vectors.f32"), "ab") as f:
+                f.truncate(self._keys_read // KEY_BYTES * self._dim * 4)
+                f.write(np.stack(rows).tobytes())
+            with open(self._file("keys.bin"), "ab") as f:
+                f.write(b"".join(keys))
+            self._sync()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves document vectors from an EmbeddingCache
+    and only runs the model on texts it has not seen before.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            computed = np.asarray(self.embeddings.embed_documents(missing), dtype=np.float32)
+            self.cache.put_many(missing, computed)
+            by_text = dict(zip(missing, computed))
+            vectors = [by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
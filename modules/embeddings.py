@@ -1,9 +1,181 @@
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from config import EMBEDDING_MODEL
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_MODEL,
+    EMBEDDING_PARITY_CHECK,
+    EMBEDDING_PARITY_MIN_COSINE,
+    EMBEDDING_THREADS,
+)
+
+from modules.embedding_cache import CachedEmbeddings, EmbeddingCache
+from modules.telemetry import REGISTRY
+
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+
+# Sentences the quantized/ONNX model must embed (nearly) like the fp32 one
+PARITY_SAMPLES = [
+    "The Supplier shall indemnify the Customer against all losses arising from a breach of this Agreement.",
+    "Either party may terminate this Agreement on ninety days' written notice.",
+    '"Confidential Information" means all information disclosed by one party to the other.',
+    "This Agreement is governed by the laws of England and Wales.",
+    "Neither party is liable for delay caused by events beyond its reasonable control.",
+    "Payment is due within thirty days of the date of each invoice.",
+    "Governing law",
+    "What are the termination rights?",
+]
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+class EmbeddingParityError(ValueError):
+    """An accelerated backend's vectors drifted too far from the fp32 model's."""
+
+
+class SentenceEmbeddings(Embeddings):
+    """
+    Sentence-transformers model behind one of three CPU backends:
+
+    - ``torch``: the fp32 PyTorch model, as before;
+    - ``int8``: the same model with its Linear layers dynamically quantized
+      to int8 (weights stored as int8, activations quantized per batch);
+    - ``onnx``: the model exported to ONNX and run by ONNX Runtime (needs the
+      ``onnxruntime`` and ``optimum`` packages).
+
+    Texts are encoded ``batch_size`` at a time; sentence-transformers sorts
+    each call's texts by length and pads every batch only to its longest
+    member, so short chunks are not padded to the model's maximum.
+    ``threads`` (0 = library default) sets the intra-op thread count.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, backend: str = "torch",
+                 batch_size: int = EMBEDDING_BATCH_SIZE, threads: int = EMBEDDING_THREADS):
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.threads = threads
+        self.model = self._load()
+
+    def _load(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        if self.backend == "onnx":
+            try:
+                import onnxruntime
+            except ImportError as e:
+                raise ImportError("EMBEDDING_BACKEND=onnx needs: pip install onnxruntime optimum") from e
+            options = onnxruntime.SessionOptions()
+            if self.threads > 0:
+                options.intra_op_num_threads = self.threads
+            return SentenceTransformer(
+                self.model_name, device="cpu", backend="onnx",
+                model_kwargs={"provider": "CPUExecutionProvider", "session_options": options},
+            )
+        model = SentenceTransformer(self.model_name, device="cpu")
+        if self.backend == "int8":
+            torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    @property
+    def cache_name(self) -> str:
+        """Embedding cache namespace; approximate backends must not share fp32 vectors."""
+        return self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts, batch_size=self.batch_size, convert_to_numpy=True, show_progress_bar=False
+        ).astype(np.float32, copy=False)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [text.replace("\n", " ") for text in texts]
+        return self.encode(texts).tolist() if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def parity_check(candidate: Embeddings, reference: Embeddings, texts: Optional[List[str]] = None,
+                 min_cosine: float = EMBEDDING_PARITY_MIN_COSINE) -> Dict[str, float]:
+    """
+    Embed ``texts`` with both models and compare each pair of vectors by cosine
+    similarity. Raises EmbeddingParityError if any pair is below ``min_cosine``.
+    """
+    texts = texts or PARITY_SAMPLES
+    ours = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    theirs = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    cosines = (ours * theirs).sum(axis=1) / (np.linalg.norm(ours, axis=1) * np.linalg.norm(theirs, axis=1))
+    result = {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean())}
+    if result["min_cosine"] < min_cosine:
+        raise EmbeddingParityError(
+            f"{getattr(candidate, 'backend', 'candidate')} embeddings differ from the reference "
+            f"(min cosine {result['min_cosine']:.4f} < {min_cosine})"
+        )
+    return result
+
+
+def load_embedding_model(backend: str = EMBEDDING_BACKEND, model_name: str = EMBEDDING_MODEL) -> SentenceEmbeddings:
+    """
+    Load ``backend``, checking it against the fp32 model first when
+    EMBEDDING_PARITY_CHECK is on; a backend that fails to load or drifts
+    too far falls back to fp32 torch.
+    """
+    if backend == "torch":
+        return SentenceEmbeddings(model_name)
+    try:
+        model = SentenceEmbeddings(model_name, backend=backend)
+    except ImportError as e:
+        print(f"⚠️ {e}; using fp32 torch embeddings")
+        return SentenceEmbeddings(model_name)
+    if EMBEDDING_PARITY_CHECK:
+        reference = SentenceEmbeddings(model_name)
+        try:
+            parity = parity_check(model, reference)
+        except EmbeddingParityError as e:
+            print(f"⚠️ {e}; using fp32 torch embeddings")
+            return reference
+        print(f"✅ {backend} embeddings match fp32 (min cosine {parity['min_cosine']:.4f})")
+    return model
+
 
 def get_embeddings():
-    return HuggingFaceEmbeddings(
-        model_name=EMBEDDING_MODEL,
-        model_kwargs={'device': 'cpu'},
-        encode_kwargs={'device': 'cpu'}
-    )
+    """
+    Return the process-wide embedding model, loading it on first use.
+    Document embeddings go through the on-disk embedding cache unless it is disabled.
+    """
+    global _embeddings
+    if _embeddings is None:
+        with _embeddings_lock:
+            if _embeddings is None:
+                embeddings = load_embedding_model()
+                if EMBEDDING_CACHE_ENABLED:
+                    embeddings = CachedEmbeddings(embeddings, EmbeddingCache(embeddings.cache_name))
+                _embeddings = embeddings
+    return _embeddings
+
+
+def _embedding_cache_collector():
+    cache = getattr(_embeddings, "cache", None)
+    if not isinstance(cache, EmbeddingCache):
+        return
+    lookups = cache.hits + cache.misses
+    yield "legalview_embedding_cache_lookups_total", "counter", "Chunk embedding cache lookups by outcome", [
+        ({"result": "hit"}, cache.hits),
+        ({"result": "miss"}, cache.misses),
+    ]
+    yield "legalview_embedding_cache_hit_ratio", "gauge", "Share of chunk embeddings served from the cache", [
+        ({}, cache.hits / lookups if lookups else 0.0)
+    ]
+
+
+REGISTRY.add_collector(_embedding_cache_collector)
@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from modules.telemetry import REGISTRY
+from config import CPU_WORKERS, CPU_QUEUE_LIMIT, LLM_CONCURRENCY, LLM_QUEUE_LIMIT
+
+
+REJECTED = REGISTRY.counter("legalview_pool_rejections_total", "Work rejected because a pool's queue was full", ["pool"])
+
+
+class PoolSaturated(Exception):
+    """Raised instead of queueing work when a pool's wait queue is full."""
+
+    def __init__(self, pool: str, in_flight: int, queue_depth: int, limit: int):
+        super().__init__(f"{pool} pool saturated ({queue_depth} queued, limit {limit})")
+        self.pool = pool
+        self.in_flight = in_flight
+        self.queue_depth = queue_depth
+        self.limit = limit
+
+    def to_dict(self):
+        return {
+            "error": str(self),
+            "pool": self.pool,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "queue_limit": self.limit,
+        }
+
+
+class BoundedExecutor:
+    """
+    Thread pool for CPU-bound work (embedding, splitting, FAISS search) called
+    from async code. At most ``max_workers`` tasks run and ``max_queue`` wait;
+    anything beyond that is rejected with PoolSaturated instead of piling up
+    behind the slowest request.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+    def _admit(self):
+        with self._lock:
+            if self.in_flight >= self.max_workers + self.max_queue:
+                REJECTED.inc(pool=self.name)
+                raise PoolSaturated(self.name, self.in_flight, self.queue_depth, self.max_queue)
+            self.in_flight += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.in_flight -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn`` on the pool, preserving context variables."""
+        self._admit()
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, fn, *args, **kwargs)
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, call)
+        except BaseException:
+            self._release()
+            raise
+        # Release when the thread finishes, even if the awaiting request is cancelled
+        future.add_done_callback(self._release)
+        return await future
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "queue_limit": self.max_queue,
+        }
+
+
+class ConcurrencyLimiter:
+    """
+    Async admission control for I/O-bound work such as LLM calls: at most
+    ``limit`` run concurrently and ``max_queue`` wait.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.limit)
+
+    def check(self):
+        """Raise PoolSaturated if a new caller would be rejected right now."""
+        if self.in_flight >= self.limit + self.max_queue:
+            REJECTED.inc(pool=self.name)
+            raise PoolSaturated(self.name, self.in_flight, self.queue_depth, self.max_queue)
+
+    @asynccontextmanager
+    async def slot(self):
+        self.check()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        self.in_flight += 1
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            self.in_flight -= 1
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "queue_limit": self.max_queue,
+        }
+
+
+_cpu_executor: Optional[BoundedExecutor] = None
+_llm_limiter: Optional[ConcurrencyLimiter] = None
+
+
+def get_cpu_executor() -> BoundedExecutor:
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = BoundedExecutor("cpu", CPU_WORKERS, CPU_QUEUE_LIMIT)
+    return _cpu_executor
+
+
+def get_llm_limiter() -> ConcurrencyLimiter:
+    global _llm_limiter
+    if _llm_limiter is None:
+        _llm_limiter = ConcurrencyLimiter("llm", LLM_CONCURRENCY, LLM_QUEUE_LIMIT)
+    return _llm_limiter
+
+
+def _pool_collector():
+    pools = [pool for pool in (_cpu_executor, _llm_limiter) if pool is not None]
+    yield "legalview_pool_in_flight", "gauge", "Tasks running or queued per pool", [
+        ({"pool": pool.name}, pool.in_flight) for pool in pools
+    ]
+    yield "legalview_pool_queue_depth", "gauge", "Tasks waiting for a free worker or slot per pool", [
+        ({"pool": pool.name}, pool.queue_depth) for pool in pools
+    ]
+
+
+REGISTRY.add_collector(_pool_collector)
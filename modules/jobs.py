@@ -0,0 +1,386 @@
+"""
+Persistent background ingestion queue.
+
+Uploads are recorded as jobs in a SQLite database and indexed by worker
+processes, so the request that uploaded a file returns as soon as it is
+saved. Workers claim the highest-priority runnable job (oldest first),
+report progress while they parse and embed, and either complete it or
+schedule a retry with exponential backoff until JOB_MAX_ATTEMPTS is reached.
+A job whose worker stops heartbeating for JOB_STALE_SECONDS (e.g. it was
+killed) is claimed again, unless its attempts are used up: a file that
+kills every worker that opens it is failed rather than retried forever.
+Only the worker holding a job can report on it, so a worker that was
+presumed dead cannot overwrite the result of the one that took over.
+
+Every process, the backend included, opens its own connection: SQLite's
+write lock serializes claims across processes, and the vector index has its
+own cross-process writer lock.
+"""
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from modules import catalog
+from modules.embeddings import get_embeddings
+from modules.loader import iter_document
+from modules.splitter import iter_split
+from modules.sqlite import SQLiteStore
+from modules.shards import get_store, shard_for
+from modules.summaries import get_summary_store
+from modules.terms import get_term_index
+from modules.telemetry import REGISTRY, span
+from config import (
+    EMBED_BATCH_SIZE,
+    INDEX_SHARDS,
+    INGEST_JOB_WORKERS,
+    JOBS_DB_PATH,
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL,
+    JOB_RETRY_DELAY,
+    JOB_STALE_SECONDS,
+    PDF_WORKERS,
+)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    stage TEXT,
+    chunks INTEGER,
+    indexed_chunks INTEGER,
+    error TEXT,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_runnable ON jobs (status, priority DESC, created_at);
+"""
+
+
+class JobQueue(SQLiteStore):
+    """Jobs table in a SQLite database shared by the backend and its workers."""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        super().__init__(path, _SCHEMA)
+
+    def enqueue(self, path: str, filename: Optional[str] = None, priority: int = 0,
+                max_attempts: int = JOB_MAX_ATTEMPTS) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (id, path, filename, status, priority, max_attempts, stage, created_at, available_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, path, filename or os.path.basename(path), QUEUED, priority, max_attempts, QUEUED, now, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, limit: int = 50, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        if status:
+            rows = self._connection().execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+            )
+        else:
+            rows = self._connection().execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _reap(db: sqlite3.Connection, now: float) -> List[Dict[str, Any]]:
+        """
+        Requeue running jobs whose worker went silent, and fail those that
+        have no attempts left. Returns the jobs failed.
+        """
+        stale = now - JOB_STALE_SECONDS
+        failed = [
+            dict(row, status=FAILED, error=f"worker stopped responding on attempt {row['attempts']} of {row['max_attempts']}")
+            for row in db.execute(
+                "SELECT * FROM jobs WHERE status = ? AND heartbeat_at < ? AND attempts >= max_attempts", (RUNNING, stale)
+            )
+        ]
+        db.executemany(
+            "UPDATE jobs SET status = ?, stage = 'failed', error = ?, worker = NULL, finished_at = ? WHERE id = ?",
+            [(FAILED, job["error"], now, job["id"]) for job in failed],
+        )
+        db.execute(
+            "UPDATE jobs SET status = ?, stage = 'requeued after worker timeout', worker = NULL "
+            "WHERE status = ? AND heartbeat_at < ?",
+            (QUEUED, RUNNING, stale),
+        )
+        return failed
+
+    def reap(self) -> List[Dict[str, Any]]:
+        """Requeue or fail the jobs of silent workers (see claim); returns the jobs failed."""
+        with self._transaction() as db:
+            return self._reap(db, time.time())
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Mark the next runnable job as running for ``worker`` and return it, or None."""
+        now = time.time()
+        with self._transaction() as db:
+            self._reap(db, now)
+            row = db.execute(
+                "SELECT id FROM jobs WHERE status = ? AND available_at <= ? "
+                "ORDER BY priority DESC, created_at LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, stage = 'starting', "
+                "progress = 0, error = NULL, started_at = ?, heartbeat_at = ? WHERE id = ?",
+                (RUNNING, worker, now, now, row["id"]),
+            )
+        return self.get(row["id"])
+
+    def progress(self, job_id: str, worker: str, progress: float, stage: str, chunks: Optional[int] = None):
+        """Record progress (0-1) and refresh the job's heartbeat."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET progress = ?, stage = ?, chunks = COALESCE(?, chunks), heartbeat_at = ? "
+                "WHERE id = ? AND status = ? AND worker = ?",
+                (min(max(progress, 0.0), 1.0), stage, chunks, time.time(), job_id, RUNNING, worker),
+            )
+
+    def complete(self, job_id: str, worker: str, chunks: int, indexed_chunks: int) -> bool:
+        """Mark ``worker``'s job done; False if the job is no longer its to complete."""
+        with self._transaction() as db:
+            return db.execute(
+                "UPDATE jobs SET status = ?, progress = 1, stage = 'done', chunks = ?, indexed_chunks = ?, "
+                "worker = NULL, finished_at = ? WHERE id = ? AND status = ? AND worker = ?",
+                (SUCCEEDED, chunks, indexed_chunks, time.time(), job_id, RUNNING, worker),
+            ).rowcount > 0
+
+    def fail(self, job_id: str, worker: str, error: str) -> Optional[str]:
+        """
+        Schedule a retry, or fail the job once its attempts are used up;
+        returns the new status, or None if the job is no longer ``worker``'s.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = ? AND worker = ?",
+                (job_id, RUNNING, worker),
+            ).fetchone()
+            if row is None:
+                return None
+            if row["attempts"] < row["max_attempts"]:
+                delay = JOB_RETRY_DELAY * 2 ** (row["attempts"] - 1)
+                db.execute(
+                    "UPDATE jobs SET status = ?, stage = 'waiting to retry', error = ?, worker = NULL, "
+                    "available_at = ? WHERE id = ?",
+                    (QUEUED, error, now + delay, job_id),
+                )
+                return QUEUED
+            db.execute(
+                "UPDATE jobs SET status = ?, stage = 'failed', error = ?, worker = NULL, finished_at = ? WHERE id = ?",
+                (FAILED, error, now, job_id),
+            )
+            return FAILED
+
+    def retry(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Queue a failed job again with a fresh set of attempts."""
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, stage = ?, attempts = 0, progress = 0, available_at = ?, "
+                "finished_at = NULL WHERE id = ? AND status = ?",
+                (QUEUED, QUEUED, now, job_id, FAILED),
+            )
+        return self.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        db = self._connection()
+        counts = {status: 0 for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
+        counts.update(dict(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()))
+        totals = db.execute(
+            "SELECT COALESCE(SUM(chunks), 0), COALESCE(SUM(indexed_chunks), 0), "
+            "COALESCE(SUM(finished_at - started_at), 0) FROM jobs WHERE status = ?",
+            (SUCCEEDED,),
+        ).fetchone()
+        return {"jobs": counts, "chunks": totals[0], "indexed_chunks": totals[1], "seconds": totals[2]}
+
+
+def run_ingest_job(job: Dict[str, Any], report: Callable[..., None], workers: int = 1) -> Dict[str, int]:
+    """
+    Parse, split, embed and index one file, calling ``report(progress,
+    stage, chunks)`` as pages are processed. Returns chunk counts.
+    """
+    path = job["path"]
+    embeddings = get_embeddings()
+    chunks, vectors, batch = [], [], []
+    last_report = 0.0
+
+    def reported(chunk=None, stage="embedding"):
+        nonlocal last_report
+        if time.monotonic() - last_report < 1.0:
+            return
+        last_report = time.monotonic()
+        total = chunk.metadata.get("total_pages") if chunk is not None else None
+        done = (chunk.metadata.get("page", 0) + 1) / total if total else 0.5
+        # Parsing and embedding are 90% of the work; writing the index the rest
+        report(0.9 * done, stage, len(chunks))
+
+    with span("ingest", file=job["filename"], attempt=job["attempts"]):
+        # Pages stream in as they are extracted, so embedding overlaps parsing
+        for chunk in iter_split(iter_document(path, workers=workers)):
+            chunks.append(chunk)
+            batch.append(chunk.page_content)
+            if len(batch) >= EMBED_BATCH_SIZE:
+                with span("embed_documents", chunks=len(batch)):
+                    vectors.extend(embeddings.embed_documents(batch))
+                batch.clear()
+                reported(chunk)
+        if batch:
+            with span("embed_documents", chunks=len(batch)):
+                vectors.extend(embeddings.embed_documents(batch))
+        report(0.9, "indexing", len(chunks))
+        # Re-uploads of an unchanged file are a no-op and changed ones replace the old chunks
+        with span("index_write", chunks=len(chunks)):
+            store = get_store()
+            indexed = store.replace_document(path, chunks, vectors)
+        catalog.get_catalog().record_indexed(
+            path, chunks, vector_ranges=store.document_ranges(path),
+            shard=shard_for(path, INDEX_SHARDS) if INDEX_SHARDS > 1 else None,
+        )
+        with span("index_terms"):
+            get_term_index().index_document(path, chunks)
+        # The summary worker rebuilds the changed parts of the document's summary tree
+        get_summary_store().submit(path, chunks)
+    return {"chunks": len(chunks), "indexed_chunks": indexed}
+
+
+def process_next(queue: JobQueue, worker: str, workers: int = 1) -> bool:
+    """Run one job if any is runnable; returns whether one was run."""
+    documents = catalog.get_catalog()
+    for failed in queue.reap():
+        documents.set_status(failed["path"], catalog.FAILED, failed["error"])
+    job = queue.claim(worker)
+    if job is None:
+        return False
+    try:
+        if not os.path.exists(job["path"]):
+            raise FileNotFoundError(f"{job['filename']} was removed before it could be indexed")
+        documents.set_status(job["path"], catalog.INDEXING)
+        result = run_ingest_job(
+            job, lambda progress, stage, chunks=None: queue.progress(job["id"], worker, progress, stage, chunks), workers
+        )
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        status = queue.fail(job["id"], worker, error)
+        if status is not None:
+            documents.set_status(job["path"], catalog.FAILED if status == FAILED else catalog.QUEUED, error)
+    else:
+        queue.complete(job["id"], worker, result["chunks"], result["indexed_chunks"])
+    return True
+
+
+def worker_loop(db_path: str, stop, pdf_workers: int = 1, poll_interval: float = JOB_POLL_INTERVAL):
+    """Claim and run jobs until ``stop`` (an Event) is set."""
+    queue = JobQueue(db_path)
+    worker = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    while not stop.is_set():
+        if not process_next(queue, worker, pdf_workers):
+            stop.wait(poll_interval)
+
+
+class JobWorkers:
+    """
+    ``count`` workers running worker_loop: spawned processes by default, or
+    threads of this process (``processes=False``, for tests and small setups).
+    Dead worker processes are replaced.
+    """
+
+    def __init__(self, count: int = INGEST_JOB_WORKERS, db_path: str = JOBS_DB_PATH, processes: bool = True):
+        self.count = count
+        self.db_path = db_path
+        self.processes = processes
+        # Split the page pool between workers rather than giving each all CPUs
+        self.pdf_workers = max(1, PDF_WORKERS // max(1, count))
+        self._context = multiprocessing.get_context("spawn")  # no inherited torch thread pool
+        self._stop = self._context.Event() if processes else threading.Event()
+        self._workers: List[Any] = []
+        self._monitor: Optional[threading.Thread] = None
+
+    def _start_one(self):
+        args = (self.db_path, self._stop, self.pdf_workers)
+        if self.processes:
+            worker = self._context.Process(target=worker_loop, args=args, name="ingest-worker", daemon=True)
+        else:
+            worker = threading.Thread(target=worker_loop, args=args, name="ingest-worker", daemon=True)
+        worker.start()
+        return worker
+
+    def _watch(self):
+        while not self._stop.wait(5.0):
+            self._workers = [worker if worker.is_alive() else self._start_one() for worker in self._workers]
+
+    def start(self):
+        self._workers = [self._start_one() for _ in range(self.count)]
+        if self.processes:
+            self._monitor = threading.Thread(target=self._watch, name="ingest-monitor", daemon=True)
+            self._monitor.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._monitor is not None:
+            self._monitor.join()
+        for worker in self._workers:
+            worker.join(timeout)
+            if self.processes and worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.count, "alive": sum(worker.is_alive() for worker in self._workers)}
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
+
+
+def _job_collector():
+    if _queue is None:
+        return
+    stats = _queue.stats()
+    yield "legalview_ingest_jobs", "gauge", "Ingestion jobs by status", [
+        ({"status": status}, count) for status, count in stats["jobs"].items()
+    ]
+    yield "legalview_ingest_chunks_total", "counter", "Chunks produced by completed ingestion jobs", [({}, stats["chunks"])]
+    yield "legalview_ingest_indexed_chunks_total", "counter", "Chunks written to the index by completed jobs", [
+        ({}, stats["indexed_chunks"])
+    ]
+    yield "legalview_ingest_seconds_total", "counter", "Worker time spent on completed jobs (last attempt)", [
+        ({}, stats["seconds"])
+    ]
+
+
+REGISTRY.add_collector(_job_collector)
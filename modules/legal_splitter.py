@@ -0,0 +1,195 @@
+"""
+Splitter that follows the structure of legal documents instead of a fixed
+character window.
+
+One linear pass over the lines finds structural boundaries: articles,
+numbered sections and clauses ("4.2", "Section 4.2"), lettered and roman
+sub-clauses ("(a)", "(iv)"), all-caps headings and definitions
+('"Term" means ...'). Each boundary starts a unit labelled with its place in
+the hierarchy; consecutive units under the same parent are packed into a
+chunk while it fits ``chunk_size``, so chunks vary in size but never start
+or end mid-clause. Only a unit longer than ``chunk_size`` is cut, by the
+recursive character splitter. Overlap between chunks is optional.
+
+Chunks get ``section`` (the deepest label they all fall under, e.g.
+"Section 4.2"), ``section_path`` ("Article IV > Section 4.2") and, for
+definitions, ``defined_terms``. The hierarchy carries across the pages of a
+document, so a clause continuing on the next page keeps its label.
+"""
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+_ARTICLE = re.compile(r"\s*(?:ARTICLE|Article)\s+([IVXLC]+|[0-9]+)\b")
+_SECTION = re.compile(r"\s*(?:SECTION|Section|§)\s*([0-9]+(?:\.[0-9]+)*)\b")
+_NUMBERED = re.compile(r"\s*([0-9]+(?:\.[0-9]+)+|[0-9]+\.)(?=\s+\S)")
+_SUBCLAUSE = re.compile(r"\s*\(([a-z]{1,2}|[ivxl]+)\)\s+\S")
+_DEFINITION = re.compile(r"\s*[\"“']([^\"”']{1,80})[\"”']\s+(?:means|shall mean|has the meaning|includes)\b")
+_HEADING = re.compile(r"\s*[A-Z][A-Z0-9 ,&'()/-]{3,80}\s*")
+_ROMAN = re.compile(r"[ivxl]+")
+
+# (hierarchy path, text, kind)
+Unit = Tuple[Tuple[str, ...], str, str]
+# Hierarchy entries: (level, label); lower levels are closer to the root
+Stack = List[Tuple[int, str]]
+
+ARTICLE_LEVEL, SECTION_LEVEL, LETTER_LEVEL, ROMAN_LEVEL = 0, 1, 100, 101
+
+
+def _push(stack: Stack, level: int, label: str) -> Stack:
+    return [entry for entry in stack if entry[0] < level] + [(level, label)]
+
+
+def _boundary(line: str, stack: Stack) -> Optional[Tuple[Stack, str, Optional[str]]]:
+    """If ``line`` opens a structural unit, return (new stack, kind, defined term)."""
+    match = _ARTICLE.match(line)
+    if match:
+        return _push(stack, ARTICLE_LEVEL, f"Article {match.group(1)}"), "article", None
+    match = _SECTION.match(line) or _NUMBERED.match(line)
+    if match:
+        number = match.group(1).rstrip(".")
+        return _push(stack, SECTION_LEVEL + number.count("."), f"Section {number}"), "section", None
+    match = _SUBCLAUSE.match(line)
+    if match:
+        marker = match.group(1)
+        top_level = stack[-1][0] if stack else None
+        if marker == "i":
+            # "(i)" after "(h)" is a letter; otherwise it opens roman sub-clauses
+            roman = not (stack and stack[-1][1].endswith("(h)"))
+        elif marker in ("v", "x", "l"):
+            roman = top_level == ROMAN_LEVEL
+        else:
+            roman = bool(_ROMAN.fullmatch(marker))
+        level = ROMAN_LEVEL if roman else LETTER_LEVEL
+        base = next((label for entry_level, label in reversed(stack) if entry_level < level), "")
+        return _push(stack, level, f"{base}({marker})"), "clause", None
+    match = _DEFINITION.match(line)
+    if match:
+        return stack, "definition", match.group(1).strip()
+    if _HEADING.fullmatch(line) and sum(c.isalpha() for c in line) >= 4:
+        return _push(stack, ARTICLE_LEVEL, line.strip().title()), "heading", None
+    return None
+
+
+def _can_join(first: Tuple[str, ...], path: Tuple[str, ...]) -> bool:
+    """A unit joins a chunk if it is inside the chunk's first unit or a sibling of it below the top level."""
+    if not first:
+        return not path
+    if path[:len(first)] == first:
+        return True
+    return len(first) >= 2 and len(path) >= 2 and path[:len(first) - 1] == first[:-1]
+
+
+def _section_labels(paths: List[Tuple[str, ...]]) -> List[str]:
+    """Hierarchy labels shared by ``paths``, ending in a range such as "Section 2.2–2.3" for siblings."""
+    prefix = _common_prefix(paths)
+    labels = [label for label in prefix if not label.startswith('"')]
+    depth = len(prefix)
+    first = paths[0][depth] if len(paths[0]) > depth else None
+    last = paths[-1][depth] if len(paths[-1]) > depth else None
+    if first and last and not first.startswith('"') and not last.startswith('"'):
+        # Drop the part both labels share, up to a word or "(": "Section 4.2–4.3", "Section 4.2(a)–(c)"
+        shared = os.path.commonprefix([first, last])
+        cut = max(shared.rfind(" "), shared.rfind("(") - 1) + 1
+        labels.append(f"{first}–{last[cut:]}")
+    return labels
+
+
+def _common_prefix(paths: List[Tuple[str, ...]]) -> Tuple[str, ...]:
+    prefix = paths[0]
+    for path in paths[1:]:
+        length = 0
+        while length < min(len(prefix), len(path)) and prefix[length] == path[length]:
+            length += 1
+        prefix = prefix[:length]
+    return prefix
+
+
+class LegalStructureSplitter:
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 0):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self._fallback = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=min(chunk_overlap, chunk_size // 2))
+        self._stacks: Dict[Optional[str], Stack] = {}  # hierarchy at the end of the last page, per source
+
+    def units(self, text: str, stack: Stack) -> Tuple[List[Unit], Stack]:
+        """Cut ``text`` into structural units in one pass; returns them and the final hierarchy."""
+        units: List[Unit] = []
+        lines: List[str] = []
+        path = tuple(label for _, label in stack)
+        kind = "continuation"
+        for line in text.splitlines(keepends=True):
+            boundary = _boundary(line, stack) if line.strip() else None
+            if boundary is not None and boundary[1] == "heading" and kind != "continuation" and len(
+                [existing for existing in lines if existing.strip()]
+            ) == 1:
+                boundary = None  # a title right after "ARTICLE IV" names it, it does not open a unit
+            if boundary is not None:
+                if "".join(lines).strip():
+                    units.append((path, "".join(lines), kind))
+                lines = []
+                stack, kind, term = boundary
+                path = tuple(label for _, label in stack)
+                if term is not None:
+                    path = path + (f'"{term}"',)
+            lines.append(line)
+        if "".join(lines).strip():
+            units.append((path, "".join(lines), kind))
+        return units, stack
+
+    def _pack(self, units: List[Unit]) -> List[Tuple[List[Unit], str]]:
+        """Group consecutive sibling units into chunks of at most chunk_size characters."""
+        groups: List[Tuple[List[Unit], str]] = []
+        current: List[Unit] = []
+        size = 0
+        for unit in units:
+            path, text, _ = unit
+            text = text.strip()
+            if len(text) > self.chunk_size:
+                if current:
+                    groups.append((current, ""))
+                    current, size = [], 0
+                groups.extend(([unit], piece) for piece in self._fallback.split_text(text))
+                continue
+            if current and (not _can_join(current[0][0], path) or size + len(text) + 1 > self.chunk_size):
+                groups.append((current, ""))
+                current, size = [], 0
+            current.append(unit)
+            size += len(text) + 1
+        if current:
+            groups.append((current, ""))
+        return groups
+
+    def split_text_with_metadata(self, text: str, source: Optional[str] = None) -> List[Tuple[str, dict]]:
+        stack = self._stacks.get(source, [])
+        units, self._stacks[source] = self.units(text, stack)
+        chunks = []
+        previous = ""
+        for group, piece in self._pack(units):
+            content = piece or "\n".join(unit[1].strip() for unit in group)
+            metadata = {}
+            labels = _section_labels([unit[0] for unit in group])
+            if labels:
+                metadata["section"] = labels[-1]
+                metadata["section_path"] = " > ".join(labels)
+            terms = [unit[0][-1].strip('"') for unit in group if unit[2] == "definition"]
+            if terms:
+                metadata["defined_terms"] = terms
+            if self.chunk_overlap and previous and not piece:
+                tail = previous[-self.chunk_overlap:]
+                tail = tail[tail.find(" ") + 1:] if " " in tail else tail
+                content = tail + "\n" + content
+            chunks.append((content, metadata))
+            previous = content
+        return chunks
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        chunks = []
+        for document in documents:
+            source = document.metadata.get("source")
+            for text, metadata in self.split_text_with_metadata(document.page_content, source):
+                chunks.append(Document(page_content=text, metadata={**document.metadata, **metadata}))
+        return chunks
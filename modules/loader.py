@@ -1,8 +1,155 @@
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+"""
+Document loading. PDFs are read page by page as a generator, so splitting
+and embedding start on the first pages while later ones are still being
+extracted; large PDFs are extracted across a process pool by page range.
 
-def load_document(file_path: str):
+Each page becomes one Document with PyPDFLoader's metadata (``source``,
+0-based ``page``, ``page_label``, ``total_pages``) plus ``section``: the
+legal heading ("ARTICLE IV", "Section 4.2 Termination", "4.2 Fees") in
+effect on that page.
+"""
+import multiprocessing
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+from langchain.schema import Document
+from pypdf import PdfReader
+
+from config import PDF_WORKERS, PDF_PARALLEL_MIN_PAGES, PDF_PAGE_BATCH
+
+_HEADING_PATTERNS = [
+    # ARTICLE IV, Section 4.2 Termination, SCHEDULE 1, Exhibit B
+    re.compile(r"(?:ARTICLE|Article|SECTION|Section|SCHEDULE|Schedule|EXHIBIT|Exhibit|PART|Part|§)\s*"
+               r"(?:[0-9]+(?:\.[0-9]+)*|[IVXLC]+|[A-Z])\b[.:]?(?:\s+\S.*)?"),
+    # 4.2 Fees / 12. TERMINATION (a short title, not a numbered sentence)
+    re.compile(r"[0-9]+(?:\.[0-9]+)*\.?\s+[A-Z][A-Za-z0-9 ,&'()/-]{0,60}"),
+    # DEFINITIONS AND INTERPRETATION
+    re.compile(r"[A-Z][A-Z0-9 ,&'()/-]{3,80}"),
+]
+MAX_HEADING_WORDS = 10
+
+# (page number, text, heading the page opens with, last heading on the page, seconds)
+PageResult = Tuple[int, str, Optional[str], Optional[str], float]
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def is_heading(line: str) -> bool:
+    line = line.strip()
+    if not line or len(line.split()) > MAX_HEADING_WORDS or line[-1] in ",;":
+        return False
+    return sum(c.isalpha() for c in line) >= 3 and any(pattern.fullmatch(line) for pattern in _HEADING_PATTERNS)
+
+
+def find_headings(text: str) -> List[str]:
+    """Lines of ``text`` that look like headings, in order."""
+    return [re.sub(r"\s+", " ", line.strip()) for line in text.splitlines() if is_heading(line)]
+
+
+def _extract_pages(file_path: str, start: int, stop: int) -> List[PageResult]:
+    """Extract pages [start, stop); runs in the page pool for large PDFs."""
+    reader = PdfReader(file_path)
+    results = []
+    for number in range(start, stop):
+        started = time.perf_counter()
+        text = reader.pages[number].extract_text() or ""
+        headings = find_headings(text)
+        first_line = next((line for line in text.splitlines() if line.strip()), "")
+        results.append((
+            number,
+            text,
+            headings[0] if headings and is_heading(first_line) else None,
+            headings[-1] if headings else None,
+            time.perf_counter() - started,
+        ))
+    return results
+
+
+def get_page_pool() -> ProcessPoolExecutor:
+    """Process pool shared by every large-PDF extraction in this process."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: workers must not inherit the parent's torch thread pool
+                _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _page_results(file_path: str, total: int, workers: int, page_batch: int) -> Iterator[PageResult]:
+    """Yield extracted pages in order, from the page pool if the PDF is large enough."""
+    if workers <= 1 or total < PDF_PARALLEL_MIN_PAGES:
+        for start in range(0, total, page_batch):
+            yield from _extract_pages(file_path, start, min(start + page_batch, total))
+        return
+    pool = get_page_pool()
+    ranges = iter(range(0, total, page_batch))
+    futures = []
+    # Keep a few ranges ahead per worker so the pool stays busy but memory stays flat
+    for start in ranges:
+        futures.append(pool.submit(_extract_pages, file_path, start, min(start + page_batch, total)))
+        if len(futures) >= workers * 2:
+            break
+    while futures:
+        results = futures.pop(0).result()
+        start = next(ranges, None)
+        if start is not None:
+            futures.append(pool.submit(_extract_pages, file_path, start, min(start + page_batch, total)))
+        yield from results
+
+
+def iter_pdf_pages(
+    file_path: str,
+    workers: int = PDF_WORKERS,
+    page_batch: int = PDF_PAGE_BATCH,
+    timings: Optional[List[Tuple[int, float]]] = None,
+) -> Iterator[Document]:
+    """
+    Yield one Document per page, in page order. PDFs with at least
+    PDF_PARALLEL_MIN_PAGES pages are extracted on the shared page pool,
+    ``page_batch`` pages per task with up to 2 * ``workers`` tasks in flight;
+    ``workers=1`` extracts in this process. Extraction time per page is
+    appended to ``timings`` as (page, seconds).
+    """
+    reader = PdfReader(file_path)
+    total = len(reader.pages)
+    try:
+        labels = reader.page_labels
+    except Exception:  # malformed /PageLabels: fall back to 1-based numbers
+        labels = [str(number + 1) for number in range(total)]
+    section = None
+    for number, text, opening, last_heading, seconds in _page_results(file_path, total, workers, page_batch):
+        if timings is not None:
+            timings.append((number, seconds))
+        # A page continues the previous page's last section unless it opens with a heading
+        section = opening or section
+        metadata = {"source": file_path, "page": number, "page_label": labels[number], "total_pages": total}
+        if section is not None:
+            metadata["section"] = section
+        yield Document(page_content=text, metadata=metadata)
+        section = last_heading or section
+
+
+def iter_document(file_path: str, workers: int = PDF_WORKERS, timings: Optional[List[Tuple[int, float]]] = None) -> Iterator[Document]:
+    """Yield the pages of a PDF (or the whole of a text file) as they are extracted."""
     if file_path.endswith(".pdf"):
-        loader = PyPDFLoader(file_path)
-    else:
-        loader = TextLoader(file_path, encoding="utf-8")
-    return loader.load()
+        yield from iter_pdf_pages(file_path, workers=workers, timings=timings)
+        return
+    started = time.perf_counter()
+    with open(file_path, encoding="utf-8") as f:
+        text = f.read()
+    if timings is not None:
+        timings.append((0, time.perf_counter() - started))
+    yield Document(page_content=text, metadata={"source": file_path})
+
+
+def pdf_page_count(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+
+def load_document(file_path: str, workers: int = PDF_WORKERS):
+    return list(iter_document(file_path, workers=workers))
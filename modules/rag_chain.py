@@ -1,25 +1,57 @@
 from langchain.chains import RetrievalQA
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
-from typing import Optional
+from langchain.schema import Document
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+import asyncio
+import threading
+import time
 
-from modules.retriever import get_retriever
-from config import LLM_MODEL, AI_API_KEY
+import numpy as np
 
+from modules.answer_cache import get_answer_cache
+from modules.embedding_cache import content_hash
+from modules.executor import get_cpu_executor, get_llm_limiter
+from modules.retriever import DEFAULT_K, get_retriever, document_scope
+from modules.telemetry import REGISTRY, LLMSpanHandler, span
+from modules.summaries import answer_summary
+from modules.terms import answer_definition
+from modules.shards import get_store
+from modules.vectorstore import embed_queries
+from config import (
+    LLM_MODEL,
+    AI_API_KEY,
+    BATCH_LLM_CONCURRENCY,
+    CHUNK_OVERLAP,
+    CONTEXT_CANDIDATES,
+    CONTEXT_MMR_LAMBDA,
+    CONTEXT_TOKEN_BUDGET,
+    LEGAL_CHUNK_OVERLAP,
+)
 
-def get_rag_chain(document_source: Optional[str] = None):
-    retriever = get_retriever(document_source=document_source)
-    llm = ChatGoogleGenerativeAI(
-        model=LLM_MODEL,
-        google_api_key=AI_API_KEY,
-        temperature=0.1,  # Lower temperature for more consistent answers
-        max_output_tokens=1000
-    )
-    
-    # Enhanced prompt template for better legal document understanding
-    prompt_template = PromptTemplate(
-        input_variables=["context", "question"],
-        template="""You are a helpful legal document assistant. Your task is to answer questions based on the provided legal documents.
+_chain = None
+_chain_lock = threading.Lock()
+_llm = None
+
+CONTEXT_TOKENS = REGISTRY.histogram(
+    "legalview_context_tokens", "Estimated prompt context tokens per question",
+    buckets=(100, 200, 400, 700, 1000, 1500, 2000, 3000, 5000),
+)
+
+
+class _TracedPromptTemplate(PromptTemplate):
+    """Records rendering as the ``prompt_build`` span, inside or outside the chain."""
+
+    def format(self, **kwargs: Any) -> str:
+        with span("prompt_build"):
+            return super().format(**kwargs)
+
+
+# Enhanced prompt template for better legal document understanding
+PROMPT_TEMPLATE = _TracedPromptTemplate(
+    input_variables=["context", "question"],
+    template="""You are a helpful legal document assistant. Your task is to answer questions based on the provided legal documents.
 
 When answering:
 1. Base your response ONLY on the information found in the source documents
@@ -39,13 +71,535 @@ Context: {context}
 Question: {question}
 
 Answer based on the documents:"""
+)
+
+# Questions are sent as-is unless a caller (e.g. a Streamlit query mode) wraps
+# them in a template; the template is part of the answer cache key, so cache
+# lookups compare only the user's own words.
+QUESTION_TEMPLATE = "{question}"
+# The "Term Definition" mode: the question is the term. Definitions found in
+# the defined-terms index are answered from it; the LLM sees this template
+# only for terms the documents do not define or when an explanation is asked for.
+DEFINITION_TEMPLATE = "Define and explain the legal term '{question}' based on the document content"
+# The "Document Summary" mode: the question names what to summarize. It is
+# answered from the stored summary trees once a document's tree is built.
+SUMMARY_TEMPLATE = "Provide a summary of {question} from the document"
+# Query modes of the frontend and the API ("query_type")
+QUERY_TEMPLATES = {"general": QUESTION_TEMPLATE, "term": DEFINITION_TEMPLATE, "summary": SUMMARY_TEMPLATE}
+
+
+def estimate_tokens(text: str) -> int:
+    """Prompt tokens ``text`` costs, estimated at 4 characters per token."""
+    return max(1, (len(text) + 3) // 4)
+
+
+def _context_tokens(docs: List[Document]) -> int:
+    # Documents are joined with a blank line, as in format_prompt()
+    return sum(estimate_tokens(doc.page_content) + 1 for doc in docs)
+
+
+def _position(doc: Document) -> int:
+    return int(doc.id) if doc.id and doc.id.isdigit() else -1
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest end of ``first`` that ``second`` starts with, up to the splitters' overlap."""
+    for length in range(min(len(first), len(second), max(CHUNK_OVERLAP, LEGAL_CHUNK_OVERLAP)), 0, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+def _merge_adjacent(ranked: List[Tuple[int, Document]]) -> List[Tuple[int, Document]]:
+    """
+    Join chunks that follow each other in the same document (consecutive
+    index positions), dropping the text they share. Takes and returns
+    (rank, document) pairs; a merged document keeps its best rank and its
+    first chunk's metadata.
+    """
+    groups = []  # [best rank, merged document, last chunk]
+    for rank, doc in sorted(ranked, key=lambda item: (str(item[1].metadata.get("source")), _position(item[1]))):
+        if groups:
+            best, merged, last = groups[-1]
+            if (
+                _position(last) >= 0
+                and _position(doc) == _position(last) + 1
+                and doc.metadata.get("source") == last.metadata.get("source")
+            ):
+                overlap = _overlap(last.page_content, doc.page_content)
+                text = merged.page_content + (doc.page_content[overlap:] if overlap else "\n" + doc.page_content)
+                merged = Document(id=merged.id, page_content=text, metadata=merged.metadata)
+                groups[-1] = [min(best, rank), merged, doc]
+                continue
+        groups.append([rank, doc, doc])
+    return sorted(((best, merged) for best, merged, _ in groups), key=lambda item: item[0])
+
+
+def _mmr_order(docs: List[Document], mmr_lambda: float) -> List[int]:
+    """
+    Maximal marginal relevance ordering of retrieved documents. Relevance is
+    the retriever's own ranking (so hybrid fusion is respected), redundancy
+    the highest cosine similarity to an already chosen document; all pairs
+    are scored at once from the stored vectors.
+    """
+    vectors = get_store().document_vectors(docs)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    similarity = vectors @ vectors.T
+    relevance = 1.0 - np.arange(len(docs)) / len(docs)
+    order, remaining = [0], list(range(1, len(docs)))
+    redundancy = similarity[0].copy()
+    while remaining:
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy[remaining]
+        best = remaining.pop(int(np.argmax(scores)))
+        order.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return order
+
+
+def assemble_context(
+    docs: List[Document],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+) -> List[Document]:
+    """
+    Turn retrieved candidates (best first) into the prompt context: drop
+    duplicate texts, rerank by MMR, merge neighbouring chunks, and keep
+    adding documents in MMR order while the merged context fits
+    ``token_budget``. The best document is always kept. A budget of 0
+    returns the top DEFAULT_K candidates unchanged.
+    """
+    if token_budget <= 0:
+        return docs[:DEFAULT_K]
+    with span("context_assembly", candidates=len(docs)) as assembly:
+        seen, unique = set(), []
+        for doc in docs:
+            if (doc.metadata.get("source"), doc.page_content) not in seen:
+                seen.add((doc.metadata.get("source"), doc.page_content))
+                unique.append(doc)
+        chosen: List[Tuple[int, Document]] = []
+        for rank, number in enumerate(_mmr_order(unique, mmr_lambda) if unique else []):
+            packed = _merge_adjacent(chosen + [(rank, unique[number])])
+            if not chosen or _context_tokens([doc for _, doc in packed]) <= token_budget:
+                chosen.append((rank, unique[number]))
+        context = [doc for _, doc in _merge_adjacent(chosen)]
+        tokens = _context_tokens(context)
+        assembly.set(documents=len(context), tokens=tokens)
+    CONTEXT_TOKENS.observe(tokens)
+    return context
+
+
+class ScopedRetrievalQA(RetrievalQA):
+    """
+    RetrievalQA that accepts an optional "document_source" input and scopes
+    retrieval to it, so one chain serves every document filter. Retrieved
+    candidates go through assemble_context() before being stuffed into the prompt.
+    """
+
+    def _get_docs(self, question: str, *, run_manager) -> List[Document]:
+        return assemble_context(super()._get_docs(question, run_manager=run_manager))
+
+    async def _aget_docs(self, question: str, *, run_manager) -> List[Document]:
+        docs = await super()._aget_docs(question, run_manager=run_manager)
+        return await get_cpu_executor().run(assemble_context, docs)
+
+    def _call(self, inputs: Dict[str, Any], run_manager=None) -> Dict[str, Any]:
+        with span("rag_chain"), document_scope(inputs.get("document_source")):
+            return super()._call(inputs, run_manager=run_manager)
+
+    async def _acall(self, inputs: Dict[str, Any], run_manager=None) -> Dict[str, Any]:
+        # The span is current while the chain runs, so retrieval on the CPU
+        # pool and the LLM callback record their spans under it
+        with span("rag_chain"), document_scope(inputs.get("document_source")):
+            return await super()._acall(inputs, run_manager=run_manager)
+
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        _llm = ChatGoogleGenerativeAI(
+            model=LLM_MODEL,
+            google_api_key=AI_API_KEY,
+            temperature=0.1,  # Lower temperature for more consistent answers
+            max_output_tokens=1000,
+            callbacks=[LLMSpanHandler()],
+        )
+    return _llm
+
+
+def get_rag_chain():
+    """
+    Return the process-wide RAG chain. Pass "document_source" alongside
+    "query" when invoking it to restrict retrieval to one document.
+    """
+    global _chain
+    if _chain is None:
+        with _chain_lock:
+            if _chain is None:
+                _chain = build_rag_chain()
+    return _chain
+
+
+def build_rag_chain(document_source: Optional[str] = None):
+    # A wider candidate set when assemble_context() picks and packs the context
+    retriever = get_retriever(
+        document_source=document_source, k=CONTEXT_CANDIDATES if CONTEXT_TOKEN_BUDGET > 0 else DEFAULT_K
     )
+    llm = get_llm()
 
-    return RetrievalQA.from_chain_type(
+    return ScopedRetrievalQA.from_chain_type(
         llm=llm,
         retriever=retriever,
         return_source_documents=True,
         chain_type_kwargs={
-            "prompt": prompt_template
+            "prompt": PROMPT_TEMPLATE
         }
     )
+
+
+def retrieve_context(query: str, document_source: Optional[str] = None) -> List[Document]:
+    """The chain's retrieval step on its own: candidates, then assemble_context()."""
+    with document_scope(document_source):
+        docs = get_rag_chain().retriever.invoke(query)
+    return assemble_context(docs)
+
+
+async def aretrieve_context(query: str, document_source: Optional[str] = None) -> List[Document]:
+    with document_scope(document_source):
+        docs = await get_rag_chain().retriever.ainvoke(query)
+    return await get_cpu_executor().run(assemble_context, docs)
+
+
+def format_prompt(question: str, docs: List[Document]) -> str:
+    """Render the prompt exactly as the "stuff" chain would for these documents."""
+    context = "\n\n".join(doc.page_content for doc in docs)
+    return PROMPT_TEMPLATE.format(context=context, question=question)
+
+
+def prompt_version(question_template: str = QUESTION_TEMPLATE) -> str:
+    """Identifies the prompt an answer was generated with, for the answer cache."""
+    return content_hash(PROMPT_TEMPLATE.template + "\0" + question_template)
+
+
+def cached_answer(
+    question: str,
+    document_source: Optional[str] = None,
+    question_template: str = QUESTION_TEMPLATE,
+    vector: Optional[np.ndarray] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Look the question up in the defined-terms index (definition questions)
+    or the summary trees (summary questions), and then the answer cache.
+    Returns a result shaped like the chain's ({"result",
+    "source_documents"}, plus "cached") or None.
+    """
+    if question_template == SUMMARY_TEMPLATE:
+        with span("summary_tree") as lookup:
+            result = answer_summary(question, document_source)
+            lookup.set(hit=result is not None)
+        if result is not None:
+            return result
+    if question_template in (QUESTION_TEMPLATE, DEFINITION_TEMPLATE):
+        with span("term_index") as lookup:
+            result = answer_definition(question, document_source, whole_term=question_template == DEFINITION_TEMPLATE)
+            lookup.set(hit=result is not None)
+        if result is not None:
+            return result
+    cache = get_answer_cache()
+    if cache is None:
+        return None
+    with span("answer_cache") as lookup:
+        result = cache.get(question, document_source, prompt_version(question_template), LLM_MODEL, vector=vector)
+        lookup.set(hit=result["cached"] if result else "miss")
+    return result
+
+
+def remember_answer(
+    question: str,
+    document_source: Optional[str],
+    result: Dict[str, Any],
+    latency: float,
+    question_template: str = QUESTION_TEMPLATE,
+    vector: Optional[np.ndarray] = None,
+):
+    cache = get_answer_cache()
+    if cache is not None and result.get("result"):
+        cache.put(
+            question, document_source, prompt_version(question_template), LLM_MODEL,
+            result["result"], result.get("source_documents", []), latency, vector=vector,
+        )
+
+
+def answer_query(
+    question: str,
+    document_source: Optional[str] = None,
+    question_template: str = QUESTION_TEMPLATE,
+) -> Dict[str, Any]:
+    """Answer a question through the shared chain, serving repeats from the answer cache."""
+    result = cached_answer(question, document_source, question_template)
+    if result is not None:
+        return result
+    started = time.perf_counter()
+    result = get_rag_chain().invoke({
+        "query": question_template.format(question=question),
+        "document_source": document_source,
+    })
+    remember_answer(question, document_source, result, time.perf_counter() - started, question_template)
+    return dict(result, cached=None)
+
+
+async def aanswer_query(
+    question: str,
+    document_source: Optional[str] = None,
+    question_template: str = QUESTION_TEMPLATE,
+) -> Dict[str, Any]:
+    """
+    Async counterpart of answer_query(). Cache lookups run on the CPU pool and
+    only misses take an LLM slot (raising PoolSaturated when none is free).
+    """
+    result = await get_cpu_executor().run(cached_answer, question, document_source, question_template)
+    if result is not None:
+        return result
+    started = time.perf_counter()
+    async with get_llm_limiter().slot():
+        result = await get_rag_chain().ainvoke({
+            "query": question_template.format(question=question),
+            "document_source": document_source,
+        })
+    await get_cpu_executor().run(
+        remember_answer, question, document_source, result, time.perf_counter() - started, question_template
+    )
+    return dict(result, cached=None)
+
+
+def stream_answer(
+    question: str,
+    document_source: Optional[str] = None,
+    question_template: str = QUESTION_TEMPLATE,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Answer a question incrementally: yields a "sources" event with the
+    retrieved documents first, then one "token" event per generated chunk.
+    A cached answer is yielded as a single token event, and the sources
+    event's "cached" field says how it matched.
+    """
+    cached = cached_answer(question, document_source, question_template)
+    if cached is not None:
+        yield {"event": "sources", "documents": cached["source_documents"], "cached": cached["cached"]}
+        yield {"event": "token", "text": cached["result"]}
+        return
+    started = time.perf_counter()
+    query = question_template.format(question=question)
+    docs = retrieve_context(query, document_source)
+    yield {"event": "sources", "documents": docs, "cached": None}
+    answer = ""
+    for chunk in get_llm().stream(format_prompt(query, docs)):
+        if chunk.content:
+            answer += chunk.content
+            yield {"event": "token", "text": chunk.content}
+    remember_answer(
+        question, document_source, {"result": answer, "source_documents": docs},
+        time.perf_counter() - started, question_template,
+    )
+
+
+async def astream_answer(
+    question: str,
+    document_source: Optional[str] = None,
+    question_template: str = QUESTION_TEMPLATE,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Async counterpart of stream_answer(), used by the streaming API endpoint.
+    Misses hold an LLM slot from retrieval until the last token.
+    """
+    cached = await get_cpu_executor().run(cached_answer, question, document_source, question_template)
+    if cached is not None:
+        yield {"event": "sources", "documents": cached["source_documents"], "cached": cached["cached"]}
+        yield {"event": "token", "text": cached["result"]}
+        return
+    started = time.perf_counter()
+    query = question_template.format(question=question)
+    answer = ""
+    async with get_llm_limiter().slot():
+        docs = await aretrieve_context(query, document_source)
+        yield {"event": "sources", "documents": docs, "cached": None}
+        async for chunk in get_llm().astream(format_prompt(query, docs)):
+            if chunk.content:
+                answer += chunk.content
+                yield {"event": "token", "text": chunk.content}
+    await get_cpu_executor().run(
+        remember_answer, question, document_source, {"result": answer, "source_documents": docs},
+        time.perf_counter() - started, question_template,
+    )
+
+
+# One (question, document) pair to answer: question, document source,
+# templated query, and the positions in the batch that asked it
+_BatchPair = Tuple[str, Optional[str], str, List[int]]
+
+
+def _plan_batch(
+    questions: List[str],
+    document_sources: List[Optional[str]],
+    question_template: str,
+) -> Tuple[List[Dict[str, Any]], List[_BatchPair], Dict[str, np.ndarray]]:
+    """
+    Batch results served by the answer cache, the distinct pairs left to
+    answer, and the questions' cache vectors. When the cache holds entries
+    the questions are embedded in one call up front instead of once per pair.
+    """
+    cache = get_answer_cache()
+    vectors = cache.embed_many(questions) if cache is not None and len(cache) else {}
+    cached, pending = [], {}
+    for document_source in document_sources:
+        for index, question in enumerate(questions):
+            result = cached_answer(question, document_source, question_template, vector=vectors.get(question))
+            if result is not None:
+                cached.append(_batch_item(index, question, document_source, result))
+            else:
+                key = (question, document_source)
+                if key not in pending:
+                    pending[key] = (question, document_source, question_template.format(question=question), [])
+                pending[key][3].append(index)
+    return cached, list(pending.values()), vectors
+
+
+def _retrieve_batch(pending: List[_BatchPair]) -> List[List[Document]]:
+    """
+    Context for every pending pair: one embedding call for all distinct
+    queries, then one matrix search per document with the chain's retriever
+    settings, and assemble_context() per pair.
+    """
+    retriever = get_rag_chain().retriever
+    queries = list(dict.fromkeys(query for _, _, query, _ in pending))
+    row = {query: number for number, query in enumerate(queries)}
+    vectors = embed_queries(queries) if retriever.search_type != "lexical" and queries else None
+    by_source: Dict[Optional[str], List[int]] = {}
+    for number, (_, document_source, _, _) in enumerate(pending):
+        by_source.setdefault(document_source, []).append(number)
+    contexts: List[List[Document]] = [[] for _ in pending]
+    for document_source, numbers in by_source.items():
+        source_queries = [pending[number][2] for number in numbers]
+        results = get_store().batch_search(
+            source_queries,
+            k=retriever.k,
+            document_source=document_source,
+            search_type=retriever.search_type,
+            vectors=vectors[[row[query] for query in source_queries]] if vectors is not None else None,
+            nprobe=retriever.nprobe,
+            ef_search=retriever.ef_search,
+        )
+        for number, hits in zip(numbers, results):
+            contexts[number] = assemble_context([doc for doc, _ in hits])
+    return contexts
+
+
+def _batch_item(index: int, question: str, document_source: Optional[str], result: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "question": question,
+        "document_source": document_source,
+        "result": result["result"],
+        "source_documents": result["source_documents"],
+        "cached": result.get("cached"),
+    }
+
+
+def _pair_items(pair: _BatchPair, result: Optional[Dict[str, Any]], error: Optional[Exception]) -> List[Dict[str, Any]]:
+    question, document_source, _, indexes = pair
+    if error is not None:
+        return [
+            {"index": index, "question": question, "document_source": document_source, "error": str(error)}
+            for index in indexes
+        ]
+    return [_batch_item(index, question, document_source, result) for index in indexes]
+
+
+def answer_batch(
+    questions: List[str],
+    document_sources: Optional[List[Optional[str]]] = None,
+    question_template: str = QUESTION_TEMPLATE,
+    concurrency: int = BATCH_LLM_CONCURRENCY,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Ask every question of every document in ``document_sources`` (default:
+    the whole index) and yield each answer as soon as it is ready, as
+    {"index", "question", "document_source", "result", "source_documents",
+    "cached"}, where "index" is the question's position in ``questions``.
+    A pair that fails yields {"index", "question", "document_source",
+    "error"} instead of ending the batch.
+
+    Cached pairs are yielded first. The rest are retrieved together (see
+    _retrieve_batch), identical pairs are answered once, and at most
+    ``concurrency`` LLM calls run at a time.
+    """
+    document_sources = list(document_sources) if document_sources is not None else [None]
+    cached, pending, vectors = _plan_batch(list(questions), document_sources, question_template)
+    yield from cached
+    if not pending:
+        return
+    contexts = _retrieve_batch(pending)
+    llm = get_llm()
+
+    def generate(pair: _BatchPair, docs: List[Document]):
+        started = time.perf_counter()
+        answer = llm.invoke(format_prompt(pair[2], docs)).content
+        result = {"result": answer, "source_documents": docs}
+        remember_answer(pair[0], pair[1], result, time.perf_counter() - started, question_template,
+                        vector=vectors.get(pair[0]))
+        return dict(result, cached=None)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch-llm") as pool:
+        futures = {pool.submit(generate, pair, docs): pair for pair, docs in zip(pending, contexts)}
+        for future in as_completed(futures):
+            error = future.exception()
+            yield from _pair_items(futures[future], None if error else future.result(), error)
+
+
+async def aanswer_batch(
+    questions: List[str],
+    document_sources: Optional[List[Optional[str]]] = None,
+    question_template: str = QUESTION_TEMPLATE,
+    concurrency: int = BATCH_LLM_CONCURRENCY,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Async counterpart of answer_batch(), used by the batch API endpoint.
+    Cache lookups and retrieval run on the CPU pool; each LLM call also takes
+    a slot from the shared LLM limiter, so a batch cannot starve single
+    queries of more than ``concurrency`` slots. A pair rejected by a full
+    limiter is reported as an error item.
+    """
+    cpu = get_cpu_executor()
+    document_sources = list(document_sources) if document_sources is not None else [None]
+    cached, pending, vectors = await cpu.run(_plan_batch, list(questions), document_sources, question_template)
+    for item in cached:
+        yield item
+    if not pending:
+        return
+    contexts = await cpu.run(_retrieve_batch, pending)
+    llm = get_llm()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def generate(pair: _BatchPair, docs: List[Document]):
+        try:
+            async with semaphore:
+                started = time.perf_counter()
+                async with get_llm_limiter().slot():
+                    answer = (await llm.ainvoke(format_prompt(pair[2], docs))).content
+            result = {"result": answer, "source_documents": docs}
+            await cpu.run(remember_answer, pair[0], pair[1], result, time.perf_counter() - started, question_template,
+                          vector=vectors.get(pair[0]))
+            return _pair_items(pair, dict(result, cached=None), None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return _pair_items(pair, None, e)
+
+    tasks = [asyncio.ensure_future(generate(pair, docs)) for pair, docs in zip(pending, contexts)]
+    try:
+        for task in asyncio.as_completed(tasks):
+            for item in await task:
+                yield item
+    finally:
+        # The client went away: do not keep spending LLM calls on it
+        for task in tasks:
+            task.cancel()
@@ -1,27 +1,104 @@
-from typing import Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
 
-from langchain_community.vectorstores import FAISS
+from langchain.schema import Document
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.retrievers import BaseRetriever
 
-from modules.embeddings import get_embeddings
-from config import VECTORSTORE_PATH
+from modules.executor import get_cpu_executor
+from modules.shards import get_shard_router, get_store
+from modules.vectorstore import get_vectorstore
+from config import RETRIEVAL_MODE
 
+DEFAULT_K = 3
 
-def get_vectorstore():
-    embeddings = get_embeddings()
-    return FAISS.load_local(
-        VECTORSTORE_PATH,
-        embeddings,
-        allow_dangerous_deserialization=True,
-    )
+# Search function of the store (the vectorstore module, or the ShardRouter
+# fanning out to every shard) for each search type
+SEARCH_FUNCTIONS = {
+    "hybrid": "hybrid_search",
+    "vector": "similarity_search",
+    "lexical": "lexical_search",
+}
+
+# Document the current query is scoped to; set per call so a single chain
+# can serve filtered and unfiltered queries alike.
+_document_scope: ContextVar[Optional[str]] = ContextVar("document_scope", default=None)
+
+
+@contextmanager
+def document_scope(document_source: Optional[str]):
+    """Restrict retrievals made inside the block to one document source."""
+    token = _document_scope.set(document_source)
+    try:
+        yield
+    finally:
+        _document_scope.reset(token)
+
+
+class LegalRetriever(BaseRetriever):
+    """
+    Retriever over the shared vectorstore, or over every shard of it. Always
+    searches the current index generation and pre-filters by document source
+    inside the index (on that document's shard only).
+    ``search_type`` picks hybrid (BM25 + vector), vector or lexical search;
+    ``nprobe``/``ef_search`` tune IVF/HNSW indexes (None: config defaults).
+    """
+
+    k: int = DEFAULT_K
+    document_source: Optional[str] = None
+    search_type: str = RETRIEVAL_MODE
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+
+    def _search_kwargs(self):
+        if self.search_type == "lexical":
+            return {}
+        return {"nprobe": self.nprobe, "ef_search": self.ef_search}
+
+    def _search(self, query: str, document_source: Optional[str]) -> List[Document]:
+        search = getattr(get_store(), SEARCH_FUNCTIONS[self.search_type])
+        results = search(query, k=self.k, document_source=document_source, **self._search_kwargs())
+        return [doc for doc, _ in results]
 
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self._search(query, _document_scope.get() or self.document_source)
 
-def get_retriever(document_source: Optional[str] = None):
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # Query embedding and index search are CPU-bound: run them on the
+        # sized pool rather than the event loop or asyncio's default executor
+        return await get_cpu_executor().run(self._search, query, _document_scope.get() or self.document_source)
+
+
+def get_retriever(
+    document_source: Optional[str] = None,
+    search_type: str = RETRIEVAL_MODE,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    k: int = DEFAULT_K,
+):
     """
-    Build a retriever, optionally scoped to a specific document.
+    Build a retriever returning ``k`` chunks, optionally scoped to a specific document.
     """
-    vectorstore = get_vectorstore()
-    search_kwargs = {"k": 3}
-    if document_source:
-        # Filter by the full metadata source path stored in the vector store
-        search_kwargs["filter"] = {"source": document_source}
-    return vectorstore.as_retriever(search_kwargs=search_kwargs)
+    if search_type not in SEARCH_FUNCTIONS:
+        raise ValueError(f"Unknown search type {search_type!r}; expected one of {sorted(SEARCH_FUNCTIONS)}")
+    # Fail early if no index has been ingested yet
+    router = get_shard_router()
+    if router is None:
+        get_vectorstore()
+    elif not router.vectorstore_exists():
+        raise FileNotFoundError("No shard holds an index yet")
+    return LegalRetriever(
+        k=k,
+        document_source=document_source,
+        search_type=search_type,
+        nprobe=nprobe,
+        ef_search=ef_search,
+    )
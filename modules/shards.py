@@ -0,0 +1,586 @@
+"""
+Sharded vectorstore.
+
+With INDEX_SHARDS > 1 the corpus is split over that many independent
+segmented stores (VECTORSTORE_PATH/shards/shard-NN), each holding whole
+documents: a document's shard is a stable hash of its source, so searches
+scoped to one document touch one shard and deletes and re-uploads stay
+local to it. Every shard is owned by a node process (serve_shard) that keeps
+its index in memory and answers requests on a socket: a Unix socket next to
+the shard for local nodes, or the host:port in SHARD_ADDRESSES for nodes on
+other machines. Shards search in parallel on separate cores, and no process
+has to hold more than its shard in RAM.
+
+ShardRouter offers the vectorstore functions the rest of the code uses:
+writes go to the document's shard, searches embed the query once, fan out
+to the shards and merge their top-k. A shard that has not answered by the
+deadline is left out, so one slow node delays a query by at most that much.
+
+Messages are JSON, with vectors sent as a raw float32 frame after them;
+nothing received from a node is unpickled. Connections are authenticated:
+local nodes with a random key kept in the shards directory (readable only
+by its owner), TCP nodes with SHARD_AUTHKEY, which has no default; neither
+a node nor a router will use a TCP address unless it is set.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+
+from modules import catalog  # noqa: F401  (registers the merge listener that keeps catalogued positions current)
+from modules import vectorstore
+from modules.telemetry import REGISTRY, span
+from config import (
+    CPU_WORKERS,
+    HYBRID_CANDIDATES,
+    INDEX_SHARDS,
+    RETRIEVAL_MODE,
+    SHARD_ADDRESSES,
+    SHARD_AUTHKEY,
+    SHARD_DEADLINE_MS,
+)
+
+SHARDS_DIR = "shards"
+LAYOUT_FILE = "shards.json"
+SOCKET_FILE = "node.sock"
+KEY_FILE = "node.key"
+
+SHARD_SECONDS = REGISTRY.histogram("legalview_shard_request_seconds", "Shard node round trips", ["shard", "op"])
+SHARD_TIMEOUTS = REGISTRY.counter("legalview_shard_timeouts_total", "Searches a shard did not answer by the deadline", ["shard"])
+SHARD_ERRORS = REGISTRY.counter("legalview_shard_errors_total", "Shard requests that failed", ["shard"])
+
+
+logger = logging.getLogger(__name__)
+
+
+class ShardError(RuntimeError):
+    """A shard node could not be reached or failed the request."""
+
+
+class ShardTimeout(ShardError):
+    """A shard node did not answer before the deadline."""
+
+
+def shard_for(source: Optional[str], count: int = INDEX_SHARDS) -> int:
+    """The shard holding ``source``: a hash that is the same in every process and on every machine."""
+    return zlib.crc32((source or "").encode("utf-8")) % count
+
+
+def shard_path(shard: int) -> str:
+    return os.path.join(vectorstore.VECTORSTORE_PATH, SHARDS_DIR, f"shard-{shard:02d}")
+
+
+def node_address(shard: int, addresses: Optional[List[str]] = None):
+    """The address of the node serving ``shard``: host:port from ``addresses``, else its local socket."""
+    addresses = SHARD_ADDRESSES if addresses is None else addresses
+    if addresses:
+        host, port = addresses[shard].rsplit(":", 1)
+        return host, int(port)
+    return os.path.join(shard_path(shard), SOCKET_FILE)
+
+
+def local_authkey() -> bytes:
+    """The key of this store's local nodes, created on first use with owner-only permissions."""
+    path = os.path.join(vectorstore.VECTORSTORE_PATH, SHARDS_DIR, KEY_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    with open(path) as f:
+        key = f.read().strip()
+    if not key:
+        raise ShardError(f"{path} is empty; remove it to generate a new key")
+    return key.encode()
+
+
+def authkey_for(address) -> bytes:
+    """
+    The key for connections to ``address``: SHARD_AUTHKEY for host:port
+    addresses, which refuse to run without it, else the local node key.
+    """
+    if isinstance(address, str):
+        return SHARD_AUTHKEY or local_authkey()
+    if not SHARD_AUTHKEY:
+        raise ValueError(f"Shard node at {address[0]}:{address[1]} needs SHARD_AUTHKEY to be set; it has no default")
+    return SHARD_AUTHKEY
+
+
+def _check_layout(count: int):
+    """Record the shard count on first use; documents are placed by it, so it cannot change in place."""
+    path = os.path.join(vectorstore.VECTORSTORE_PATH, SHARDS_DIR, LAYOUT_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with open(path) as f:
+            recorded = json.load(f)["count"]
+    except FileNotFoundError:
+        vectorstore._atomic_write(path, json.dumps({"count": count}))
+        return
+    if recorded != count:
+        raise ValueError(
+            f"{os.path.dirname(path)} holds {recorded} shards but INDEX_SHARDS is {count}; "
+            "re-ingest into an empty VECTORSTORE_PATH to change the shard count"
+        )
+
+
+def _send(conn: Connection, message: Dict[str, Any], array: Optional[np.ndarray] = None):
+    if array is not None:
+        array = np.ascontiguousarray(array, dtype=np.float32)
+        message = dict(message, array=list(array.shape))
+    conn.send_bytes(json.dumps(message).encode("utf-8"))
+    if array is not None:
+        conn.send_bytes(array.tobytes())
+
+
+def _recv(conn: Connection) -> Tuple[Dict[str, Any], Optional[np.ndarray]]:
+    message = json.loads(conn.recv_bytes())
+    array = None
+    if "array" in message:
+        array = np.frombuffer(conn.recv_bytes(), dtype=np.float32).reshape(message.pop("array"))
+    return message, array
+
+
+def _doc_to_wire(doc: Document) -> Dict[str, Any]:
+    return {"text": doc.page_content, "metadata": doc.metadata, "id": doc.id}
+
+
+def _doc_from_wire(data: Dict[str, Any]) -> Document:
+    return Document(page_content=data["text"], metadata=data["metadata"], id=data.get("id"))
+
+
+# Node side: one process per shard, serving requests against its own store
+
+
+def _handle_search(message, vectors):
+    if not vectorstore.vectorstore_exists():
+        return {"results": [[] for _ in message["queries"]]}, None
+    results = vectorstore.batch_search(
+        message["queries"],
+        k=message["k"],
+        document_source=message.get("document_source"),
+        search_type=message["search_type"],
+        vectors=vectors,
+        candidates=message["candidates"],
+        nprobe=message.get("nprobe"),
+        ef_search=message.get("ef_search"),
+    )
+    return {"results": [[[_doc_to_wire(doc), score] for doc, score in hits] for hits in results]}, None
+
+
+def _handle_vectors(message, _):
+    return {}, vectorstore.document_vectors([_doc_from_wire(doc) for doc in message["docs"]])
+
+
+def _handle_add(message, vectors):
+    docs = [_doc_from_wire(doc) for doc in message["docs"]]
+    return {"generation": vectorstore.add_embedded_documents(docs, vectors, schedule=message["schedule"])}, None
+
+
+def _handle_replace(message, vectors):
+    docs = [_doc_from_wire(doc) for doc in message["docs"]]
+    return {"indexed": vectorstore.replace_document(message["source"], docs, vectors)}, None
+
+
+def _handle_current(message, _):
+    docs = [_doc_from_wire(doc) for doc in message["docs"]]
+    return {"current": vectorstore.is_document_current(message["source"], docs)}, None
+
+
+def _handle_sources(message, _):
+    return {"sources": vectorstore.list_sources() if vectorstore.vectorstore_exists() else []}, None
+
+
+_HANDLERS = {
+    "search": _handle_search,
+    "vectors": _handle_vectors,
+    "add": _handle_add,
+    "replace": _handle_replace,
+    "current": _handle_current,
+    "sources": _handle_sources,
+    "delete": lambda message, _: ({"removed": vectorstore.delete_document(message["source"])}, None),
+    "fingerprint": lambda message, _: ({"fingerprint": vectorstore.document_fingerprint(message["source"])}, None),
+    "ranges": lambda message, _: ({"ranges": vectorstore.document_ranges(message["source"])}, None),
+    "exists": lambda message, _: ({"exists": vectorstore.vectorstore_exists()}, None),
+    "merge": lambda message, _: ({"merged": vectorstore.merge_segments(rebuild=message.get("rebuild"))}, None),
+}
+
+
+def _serve_connection(conn: Connection):
+    with conn:
+        while True:
+            try:
+                message, array = _recv(conn)
+            except (EOFError, OSError):
+                return
+            try:
+                response, array = _HANDLERS[message["op"]](message, array)
+            except Exception as e:
+                response, array = {"error": f"{type(e).__name__}: {e}"}, None
+            try:
+                _send(conn, response, array)
+            except (BrokenPipeError, OSError):
+                return  # the client gave up on this request (deadline) and closed the connection
+
+
+def serve_shard(shard: int, path: str, address, authkey: Optional[bytes] = None):
+    """
+    Run a shard node: open the store at ``path`` and answer requests on
+    ``address`` until the process is stopped. Each client connection is
+    served by its own thread; the store's own locks order the requests.
+    ``authkey`` defaults to authkey_for(address).
+    """
+    authkey = authkey or authkey_for(address)
+    vectorstore.VECTORSTORE_PATH = path  # this process serves only this shard
+    os.makedirs(path, exist_ok=True)
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)  # left by a node that was killed
+    vectorstore.start_snapshot_watcher()
+    with Listener(address, authkey=authkey) as listener:
+        print(f"🧩 Shard {shard} serving {path} on {address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                continue  # a client failed authentication or hung up while connecting
+            threading.Thread(target=_serve_connection, args=(conn,), name=f"shard-{shard}-conn", daemon=True).start()
+
+
+# Client side
+
+
+class ShardClient:
+    """Connections to one shard node, one per calling thread."""
+
+    def __init__(self, shard: int, address, authkey: Optional[bytes] = None):
+        self.shard = shard
+        self.address = address
+        self.authkey = authkey or authkey_for(address)
+        self._local = threading.local()
+
+    def _connection(self) -> Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                conn = Client(self.address, authkey=self.authkey)
+            except OSError as e:
+                SHARD_ERRORS.inc(shard=str(self.shard))
+                raise ShardError(f"Shard {self.shard} node at {self.address} is not reachable: {e}") from e
+            self._local.conn = conn
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def call(self, op: str, array: Optional[np.ndarray] = None, timeout: Optional[float] = None, **fields):
+        """
+        Send one request and wait up to ``timeout`` seconds (None: no limit)
+        for the reply. Returns the reply and its vectors, if any.
+        """
+        started = time.perf_counter()
+        conn = self._connection()
+        try:
+            _send(conn, dict(fields, op=op), array)
+            if timeout is not None and not conn.poll(max(0.0, timeout - (time.perf_counter() - started))):
+                # The late reply would be read as the answer to the next request
+                self._drop()
+                raise ShardTimeout(f"Shard {self.shard} did not answer {op} within {timeout * 1000:.0f} ms")
+            message, array = _recv(conn)
+        except (EOFError, OSError) as e:
+            self._drop()
+            SHARD_ERRORS.inc(shard=str(self.shard))
+            raise ShardError(f"Shard {self.shard} connection failed: {e}") from e
+        SHARD_SECONDS.observe(time.perf_counter() - started, shard=str(self.shard), op=op)
+        if "error" in message:
+            SHARD_ERRORS.inc(shard=str(self.shard))
+            raise ShardError(f"Shard {self.shard}: {message['error']}")
+        return message, array
+
+
+class ShardRouter:
+    """
+    The sharded store, with the same functions as modules.vectorstore for
+    what callers outside it use. Writes for a document go to its shard;
+    searches fan out (or go to one shard when scoped to a document) and are
+    merged by score.
+    """
+
+    def __init__(self, count: int = INDEX_SHARDS, addresses: Optional[List[str]] = None,
+                 deadline_ms: float = SHARD_DEADLINE_MS):
+        addresses = SHARD_ADDRESSES if addresses is None else addresses
+        if addresses and len(addresses) != count:
+            raise ValueError(f"SHARD_ADDRESSES lists {len(addresses)} nodes for {count} shards")
+        if not addresses:
+            _check_layout(count)
+        self.count = count
+        self.deadline = deadline_ms / 1000
+        self.clients = [ShardClient(shard, node_address(shard, addresses)) for shard in range(count)]
+        # Enough threads for a fan-out per CPU worker at once; each keeps its own node connections
+        self._pool = ThreadPoolExecutor(max_workers=count * CPU_WORKERS, thread_name_prefix="shard-fanout")
+
+    def client(self, source: Optional[str]) -> ShardClient:
+        return self.clients[shard_for(source, self.count)]
+
+    def _by_shard(self, items, source_of) -> Dict[int, List[int]]:
+        groups: Dict[int, List[int]] = {}
+        for number, item in enumerate(items):
+            groups.setdefault(shard_for(source_of(item), self.count), []).append(number)
+        return groups
+
+    def _all(self, op: str, **fields) -> List[Dict[str, Any]]:
+        """Ask every shard, in parallel and without a deadline (writes and maintenance)."""
+        futures = [self._pool.submit(client.call, op, **fields) for client in self.clients]
+        return [future.result()[0] for future in futures]
+
+    # Reads
+
+    def vectorstore_exists(self) -> bool:
+        try:
+            return any(reply["exists"] for reply in self._all("exists"))
+        except ShardError:
+            return False
+
+    def list_sources(self) -> List[str]:
+        return sorted(source for reply in self._all("sources") for source in reply["sources"])
+
+    def document_fingerprint(self, source: str) -> Optional[str]:
+        return self.client(source).call("fingerprint", source=source)[0]["fingerprint"]
+
+    def document_ranges(self, source: str) -> List[List[int]]:
+        """Positions of a document's vectors within its shard's index."""
+        return self.client(source).call("ranges", source=source)[0]["ranges"]
+
+    def is_document_current(self, source: str, chunks: List[Document]) -> bool:
+        return self.client(source).call("current", source=source, docs=[_doc_to_wire(chunk) for chunk in chunks])[0]["current"]
+
+    def batch_search(
+        self,
+        queries: List[str],
+        k: int = 4,
+        document_source: Optional[str] = None,
+        search_type: str = RETRIEVAL_MODE,
+        vectors: Optional[np.ndarray] = None,
+        candidates: int = HYBRID_CANDIDATES,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        vectorstore.batch_search over the shards: queries are embedded once
+        here, each shard returns its own top-k, and the lists are merged by
+        score (distance ascending for "vector", fused or BM25 score
+        descending otherwise). Shards that miss the deadline or fail are
+        skipped. If none answered, the first shard's error is raised, or
+        ShardTimeout if they were all late. BM25 statistics are
+        per shard, so lexical scores are close to, not exactly, those of a
+        single index.
+        """
+        if search_type not in ("vector", "lexical", "hybrid"):
+            raise ValueError(f"Unknown search type {search_type!r}")
+        if not queries:
+            return []
+        if search_type != "lexical" and vectors is None:
+            with span("embed_query", queries=len(queries)):
+                vectors = vectorstore.embed_queries(queries)
+        clients = [self.client(document_source)] if document_source is not None else self.clients
+        fields = {
+            "queries": list(queries), "k": k, "document_source": document_source, "search_type": search_type,
+            "candidates": candidates, "nprobe": nprobe, "ef_search": ef_search,
+        }
+        with span("vector_search", mode=search_type, k=k, queries=len(queries), shards=len(clients)):
+            futures = {
+                self._pool.submit(client.call, "search", vectors, self.deadline, **fields): client.shard
+                for client in clients
+            }
+            done, late = wait(futures, timeout=self.deadline)
+            replies, errors = [], []
+            for future in done:
+                try:
+                    replies.append(future.result()[0]["results"])
+                except ShardTimeout:
+                    late.add(future)
+                except ShardError as e:
+                    # Counted in legalview_shard_errors_total by the client
+                    logger.warning("Search skipped shard %s: %s", futures[future], e)
+                    errors.append(e)
+            for future in late:
+                SHARD_TIMEOUTS.inc(shard=str(futures[future]))
+            if not replies:
+                if errors:
+                    raise errors[0]
+                raise ShardTimeout(f"No shard answered within {self.deadline * 1000:.0f} ms")
+        merged = []
+        for number in range(len(queries)):
+            hits = [(_doc_from_wire(doc), score) for results in replies for doc, score in results[number]]
+            hits.sort(key=lambda hit: hit[1], reverse=search_type != "vector")
+            merged.append(hits[:k])
+        return merged
+
+    def similarity_search(self, query: str, k: int = 4, document_source: Optional[str] = None,
+                          nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        return self.batch_search([query], k, document_source, "vector", nprobe=nprobe, ef_search=ef_search)[0]
+
+    def hybrid_search(self, query: str, k: int = 4, document_source: Optional[str] = None,
+                      candidates: int = HYBRID_CANDIDATES, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        return self.batch_search([query], k, document_source, "hybrid", candidates=candidates,
+                                 nprobe=nprobe, ef_search=ef_search)[0]
+
+    def lexical_search(self, query: str, k: int = 4, document_source: Optional[str] = None):
+        return self.batch_search([query], k, document_source, "lexical")[0]
+
+    def document_vectors(self, docs: List[Document]) -> np.ndarray:
+        """Stored vectors of search results, read from the shard each came from."""
+        vectors = None
+        for shard, numbers in self._by_shard(docs, lambda doc: doc.metadata.get("source")).items():
+            _, found = self.clients[shard].call("vectors", docs=[_doc_to_wire(docs[number]) for number in numbers])
+            if vectors is None:
+                vectors = np.empty((len(docs), found.shape[1]), dtype=np.float32)
+            vectors[numbers] = found
+        return vectors if vectors is not None else np.empty((0, 0), dtype=np.float32)
+
+    # Writes
+
+    def add_embedded_documents(self, chunks: List[Document], vectors, schedule: bool = True) -> int:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        generation = 0
+        for shard, numbers in self._by_shard(chunks, lambda chunk: chunk.metadata.get("source")).items():
+            reply, _ = self.clients[shard].call(
+                "add", vectors[numbers], docs=[_doc_to_wire(chunks[number]) for number in numbers], schedule=schedule
+            )
+            generation = max(generation, reply["generation"])
+        return generation
+
+    def replace_document(self, source: str, chunks: List[Document], vectors=None) -> int:
+        if vectors is None:
+            vectors = vectorstore.get_embeddings().embed_documents([chunk.page_content for chunk in chunks])
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(chunks), -1)
+        docs = [_doc_to_wire(chunk) for chunk in chunks]
+        return self.client(source).call("replace", vectors, source=source, docs=docs)[0]["indexed"]
+
+    def delete_document(self, source: str) -> int:
+        return self.client(source).call("delete", source=source)[0]["removed"]
+
+    def merge_segments(self, rebuild: Optional[bool] = None) -> bool:
+        return any(reply["merged"] for reply in self._all("merge", rebuild=rebuild))
+
+    def rebuild_index(self) -> bool:
+        return self.merge_segments(rebuild=True)
+
+
+class ShardNodes:
+    """
+    Local node processes for the shards this machine serves. Shards with a
+    node already answering (e.g. started by the backend while ingest.py
+    runs) are left alone, and nothing is started for remote SHARD_ADDRESSES.
+    """
+
+    def __init__(self, count: int = INDEX_SHARDS, authkey: Optional[bytes] = None):
+        self.count = count
+        self.authkey = authkey
+        self._context = multiprocessing.get_context("spawn")  # no inherited FAISS/torch threads
+        self._processes: List[Any] = []
+
+    def _answering(self, shard: int) -> bool:
+        try:
+            ShardClient(shard, node_address(shard), self.authkey).call("exists", timeout=1.0)
+        except ShardError:
+            return False
+        return True
+
+    def start(self, timeout: float = 60.0):
+        if SHARD_ADDRESSES:
+            return
+        _check_layout(self.count)
+        self.authkey = self.authkey or authkey_for(node_address(0))
+        starting = []
+        for shard in range(self.count):
+            if self._answering(shard):
+                continue
+            process = self._context.Process(
+                target=serve_shard, args=(shard, shard_path(shard), node_address(shard), self.authkey),
+                name=f"shard-node-{shard}", daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+            starting.append(shard)
+        deadline = time.monotonic() + timeout
+        for shard in starting:
+            while not self._answering(shard):
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise ShardError(f"Shard {shard} node did not start within {timeout:.0f}s")
+                time.sleep(0.05)
+
+    def stop(self, timeout: float = 5.0):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join(timeout)
+        self._processes = []
+
+    def stats(self) -> Dict[str, int]:
+        return {"shards": self.count, "local_nodes": sum(process.is_alive() for process in self._processes)}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+_router: Optional[ShardRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_shard_router() -> Optional[ShardRouter]:
+    """The process-wide ShardRouter, or None when the index is not sharded."""
+    global _router
+    if INDEX_SHARDS <= 1:
+        return None
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ShardRouter()
+    return _router
+
+
+def get_store():
+    """The store to read and write through: the ShardRouter when sharded, else the vectorstore module."""
+    return get_shard_router() or vectorstore
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve vectorstore shards")
+    parser.add_argument("--shard", type=int, help="serve only this shard, in the foreground (for one node per machine)")
+    parser.add_argument("--port", type=int, help="TCP port for --shard instead of the local socket (needs SHARD_AUTHKEY)")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on with --port (default: %(default)s)")
+    args = parser.parse_args()
+    if args.shard is not None:
+        address = (args.host, args.port) if args.port else node_address(args.shard, [])
+        serve_shard(args.shard, shard_path(args.shard), address)
+    else:
+        nodes = ShardNodes()
+        nodes.start()
+        print(f"Serving {INDEX_SHARDS} shards; Ctrl+C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            nodes.stop()
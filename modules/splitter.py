@@ -1,5 +1,37 @@
+from typing import Iterable, Iterator, Optional
+
+from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-def split_documents(documents):
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    return splitter.split_documents(documents)
+from modules.legal_splitter import LegalStructureSplitter
+from config import SPLITTER_MODE, CHUNK_SIZE, CHUNK_OVERLAP, LEGAL_CHUNK_OVERLAP
+
+SPLITTER_MODES = ("recursive", "legal")
+
+
+def get_splitter(mode: Optional[str] = None):
+    """
+    "recursive": fixed-size character windows with CHUNK_OVERLAP.
+    "legal": clause-aligned chunks with section metadata (see modules.legal_splitter).
+    """
+    mode = mode or SPLITTER_MODE
+    if mode == "recursive":
+        return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    if mode == "legal":
+        return LegalStructureSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=LEGAL_CHUNK_OVERLAP)
+    raise ValueError(f"Unknown splitter mode {mode!r}; expected one of {SPLITTER_MODES}")
+
+
+def split_documents(documents, mode: Optional[str] = None):
+    return get_splitter(mode).split_documents(documents)
+
+
+def iter_split(documents: Iterable[Document], mode: Optional[str] = None) -> Iterator[Document]:
+    """
+    Split documents as they arrive. Chunks never span documents (PDF pages),
+    so this yields the same chunks as split_documents() without waiting for
+    the last page.
+    """
+    splitter = get_splitter(mode)
+    for document in documents:
+        yield from splitter.split_documents([document])
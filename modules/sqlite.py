@@ -0,0 +1,51 @@
+"""
+SQLite plumbing shared by the persistent stores (job queue, document
+catalog, term index, summary trees).
+
+Each store keeps one connection per thread, in autocommit mode with WAL
+journaling so readers do not wait for the writer. Writes go through
+``_transaction()``, which takes the database's write lock up front
+(BEGIN IMMEDIATE): a read-then-write in one transaction cannot be
+interleaved with another process's.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Tuple
+
+
+class SQLiteStore:
+    """A database file created with ``schema``; subclasses add the queries."""
+
+    # Extra per-connection pragmas, e.g. ("foreign_keys=ON",)
+    PRAGMAS: Tuple[str, ...] = ()
+
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(schema)
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            for pragma in ("journal_mode=WAL", "synchronous=NORMAL", *self.PRAGMAS):
+                db.execute(f"PRAGMA {pragma}")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
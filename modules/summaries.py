@@ -0,0 +1,626 @@
+"""
+Precomputed hierarchical document summaries.
+
+Ingestion hands each document's chunks to the summary store, which cuts
+them into sections and queues the document. A background worker then
+builds a summary tree (map-reduce): every section is summarized on its
+own, then groups of about SUMMARY_FANOUT summaries are combined, level
+by level, into one document summary at the root. Summaries of one level are
+generated in parallel, at most SUMMARY_LLM_CONCURRENCY at a time. The
+tree is kept in SQLite, so "Document Summary" questions are answered from
+it without retrieval or an LLM call.
+
+Every node is stored with a hash of its input (a section's text, or its
+children's summaries). When a document is uploaded again, nodes whose
+input is unchanged are reused, and only changed sections and the nodes
+above them are summarized again. Section boundaries depend only on the
+chunks' contents (structural labels, plus a hash-chosen cut point), and so
+do the boundaries of the groups combined above them, so an edit moves at
+most the boundaries next to it.
+
+Builds are claimed like ingestion jobs: the worker refreshes the
+document's heartbeat after every summary it generates, a build whose
+worker goes silent for JOB_STALE_SECONDS is claimed again, and a failed
+build is retried with backoff until JOB_MAX_ATTEMPTS is reached.
+
+SUMMARY_BACKEND=stub replaces the LLM with a deterministic local
+summarizer that keeps the leading sentences of its input, for tests and
+offline runs.
+"""
+import os
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from modules.embedding_cache import content_hash
+from modules.sqlite import SQLiteStore
+from modules.telemetry import REGISTRY, span
+from config import (
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_INTERVAL,
+    JOB_RETRY_DELAY,
+    JOB_STALE_SECONDS,
+    SUMMARIES_DB_PATH,
+    SUMMARY_BACKEND,
+    SUMMARY_FANOUT,
+    SUMMARY_LLM_CONCURRENCY,
+    SUMMARY_SECTION_CHUNKS,
+    SUMMARY_WORKERS,
+)
+
+QUEUED, RUNNING, READY, FAILED = "queued", "running", "ready", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    source TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    sections INTEGER NOT NULL,
+    llm_calls INTEGER,
+    error TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    queued_at REAL NOT NULL,
+    available_at REAL NOT NULL DEFAULT 0,
+    heartbeat_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS documents_status ON documents (status, queued_at);
+CREATE TABLE IF NOT EXISTS sections (
+    source TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (source, position)
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    source TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    PRIMARY KEY (source, level, position)
+);
+"""
+
+SECTION_PROMPT = """Summarize this section of a legal document in at most 5 sentences. Keep the parties, obligations, amounts, dates and conditions; do not add anything that is not in the text.
+
+Section: {label}
+
+{text}
+
+Summary:"""
+
+COMBINE_PROMPT = """Below are summaries of consecutive sections of a legal document. Combine them into one summary of at most 8 sentences that covers the main parties, obligations, rights, amounts and dates; do not add anything that is not in the summaries.
+
+{text}
+
+Combined summary:"""
+
+SUMMARY_LLM_CALLS = REGISTRY.counter("legalview_summary_llm_calls_total", "Summaries generated, by tree level kind", ["kind"])
+SUMMARY_REUSED = REGISTRY.counter("legalview_summary_nodes_reused_total", "Summary tree nodes reused from an earlier build")
+SUMMARY_SECONDS = REGISTRY.histogram("legalview_summary_build_seconds", "Time to build one document's summary tree")
+
+# Words that ask for a summary rather than name what to summarize
+_GENERIC = {
+    "summary", "summarize", "summarise", "overview", "document", "documents", "contract", "agreement", "the", "this",
+    "main", "key", "important", "all", "whole", "entire", "clauses", "clause", "sections", "section", "points",
+    "terms", "provisions", "and", "of", "in", "from", "its", "what", "give", "please", "brief", "short",
+}
+_WORD = re.compile(r"[a-z][a-z0-9-]{2,}")
+_FIRST_SENTENCES = re.compile(r"(?<=[.;:])\s+")
+
+
+# Sections
+
+
+def _top_label(chunk: Document) -> Optional[str]:
+    path = chunk.metadata.get("section_path")
+    return path.split(" > ")[0] if path else None
+
+
+def _cuts_after(chunk: Document, section_chunks: int) -> bool:
+    """A content-defined boundary: about one chunk in ``section_chunks`` ends a section."""
+    return int(content_hash(chunk.page_content)[:8], 16) % section_chunks == 0
+
+
+def _pages_label(chunks: List[Document], number: int) -> str:
+    pages = [chunk.metadata["page"] for chunk in chunks if chunk.metadata.get("page") is not None]
+    if not pages:
+        return f"Part {number + 1}"
+    first, last = min(pages) + 1, max(pages) + 1
+    return f"Page {first}" if first == last else f"Pages {first}–{last}"
+
+
+def split_sections(chunks: Iterable[Document], section_chunks: int = SUMMARY_SECTION_CHUNKS) -> List[Tuple[str, str]]:
+    """
+    (label, text) sections of a document's chunks, in order. A section ends
+    where the top-level structural label (legal splitter) changes, or after
+    at least half of ``section_chunks`` chunks at a content-defined cut,
+    and never holds more than four times ``section_chunks`` chunks.
+    """
+    groups: List[List[Document]] = []
+    current: List[Document] = []
+    for chunk in chunks:
+        if current and _top_label(chunk) != _top_label(current[-1]):
+            groups.append(current)
+            current = []
+        current.append(chunk)
+        if len(current) >= 4 * section_chunks or (
+            len(current) >= max(1, section_chunks // 2) and _cuts_after(chunk, section_chunks)
+        ):
+            groups.append(current)
+            current = []
+    if current:
+        groups.append(current)
+    return [
+        (_top_label(group[0]) or _pages_label(group, number), "\n".join(chunk.page_content.strip() for chunk in group))
+        for number, group in enumerate(groups)
+    ]
+
+
+# Summarizers
+
+
+class StubSummarizer:
+    """Deterministic local stand-in for the LLM: the leading sentences of its input."""
+
+    def __init__(self, words: int = 40):
+        self.words = words
+
+    def _lead(self, text: str) -> str:
+        words = " ".join(_FIRST_SENTENCES.split(text.strip())[:2]).split()
+        return " ".join(words[:self.words])
+
+    def summarize_section(self, label: str, text: str) -> str:
+        return self._lead(re.sub(r"\s+", " ", text))
+
+    def combine(self, summaries: List[Tuple[str, str]]) -> str:
+        return " ".join(self._lead(summary) for _, summary in summaries)
+
+
+class LLMSummarizer:
+    """Summaries from the chat model used for answers."""
+
+    def _complete(self, prompt: str) -> str:
+        from modules.rag_chain import get_llm  # the chain imports this module
+
+        return get_llm().invoke(prompt).content.strip()
+
+    def summarize_section(self, label: str, text: str) -> str:
+        return self._complete(SECTION_PROMPT.format(label=label, text=text))
+
+    def combine(self, summaries: List[Tuple[str, str]]) -> str:
+        return self._complete(COMBINE_PROMPT.format(text="\n\n".join(f"{label}: {summary}" for label, summary in summaries)))
+
+
+_summarizer = None
+
+
+def get_summarizer():
+    global _summarizer
+    if _summarizer is None:
+        _summarizer = StubSummarizer() if SUMMARY_BACKEND == "stub" else LLMSummarizer()
+    return _summarizer
+
+
+# Tree
+
+# (level, position, label, input hash, summary)
+Node = Tuple[int, int, str, str, str]
+
+
+def _combine_groups(last_sections: List[str], level: int, fanout: int) -> List[Tuple[int, int]]:
+    """
+    (start, stop) ranges of the nodes combined into each node of ``level``,
+    given the input hash of the last section under every node below. A
+    group ends after a node whose last section meets a content-defined
+    condition for this level (about one node in ``fanout``), or at twice
+    ``fanout`` nodes. Boundaries thus depend on the sections, not on
+    positions or regenerated summaries: inserting or removing a section
+    changes only the group holding it, at every level. At most ``fanout``
+    nodes form one group; if every node is a cut, fixed groups of ``fanout``
+    are used so the level still shrinks.
+    """
+    count = len(last_sections)
+    if count <= fanout:
+        return [(0, count)]
+    ranges: List[Tuple[int, int]] = []
+    start = 0
+    for position, section_hash in enumerate(last_sections):
+        if position + 1 - start >= 2 * fanout or int(content_hash(f"{level}\0{section_hash}")[:8], 16) % fanout == 0:
+            ranges.append((start, position + 1))
+            start = position + 1
+    if start < count:
+        ranges.append((start, count))
+    if len(ranges) == count:
+        return [(start, min(start + fanout, count)) for start in range(0, count, fanout)]
+    return ranges
+
+
+def build_tree(
+    sections: List[Tuple[str, str, str]],
+    previous: Dict[Tuple[int, str], str],
+    summarizer,
+    concurrency: int = SUMMARY_LLM_CONCURRENCY,
+    fanout: int = SUMMARY_FANOUT,
+    progress: Optional[Callable[[], None]] = None,
+) -> Tuple[List[Node], int]:
+    """
+    Map-reduce ``sections`` ((label, input hash, text)) into summary tree
+    nodes, reusing ``previous`` summaries by (level, input hash). Returns
+    the nodes, level by level (the last one is the root), and how many
+    summaries were generated. ``progress()`` is called after each one.
+    """
+    nodes: List[Node] = []
+    calls = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="summary") as pool:
+
+        def run_level(level, inputs, generate):
+            """inputs: (label, input hash, payload); generate(label, payload) -> summary"""
+            nonlocal calls
+
+            def generated(label, payload):
+                summary = generate(label, payload)
+                if progress is not None:
+                    progress()
+                return summary
+
+            futures = {}
+            for position, (label, input_hash, payload) in enumerate(inputs):
+                if (level, input_hash) in previous:
+                    SUMMARY_REUSED.inc()
+                else:
+                    futures[position] = pool.submit(generated, label, payload)
+            calls += len(futures)
+            level_nodes = [
+                (level, position, label, input_hash,
+                 futures[position].result() if position in futures else previous[(level, input_hash)])
+                for position, (label, input_hash, _) in enumerate(inputs)
+            ]
+            nodes.extend(level_nodes)
+            return level_nodes
+
+        current = run_level(0, sections, summarizer.summarize_section)
+        SUMMARY_LLM_CALLS.inc(calls, kind="section")
+        last_sections = [input_hash for _, input_hash, _ in sections]
+        level = 0
+        while len(current) > 1:
+            level += 1
+            ranges = _combine_groups(last_sections, level, fanout)
+            last_sections = [last_sections[stop - 1] for _, stop in ranges]
+            inputs = []
+            for group in (current[start:stop] for start, stop in ranges):
+                label = group[0][2] if len(group) == 1 else f"{group[0][2]} – {group[-1][2]}"
+                children = [(node[2], node[4]) for node in group]
+                input_hash = content_hash("\0".join(f"{node[3]}:{node[4]}" for node in group))
+                inputs.append((label, input_hash, children))
+            before = calls
+            current = run_level(level, inputs, lambda label, children: summarizer.combine(children))
+            SUMMARY_LLM_CALLS.inc(calls - before, kind="combine")
+    return nodes, calls
+
+
+class SummaryStore(SQLiteStore):
+    """Sections, build queue and summary trees of every document."""
+
+    def __init__(self, path: str = SUMMARIES_DB_PATH):
+        super().__init__(path, _SCHEMA)
+
+    def submit(self, source: str, chunks: Iterable[Document]) -> bool:
+        """
+        Store ``source``'s sections and queue its tree for (re)building.
+        Returns False, queueing nothing, if the sections are those of the
+        tree already built.
+        """
+        # Hashed without the label: a section that only moved (its "Part 3" or
+        # "Pages 4–6" label shifted) keeps its summary
+        sections = [(label, content_hash(text), text) for label, text in split_sections(chunks)]
+        with self._transaction() as db:
+            document = db.execute("SELECT status FROM documents WHERE source = ?", (source,)).fetchone()
+            stored = [tuple(row) for row in db.execute(
+                "SELECT label, input_hash FROM sections WHERE source = ? ORDER BY position", (source,)
+            )]
+            if document is not None and document["status"] == READY and stored == [section[:2] for section in sections]:
+                return False
+            db.execute("DELETE FROM sections WHERE source = ?", (source,))
+            db.executemany(
+                "INSERT INTO sections (source, position, label, input_hash, text) VALUES (?, ?, ?, ?, ?)",
+                [(source, position, label, input_hash, text) for position, (label, input_hash, text) in enumerate(sections)],
+            )
+            now = time.time()
+            db.execute(
+                "INSERT INTO documents (source, status, sections, queued_at, available_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(source) DO UPDATE SET status = excluded.status, sections = excluded.sections, "
+                "error = NULL, attempts = 0, queued_at = excluded.queued_at, available_at = excluded.available_at",
+                (source, QUEUED, len(sections), now, now),
+            )
+        return True
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """
+        Mark the longest-queued runnable document as being built by
+        ``worker`` and return it, or None. Builds whose worker went silent
+        are queued again, or failed once their attempts are used up.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            stale = now - JOB_STALE_SECONDS
+            db.execute(
+                "UPDATE documents SET status = ?, error = 'worker stopped responding', worker = NULL, finished_at = ? "
+                "WHERE status = ? AND heartbeat_at < ? AND attempts >= ?",
+                (FAILED, now, RUNNING, stale, JOB_MAX_ATTEMPTS),
+            )
+            db.execute(
+                "UPDATE documents SET status = ?, worker = NULL WHERE status = ? AND heartbeat_at < ?",
+                (QUEUED, RUNNING, stale),
+            )
+            row = db.execute(
+                "SELECT source FROM documents WHERE status = ? AND available_at <= ? ORDER BY queued_at LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE documents SET status = ?, worker = ?, attempts = attempts + 1, heartbeat_at = ? WHERE source = ?",
+                (RUNNING, worker, now, row["source"]),
+            )
+        return self.document(row["source"])
+
+    def heartbeat(self, source: str, worker: str):
+        """Show that ``worker`` is still building ``source``'s tree."""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE documents SET heartbeat_at = ? WHERE source = ? AND status = ? AND worker = ?",
+                (time.time(), source, RUNNING, worker),
+            )
+
+    def document(self, source: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute("SELECT * FROM documents WHERE source = ?", (source,)).fetchone()
+        return dict(row) if row else None
+
+    def sections(self, source: str) -> List[Tuple[str, str, str]]:
+        rows = self._connection().execute(
+            "SELECT label, input_hash, text FROM sections WHERE source = ? ORDER BY position", (source,)
+        )
+        return [tuple(row) for row in rows]
+
+    def previous_nodes(self, source: str) -> Dict[Tuple[int, str], str]:
+        rows = self._connection().execute("SELECT level, input_hash, summary FROM nodes WHERE source = ?", (source,))
+        return {(row["level"], row["input_hash"]): row["summary"] for row in rows}
+
+    def save_tree(self, source: str, worker: str, nodes: List[Node], llm_calls: int, claimed_at: float) -> bool:
+        """
+        Replace ``source``'s tree; it stays queued if it was resubmitted
+        while being built. False, saving nothing, if the document was
+        deleted or its build is no longer ``worker``'s.
+        """
+        with self._transaction() as db:
+            document = db.execute(
+                "SELECT queued_at FROM documents WHERE source = ? AND worker = ?", (source, worker)
+            ).fetchone()
+            if document is None:
+                return False
+            db.execute("DELETE FROM nodes WHERE source = ?", (source,))
+            db.executemany(
+                "INSERT INTO nodes (source, level, position, label, input_hash, summary) VALUES (?, ?, ?, ?, ?, ?)",
+                [(source, *node) for node in nodes],
+            )
+            status = QUEUED if document["queued_at"] > claimed_at else READY
+            db.execute(
+                "UPDATE documents SET status = ?, llm_calls = ?, worker = NULL, finished_at = ? WHERE source = ?",
+                (status, llm_calls, time.time(), source),
+            )
+        return True
+
+    def fail(self, source: str, worker: str, error: str) -> Optional[str]:
+        """
+        Schedule another build with backoff, or fail the tree once its
+        attempts are used up; returns the new status, or None if the build
+        is no longer ``worker``'s.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT attempts FROM documents WHERE source = ? AND status = ? AND worker = ?", (source, RUNNING, worker)
+            ).fetchone()
+            if row is None:
+                return None
+            if row["attempts"] < JOB_MAX_ATTEMPTS:
+                db.execute(
+                    "UPDATE documents SET status = ?, error = ?, worker = NULL, available_at = ? WHERE source = ?",
+                    (QUEUED, error, now + JOB_RETRY_DELAY * 2 ** (row["attempts"] - 1), source),
+                )
+                return QUEUED
+            db.execute(
+                "UPDATE documents SET status = ?, error = ?, worker = NULL, finished_at = ? WHERE source = ?",
+                (FAILED, error, now, source),
+            )
+            return FAILED
+
+    def remove(self, source: str):
+        with self._transaction() as db:
+            for table in ("documents", "sections", "nodes"):
+                db.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+
+    def tree(self, source: str) -> Optional[Dict[str, Any]]:
+        """
+        The tree of ``source``'s current sections: {"source", "status",
+        "root", "levels"} with levels[0] the sections. None if there is none,
+        including while a re-upload's tree is rebuilt (or after that build
+        failed), since the stored tree summarizes the superseded sections.
+        """
+        document = self.document(source)
+        if document is None:
+            return None
+        levels: List[List[Dict[str, Any]]] = []
+        leaf_hashes: List[str] = []
+        rows = self._connection().execute(
+            "SELECT level, position, label, input_hash, summary FROM nodes WHERE source = ? ORDER BY level, position",
+            (source,),
+        )
+        for row in rows:
+            while len(levels) <= row["level"]:
+                levels.append([])
+            levels[row["level"]].append({"label": row["label"], "summary": row["summary"]})
+            if row["level"] == 0:
+                leaf_hashes.append(row["input_hash"])
+        if not levels:
+            return None
+        if document["status"] != READY and leaf_hashes != [input_hash for _, input_hash, _ in self.sections(source)]:
+            return None
+        return {"source": source, "status": document["status"], "root": levels[-1][0], "levels": levels}
+
+    def stats(self) -> Dict[str, int]:
+        counts = {status: 0 for status in (QUEUED, RUNNING, READY, FAILED)}
+        counts.update(dict(self._connection().execute("SELECT status, COUNT(*) FROM documents GROUP BY status").fetchall()))
+        return counts
+
+
+def summarize_next(store: SummaryStore, worker: str, summarizer=None) -> bool:
+    """Build one queued tree if any is queued; returns whether one was built."""
+    document = store.claim(worker)
+    if document is None:
+        return False
+    source = document["source"]
+    started = time.perf_counter()
+    try:
+        with span("summarize", source=source, sections=document["sections"], attempt=document["attempts"]):
+            nodes, calls = build_tree(
+                store.sections(source), store.previous_nodes(source), summarizer or get_summarizer(),
+                progress=lambda: store.heartbeat(source, worker),
+            )
+    except Exception as e:
+        store.fail(source, worker, f"{type(e).__name__}: {e}")
+    else:
+        if store.save_tree(source, worker, nodes, calls, document["heartbeat_at"]):
+            SUMMARY_SECONDS.observe(time.perf_counter() - started)
+    return True
+
+
+class SummaryWorker:
+    """``count`` threads building queued summary trees (the LLM calls are I/O-bound)."""
+
+    def __init__(self, count: int = SUMMARY_WORKERS, poll_interval: float = JOB_POLL_INTERVAL):
+        self.count = count
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def _loop(self):
+        store = get_summary_store()
+        worker = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        while not self._stop.is_set():
+            if not summarize_next(store, worker):
+                self._stop.wait(self.poll_interval)
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._loop, name="summary-worker", daemon=True) for _ in range(self.count)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.count, "alive": sum(thread.is_alive() for thread in self._threads)}
+
+
+# Answers
+
+
+def _relevance(words: set, label: str, summary: str, text: str) -> int:
+    haystack = f"{label} {summary} {text}".lower()
+    return sum(haystack.count(word) for word in words)
+
+
+def answer_summary(question: str, document_source: Optional[str] = None, sections: int = 6) -> Optional[Dict[str, Any]]:
+    """
+    Answer a "Document Summary" question about ``document_source`` from its
+    stored tree, shaped like the chain's result ({"result",
+    "source_documents"}, "cached": "summary"). The document summary comes
+    first, then the section summaries that mention what the question asks
+    about (or the first ``sections`` sections for a general summary).
+
+    None, so that retrieval and the LLM answer instead, when no document is
+    selected (a tree answers for one document, and which one cannot be
+    guessed), when its tree is not built yet (or not rebuilt since the
+    document was uploaded again), or when the question names a topic no
+    section mentions.
+    """
+    if document_source is None:
+        return None
+    store = get_summary_store()
+    tree = store.tree(document_source)
+    if tree is None:
+        return None
+    leaves = tree["levels"][0]
+    words = {word for word in _WORD.findall(question.lower()) if word not in _GENERIC}
+    if words:
+        texts = [text for _, _, text in store.sections(document_source)]
+        scored = [
+            (_relevance(words, leaf["label"], leaf["summary"], text), position)
+            for position, (leaf, text) in enumerate(zip(leaves, texts))
+        ]
+        best = sorted(scored, key=lambda item: (-item[0], item[1]))[:sections]
+        chosen = sorted(position for score, position in best if score > 0)
+        if not chosen:
+            return None
+    else:
+        chosen = list(range(min(sections, len(leaves))))
+    lines = [f"**{Path(document_source).name}**", "", tree["root"]["summary"]]
+    if len(leaves) > 1:
+        lines.append("")
+        lines.extend(f"* **{leaves[position]['label']}**: {leaves[position]['summary']}" for position in chosen)
+    docs = [Document(page_content=tree["root"]["summary"], metadata={"source": document_source, "summary": "document"})]
+    docs.extend(
+        Document(page_content=leaves[position]["summary"],
+                 metadata={"source": document_source, "section": leaves[position]["label"], "summary": "section"})
+        for position in chosen if len(leaves) > 1
+    )
+    return {"result": "\n".join(lines), "source_documents": docs, "cached": "summary"}
+
+
+_store: Optional[SummaryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_summary_store() -> SummaryStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SummaryStore()
+    return _store
+
+
+def _summary_collector():
+    if _store is None:
+        return
+    yield "legalview_summary_documents", "gauge", "Documents by summary tree status", [
+        ({"status": status}, count) for status, count in _store.stats().items()
+    ]
+
+
+REGISTRY.add_collector(_summary_collector)
+
+
+if __name__ == "__main__":
+    # Build every queued tree once, e.g. after `python ingest.py data/` without a running backend
+    built = 0
+    store = get_summary_store()
+    while summarize_next(store, f"{socket.gethostname()}:{os.getpid()}"):
+        built += 1
+    print(f"Built {built} summary trees: {store.stats()}")
@@ -0,0 +1,411 @@
+"""
+In-process metrics and tracing, with no collector or client library needed.
+
+Metrics live in a process-wide registry rendered in the Prometheus text
+format by the backend's ``/metrics`` endpoint. Counters, gauges and
+histograms are updated where the work happens; values that already exist
+elsewhere (index size, cache and pool stats, RSS) are read by collectors at
+scrape time.
+
+Spans time the stages of a request (``embed_query``, ``vector_search``,
+``prompt_build``, ``llm``, ``serialize``). The current span is a context
+variable, so children started in the same task, or on the CPU pool (which
+copies context), share its trace. Every finished span is observed in the
+``legalview_stage_seconds`` histogram; if TRACE_OTLP_FILE is set it is also
+appended to that file as OTLP/JSON, one export request per line, which the
+OpenTelemetry Collector's otlpjsonfile receiver can ship anywhere.
+"""
+import json
+import math
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from config import TRACE_OTLP_FILE
+
+try:
+    import resource
+except ImportError:  # Windows: resident memory is reported as 0
+    resource = None
+
+SERVICE_NAME = "legalview"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+# (name, type, help, [(labels, value)]) as produced by a collector
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.label_names, key))
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts, _, _ = state
+            for number, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[number] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, bucket in zip(self.buckets, counts):
+                    cumulative += bucket
+                    samples.append((f"{self.name}_bucket", dict(labels, le=_format_value(bound)), cumulative))
+                samples.append((f"{self.name}_bucket", dict(labels, le="+Inf"), count))
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class Registry:
+    """Metrics of this process, plus collectors called at scrape time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def _get(self, cls, name: str, help: str, labels: Iterable[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labels, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]):
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        families = [(metric.name, metric.type, metric.help, metric.samples()) for metric in metrics]
+        for collector in collectors:
+            try:
+                for name, kind, help, values in collector():
+                    families.append((name, kind, help, [(name, labels, value) for labels, value in values]))
+            except Exception:  # a broken collector must not take /metrics down
+                self.counter(
+                    "legalview_collector_errors_total", "Scrape-time collectors that raised", ["collector"]
+                ).inc(collector=getattr(collector, "__name__", "?"))
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{sample}{_format_labels(labels)} {_format_value(value)}" for sample, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "legalview_stage_seconds", "Time spent per pipeline stage (span)", ["stage"]
+)
+
+
+def resident_memory_bytes() -> int:
+    """Current RSS of this process (peak RSS where /proc is unavailable, 0 on Windows)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def _process_collector():
+    yield "process_resident_memory_bytes", "gauge", "Resident memory size in bytes", [({}, resident_memory_bytes())]
+
+
+REGISTRY.add_collector(_process_collector)
+
+
+class Span:
+    """One timed operation in a trace."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    @property
+    def seconds(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        STAGE_SECONDS.observe(self.seconds, stage=self.name)
+        exporter = get_exporter()
+        if exporter is not None:
+            exporter.export(self)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, parent: Optional[Span] = None, **attributes) -> Span:
+    """Start a span that the caller ends; it does not become the current span."""
+    return Span(name, parent if parent is not None else _current_span.get(), attributes)
+
+
+@contextmanager
+def span(name: str, parent: Optional[Span] = None, **attributes):
+    """
+    Time the block as a child of ``parent`` or the current span (or as a new
+    trace) and make it the current span.
+    """
+    current = Span(name, parent if parent is not None else _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.end(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Span]:
+    """A stand-in parent for a W3C ``traceparent`` header, so our spans join the caller's trace."""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    parent = Span.__new__(Span)
+    parent.trace_id, parent.span_id = parts[1], parts[2]
+    return parent
+
+
+def traceparent(current: Optional[Span] = None) -> Optional[str]:
+    current = current or _current_span.get()
+    return f"00-{current.trace_id}-{current.span_id}-01" if current else None
+
+
+class OTLPFileExporter:
+    """Append finished spans to a file as OTLP/JSON export requests, one per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _attribute(key: str, value) -> dict:
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        return {"key": key, "value": typed}
+
+    def encode(self, finished: Span) -> dict:
+        encoded = {
+            "traceId": finished.trace_id,
+            "spanId": finished.span_id,
+            "name": finished.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(finished.start_ns),
+            "endTimeUnixNano": str(finished.end_ns),
+            "attributes": [self._attribute(key, value) for key, value in finished.attributes.items()],
+            "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+        }
+        if finished.parent_id:
+            encoded["parentSpanId"] = finished.parent_id
+        return {"resourceSpans": [{
+            "resource": {"attributes": [self._attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "modules.telemetry"}, "spans": [encoded]}],
+        }]}
+
+    def export(self, finished: Span):
+        line = json.dumps(self.encode(finished), separators=(",", ":")) + "\n"
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+_exporter: Optional[OTLPFileExporter] = None
+_exporter_path: Optional[str] = None
+
+
+def get_exporter() -> Optional[OTLPFileExporter]:
+    """The span file exporter, or None when TRACE_OTLP_FILE is unset."""
+    global _exporter, _exporter_path
+    if not TRACE_OTLP_FILE:
+        return None
+    if _exporter is None or _exporter_path != TRACE_OTLP_FILE:
+        _exporter, _exporter_path = OTLPFileExporter(TRACE_OTLP_FILE), TRACE_OTLP_FILE
+    return _exporter
+
+
+class LLMSpanHandler(BaseCallbackHandler):
+    """
+    LangChain callback that records each LLM call as an ``llm`` span under
+    the caller's current span, with the model name and token usage.
+    """
+
+    run_inline = True  # run in the caller's context, so the current span is the parent
+
+    def __init__(self):
+        self._spans: Dict[UUID, Span] = {}
+
+    def _start(self, serialized, run_id: UUID, **kwargs):
+        model = (kwargs.get("invocation_params") or {}).get("model") or (serialized or {}).get("name", "")
+        self._spans[run_id] = start_span("llm", model=str(model))
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs):
+        self._start(serialized, run_id, **kwargs)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs):
+        self._start(serialized, run_id, **kwargs)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        finished = self._spans.pop(run_id, None)
+        if finished is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage_metadata") or {}
+        for key in ("prompt_tokens", "completion_tokens", "input_tokens", "output_tokens", "total_tokens"):
+            if isinstance(usage.get(key), int):
+                finished.attributes[f"llm.{key}"] = usage[key]
+        finished.end()
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        finished = self._spans.pop(run_id, None)
+        if finished is not None:
+            finished.end(error)
@@ -0,0 +1,310 @@
+"""
+Defined-terms index.
+
+Legal documents declare their definitions explicitly ('"Force Majeure"
+means ...', 'Acme Corp. (the "Company")'). Ingestion extracts every such
+definition from a document's chunks into a SQLite table of term ->
+(document, page, clause, text), and "define X" questions are answered from
+it without retrieval or an LLM call. Each term is stored under aliases
+(its normalized form, its singular or plural, its initials for multi-word
+terms, short forms given in brackets) and looked up by alias first, then
+fuzzily by string similarity to the known aliases.
+
+Questions asking for more than the document's own wording ("explain",
+"why", "example", ...) and terms that are not found go to the LLM.
+"""
+import difflib
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from modules.telemetry import REGISTRY
+from modules.sqlite import SQLiteStore
+from config import TERMS_DB_PATH, TERM_FUZZY_CUTOFF
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    term TEXT NOT NULL,
+    source TEXT NOT NULL,
+    page INTEGER,
+    clause TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS terms_source ON terms (source);
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT NOT NULL,
+    term_id INTEGER NOT NULL REFERENCES terms (id) ON DELETE CASCADE,
+    PRIMARY KEY (alias, term_id)
+);
+CREATE INDEX IF NOT EXISTS aliases_term ON aliases (term_id);
+"""
+
+_QUOTED = r"[\"“']([^\"”'\n]{1,80})[\"”']"
+# '"Term" means ...', '"Term" (or "T") shall have the meaning ...'
+_DEFINITION = re.compile(
+    _QUOTED + r"\s*(?:\(([^)\n]{0,60})\)\s*)?,?\s*"
+    r"(?i:means|shall mean|shall have the meaning|has the meaning|have the meanings?|includes|shall include|refers to|is defined as)\b"
+)
+# 'Acme Corp. (the "Company")', '(each, a "Party")', '(hereinafter referred to as "Tenant")'
+_ALIAS_DEFINITION = re.compile(
+    r"\((?i:the|each,? (?:a|an)|collectively,? (?:the)?|hereinafter(?: referred to as)?(?: the)?|a|an)?\s*"
+    + _QUOTED + r"\)"
+)
+_SENTENCE_END = re.compile(r"(?<=[.;])\s+(?=[A-Z\"“])|\n\s*\n")
+# Periods that do not end a sentence: "Acme Corp. (the "Company")"
+_ABBREVIATION = re.compile(r"\b(?:Corp|Inc|Ltd|Co|No|Nos|Mr|Mrs|Ms|Dr|St|Jr|Sr|e\.g|i\.e|etc|cf|vs|art|sec|para)\.$", re.IGNORECASE)
+_SHORT_FORM = re.compile(_QUOTED)
+# How a question asks for a definition; the captured group is the term.
+# "what does X ..." names a term only when it ends in "mean" or "stand for".
+_QUESTION_TERM = r"(?:the\s+(?:term\s+)?|term\s+)?[\"“']?(.+?)[\"”']?"
+_DEFINE_QUESTION = re.compile(
+    r"^\s*(?:please\s+)?(?:"
+    r"(?:define|definition of|what is the definition of|what is the meaning of|meaning of)\s+" + _QUESTION_TERM
+    + r"|(?:what does|what do)\s+" + _QUESTION_TERM + r"\s+(?:mean|means|stand for)"
+    r")\s*\??\s*$",
+    re.IGNORECASE,
+)
+_EXPLANATION = re.compile(
+    r"\b(?:explain|explanation|why|how does|how do|example|examples|implications?|plain (?:english|language)|simple terms|compare|difference)\b",
+    re.IGNORECASE,
+)
+
+MAX_DEFINITION_CHARS = 1200
+
+LOOKUPS = REGISTRY.counter("legalview_term_lookups_total", "Defined-term lookups by outcome", ["result"])
+
+
+def normalize(term: str) -> str:
+    """Lookup key of a term: lower-case, single-spaced, without quotes, a leading article or end punctuation."""
+    key = re.sub(r"\s+", " ", term.strip().strip("\"“”'").lower())
+    key = re.sub(r"^(?:the|a|an)\s+", "", key)
+    return key.rstrip(".,;:?!").strip()
+
+
+def aliases(term: str, short_forms: Iterable[str] = ()) -> List[str]:
+    """Keys a term is found under: its normal form, singular/plural, initials and given short forms."""
+    key = normalize(term)
+    keys = [key]
+    if key.endswith("ies") and len(key) > 4:
+        keys.append(key[:-3] + "y")
+    elif key.endswith("s") and not key.endswith("ss") and len(key) > 3:
+        keys.append(key[:-1])
+    else:
+        keys.append(key + "s")
+    words = [word for word in re.split(r"[\s-]+", key) if word and word not in {"of", "and", "the", "to", "for"}]
+    if len(words) >= 2:
+        keys.append("".join(word[0] for word in words))
+    keys.extend(normalize(form) for form in short_forms)
+    return list(dict.fromkeys(key for key in keys if key))
+
+
+def _sentence_ends(text: str, start: int = 0) -> Iterable[re.Match]:
+    for match in _SENTENCE_END.finditer(text, start):
+        if not _ABBREVIATION.search(text, max(0, match.start() - 6), match.start()):
+            yield match
+
+
+def _definition_text(text: str, start: int, end: int) -> str:
+    """The definition starting at ``start``: up to the next definition or paragraph, in whole sentences."""
+    body = text[start:end]
+    paragraph = re.search(r"\n\s*\n", body)
+    if paragraph:
+        body = body[:paragraph.start()]
+    if len(body) > MAX_DEFINITION_CHARS:
+        body = body[:MAX_DEFINITION_CHARS]
+        cuts = [match.start() for match in _sentence_ends(body)]
+        if cuts:
+            body = body[:cuts[-1]]
+    return re.sub(r"\s+", " ", body).strip()
+
+
+def _sentence(text: str, position: int) -> str:
+    """The sentence of ``text`` that contains ``position``."""
+    starts = [0] + [match.end() for match in _sentence_ends(text) if match.end() <= position]
+    start = starts[-1]
+    end = next((match.start() for match in _sentence_ends(text, position)), len(text))
+    lines = text[start:min(end, start + MAX_DEFINITION_CHARS)].split("\n")
+    while len(lines) > 1 and not re.search(r"[a-z]", lines[0]):
+        lines.pop(0)  # a heading ("2. PARTIES") above the sentence
+    return re.sub(r"\s+", " ", " ".join(lines)).strip()
+
+
+def extract_definitions(chunks: Iterable[Document]) -> List[Dict[str, Any]]:
+    """
+    Definitions declared in a document's chunks, one per term: the longest
+    text found for it (overlapping chunks repeat, and may cut, a definition).
+    Explicit definitions ('"X" means') win over short forms ('(the "X")').
+    """
+    found: Dict[str, Dict[str, Any]] = {}
+
+    def keep(term, text, chunk, explicit, short_forms=()):
+        term = term.strip()
+        key = normalize(term)
+        if not key or not text:
+            return
+        current = found.get(key)
+        if current is not None and (current["explicit"], len(current["text"])) >= (explicit, len(text)):
+            return
+        found[key] = {
+            "term": term,
+            "text": text,
+            "page": chunk.metadata.get("page"),
+            "clause": chunk.metadata.get("section"),
+            "aliases": aliases(term, short_forms),
+            "explicit": explicit,
+        }
+
+    for chunk in chunks:
+        text = chunk.page_content
+        matches = list(_DEFINITION.finditer(text))
+        for number, match in enumerate(matches):
+            end = matches[number + 1].start() if number + 1 < len(matches) else len(text)
+            short_forms = _SHORT_FORM.findall(match.group(2) or "")
+            keep(match.group(1), _definition_text(text, match.start(), end), chunk, True, short_forms)
+        for match in _ALIAS_DEFINITION.finditer(text):
+            keep(match.group(1), _sentence(text, match.start()), chunk, False)
+    for definition in found.values():
+        del definition["explicit"]
+    return list(found.values())
+
+
+def parse_definition_question(question: str, whole_term: bool = False) -> Tuple[Optional[str], bool]:
+    """
+    The term a question asks to define and whether it asks for an
+    explanation beyond the definition. With ``whole_term`` the question is
+    the term itself (the "Term Definition" mode); otherwise only questions
+    phrased as a definition request ("define X", "what does X mean") name one.
+    """
+    explain = bool(_EXPLANATION.search(question))
+    match = _DEFINE_QUESTION.match(question)
+    if match:
+        return (match.group(1) or match.group(2)).strip(), explain
+    if whole_term and len(question.split()) <= 8:
+        return question.strip().strip("\"“”'?"), explain
+    return None, explain
+
+
+class TermIndex(SQLiteStore):
+    """The defined terms of every ingested document, shared by ingestion and the query paths."""
+
+    PRAGMAS = ("foreign_keys=ON",)
+
+    def __init__(self, path: str = TERMS_DB_PATH):
+        super().__init__(path, _SCHEMA)
+        self._keys: Tuple[Tuple[int, int], List[str]] = ((0, 0), [])
+
+    def replace_document(self, source: str, definitions: List[Dict[str, Any]]) -> int:
+        """Store ``source``'s definitions in place of any it had; returns how many were stored."""
+        with self._transaction() as db:
+            db.execute("DELETE FROM terms WHERE source = ?", (source,))
+            for definition in definitions:
+                term_id = db.execute(
+                    "INSERT INTO terms (term, source, page, clause, text) VALUES (?, ?, ?, ?, ?)",
+                    (definition["term"], source, definition["page"], definition["clause"], definition["text"]),
+                ).lastrowid
+                db.executemany(
+                    "INSERT OR IGNORE INTO aliases (alias, term_id) VALUES (?, ?)",
+                    [(alias, term_id) for alias in definition["aliases"]],
+                )
+        return len(definitions)
+
+    def index_document(self, source: str, chunks: Iterable[Document]) -> int:
+        return self.replace_document(source, extract_definitions(chunks))
+
+    def remove(self, source: str):
+        with self._transaction() as db:
+            db.execute("DELETE FROM terms WHERE source = ?", (source,))
+
+    def _rows(self, keys: List[str], document_source: Optional[str]) -> List[Dict[str, Any]]:
+        marks = ",".join("?" for _ in keys)
+        query = (
+            f"SELECT DISTINCT terms.* FROM aliases JOIN terms ON terms.id = aliases.term_id WHERE aliases.alias IN ({marks})"
+        )
+        params: List[Any] = list(keys)
+        if document_source is not None:
+            query += " AND terms.source = ?"
+            params.append(document_source)
+        rows = self._connection().execute(query + " ORDER BY terms.source, terms.id", params)
+        return [dict(row) for row in rows]
+
+    def _alias_keys(self) -> List[str]:
+        """Every alias, for fuzzy matching; reread only after terms were added or removed."""
+        state = tuple(self._connection().execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM terms").fetchone())
+        if state != self._keys[0]:
+            keys = [row[0] for row in self._connection().execute("SELECT DISTINCT alias FROM aliases")]
+            self._keys = (state, keys)
+        return self._keys[1]
+
+    def lookup(self, term: str, document_source: Optional[str] = None, fuzzy: bool = True) -> List[Dict[str, Any]]:
+        """
+        Definitions of ``term`` (in one document, or in every document that
+        defines it), by alias and then, if ``fuzzy``, by the closest aliases
+        at least TERM_FUZZY_CUTOFF similar.
+        """
+        keys = aliases(term)
+        rows = self._rows(keys, document_source)
+        if rows:
+            LOOKUPS.inc(result="hit")
+            return rows
+        if fuzzy:
+            close = difflib.get_close_matches(keys[0], self._alias_keys(), n=3, cutoff=TERM_FUZZY_CUTOFF)
+            rows = self._rows(close, document_source) if close else []
+            if rows:
+                LOOKUPS.inc(result="fuzzy")
+                return rows
+        LOOKUPS.inc(result="miss")
+        return []
+
+    def terms(self, source: str) -> List[Dict[str, Any]]:
+        rows = self._connection().execute("SELECT * FROM terms WHERE source = ? ORDER BY id", (source,))
+        return [dict(row) for row in rows]
+
+
+def _citation(row: Dict[str, Any]) -> str:
+    parts = [Path(row["source"]).name]
+    if row["page"] is not None:
+        parts.append(f"page {row['page'] + 1}")
+    if row["clause"]:
+        parts.append(row["clause"])
+    return ", ".join(parts)
+
+
+def answer_definition(question: str, document_source: Optional[str] = None, whole_term: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Answer a definition question from the index, shaped like the chain's
+    result ({"result", "source_documents"}, "cached": "definitions"), or
+    None when it names no term, asks for an explanation, or the term is
+    not defined in the documents.
+    """
+    term, explain = parse_definition_question(question, whole_term)
+    if not term or explain:
+        return None
+    rows = get_term_index().lookup(term, document_source)[:3]
+    if not rows:
+        return None
+    lines = [f"* **{row['term']}**: {row['text']} _({_citation(row)})_" for row in rows]
+    docs = [
+        Document(
+            page_content=row["text"],
+            metadata={"source": row["source"], "page": row["page"], "section": row["clause"], "defined_term": row["term"]},
+        )
+        for row in rows
+    ]
+    return {"result": "\n".join(lines), "source_documents": docs, "cached": "definitions"}
+
+
+_term_index: Optional[TermIndex] = None
+_term_index_lock = threading.Lock()
+
+
+def get_term_index() -> TermIndex:
+    global _term_index
+    if _term_index is None:
+        with _term_index_lock:
+            if _term_index is None:
+                _term_index = TermIndex()
+    return _term_index
@@ -0,0 +1,1310 @@
+"""
+Shared, segmented FAISS vectorstore.
+
+On disk the store is a base index (index.faiss, the chunk texts and metadata
+in a memory-mapped ChunkStore, and a BM25 inverted index over the same
+chunks) and an append-only log of small segments under segments/. Nothing
+is pickled; stores in LangChain's index.pkl layout are converted once with
+migrate_vectorstore.py. Uploads and deletions only write a new segment; a
+background merge folds segments into the base and compacts away deleted
+vectors. Every commit bumps the GENERATION file so other processes know to
+catch up.
+
+Bases are immutable snapshots: a merge writes snapshots/base-<version>/ in
+full and then atomically replaces the base.json manifest that points at it,
+so a reader (in any process or replica sharing the directory) sees either
+the old base or the new one, never a mix. Serving processes run a watcher
+(start_snapshot_watcher) that loads a new snapshot in the background and
+swaps it in; queries pin the index they started on, and a replaced index is
+released once its last query finishes.
+"""
+import json
+import os
+import pickle
+import shutil
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Set, Tuple
+import uuid
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain.schema import Document
+
+from modules import ann, chunkstore
+from modules.bm25 import BM25Index
+from modules.chunkstore import ChunkStore
+from modules.embeddings import get_embeddings
+from modules.embedding_cache import content_hash
+from modules.telemetry import REGISTRY, span
+from config import (
+    VECTORSTORE_PATH,
+    SEGMENT_MERGE_THRESHOLD,
+    TOMBSTONE_COMPACTION_RATIO,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    RETRIEVAL_MODE,
+    INDEX_TYPE,
+    INDEX_MMAP,
+    SNAPSHOT_GRACE_SECONDS,
+    SNAPSHOT_POLL_INTERVAL,
+    SNAPSHOT_RETAIN,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+CHUNKS_INDEXED = REGISTRY.counter("legalview_indexed_chunks_total", "Chunks added to the index")
+CHUNKS_DELETED = REGISTRY.counter("legalview_deleted_chunks_total", "Chunks tombstoned by document deletes")
+MERGE_SECONDS = REGISTRY.histogram("legalview_merge_seconds", "Time to merge segments into a new base")
+SWAP_SECONDS = REGISTRY.histogram("legalview_index_swap_seconds", "Time to load a new base snapshot before swapping it in")
+
+GENERATION_FILE = "GENERATION"
+SOURCES_FILE = "sources.json"
+TOMBSTONES_FILE = "tombstones.json"
+HASHES_FILE = "hashes.json"
+BASE_FILE = "base.json"
+SEGMENTS_DIR = "segments"
+SNAPSHOTS_DIR = "snapshots"
+LOCK_FILE = ".lock"
+MERGE_LOCK_FILE = ".merge.lock"
+INDEX_FILE = "index.faiss"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+
+# Process-wide registry: one in-memory index shared by every caller.
+# Lock order is always: writer lock -> store file lock -> _lock.
+_lock = threading.RLock()
+_write_lock = threading.Lock()
+_local = threading.local()
+_index: Optional["_LoadedIndex"] = None
+_generation: Optional[int] = None
+_base_version: Optional[int] = None
+_applied_segment = 0  # highest segment number reflected in memory
+_merge_thread: Optional[threading.Thread] = None
+_watcher: Optional[threading.Thread] = None
+_watcher_stop = threading.Event()
+_merge_listeners: List[Callable[[Dict[str, List[int]]], None]] = []
+
+
+def store_lock():
+    """Lock guarding the shared vectorstore; hold it while mutating the index."""
+    return _lock
+
+
+def _path(*parts) -> str:
+    return os.path.join(VECTORSTORE_PATH, *parts)
+
+
+def _atomic_write(path: str, data: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def _file_lock(name: str, shared: bool = False, blocking: bool = True):
+    """
+    Advisory lock on a file in the store directory. Yields False when a
+    non-blocking lock could not be taken.
+    """
+    os.makedirs(VECTORSTORE_PATH, exist_ok=True)
+    with open(_path(name), "a") as f:
+        if fcntl is None:
+            yield True
+            return
+        mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            mode |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(f, mode)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _writer():
+    """Serialize writers across threads and processes."""
+    with _write_lock, _file_lock(LOCK_FILE):
+        _local.writer = True
+        try:
+            yield
+        finally:
+            _local.writer = False
+
+
+@contextmanager
+def _reader():
+    """Keep the base from being swapped while it is read."""
+    if getattr(_local, "writer", False):
+        yield
+        return
+    with _file_lock(LOCK_FILE, shared=True):
+        yield
+
+
+def vectorstore_exists() -> bool:
+    return os.path.exists(_base_path(INDEX_FILE))
+
+
+class LegacyStoreError(RuntimeError):
+    """The store on disk is in the pickled LangChain layout and must be migrated first."""
+
+
+def read_generation() -> int:
+    """
+    Return the generation number of the index on disk (0 if none was recorded).
+    """
+    try:
+        with open(_path(GENERATION_FILE)) as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _write_generation(generation: int):
+    _atomic_write(_path(GENERATION_FILE), str(generation))
+
+
+def _bump_generation() -> int:
+    generation = read_generation() + 1
+    _write_generation(generation)
+    return generation
+
+
+def _read_base_info() -> dict:
+    """The base manifest: version, last merged segment and the snapshot directory."""
+    try:
+        with open(_path(BASE_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"version": 0, "merged_through": 0}
+
+
+def _base_dir(base_info: Optional[dict] = None) -> str:
+    """Directory of the current base snapshot (the store root for stores written before snapshots)."""
+    snapshot = (base_info if base_info is not None else _read_base_info()).get("snapshot")
+    return _path(snapshot) if snapshot else VECTORSTORE_PATH
+
+
+def _base_path(name: str, base_info: Optional[dict] = None) -> str:
+    return os.path.join(_base_dir(base_info), name)
+
+
+def _prune_snapshots():
+    """
+    Delete base snapshots older than the newest SNAPSHOT_RETAIN once they have
+    been superseded for SNAPSHOT_GRACE_SECONDS, by which time readers in other
+    processes have swapped to a newer one. Caller holds the exclusive store file lock.
+    """
+    try:
+        names = sorted(name for name in os.listdir(_path(SNAPSHOTS_DIR)) if name.startswith("base-"))
+    except FileNotFoundError:
+        return
+    snapshots = [name for name in names if not name.endswith(".tmp")]
+    now = time.time()
+    for old, successor in zip(snapshots[:-SNAPSHOT_RETAIN], snapshots[1:]):
+        if now - os.path.getmtime(_path(SNAPSHOTS_DIR, successor)) >= SNAPSHOT_GRACE_SECONDS:
+            shutil.rmtree(_path(SNAPSHOTS_DIR, old), ignore_errors=True)
+
+
+def _segment_numbers(after: int = 0) -> List[int]:
+    """Committed segment numbers greater than ``after``, in log order."""
+    try:
+        names = os.listdir(_path(SEGMENTS_DIR))
+    except FileNotFoundError:
+        return []
+    numbers = []
+    for name in names:
+        # The .jsonl file is written last, so it marks a committed segment
+        if name.startswith("seg-") and name.endswith(".jsonl"):
+            number = int(name[4:-6])
+            if number > after:
+                numbers.append(number)
+    return sorted(numbers)
+
+
+def _segment_path(number: int, ext: str) -> str:
+    return _path(SEGMENTS_DIR, f"seg-{number:08d}.{ext}")
+
+
+def _write_segment(number: int, ids: List[str], texts: List[str], vectors: np.ndarray, metadatas: List[dict]):
+    os.makedirs(_path(SEGMENTS_DIR), exist_ok=True)
+    vectors_path = _segment_path(number, "npy")
+    with open(vectors_path + ".tmp", "wb") as f:
+        np.save(f, vectors)
+    os.replace(vectors_path + ".tmp", vectors_path)
+    lines = [
+        json.dumps({"id": id_, "text": text, "metadata": metadata})
+        for id_, text, metadata in zip(ids, texts, metadatas)
+    ]
+    _atomic_write(_segment_path(number, "jsonl"), "\n".join(lines) + "\n")
+
+
+def _write_delete_segment(number: int, source: str):
+    os.makedirs(_path(SEGMENTS_DIR), exist_ok=True)
+    _atomic_write(_segment_path(number, "jsonl"), json.dumps({"delete_source": source}) + "\n")
+
+
+def _read_segment(number: int):
+    """Return the segment's entries and vectors (None for a deletion segment)."""
+    with open(_segment_path(number, "jsonl")) as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    if entries and "delete_source" in entries[0]:
+        return entries, None
+    return entries, np.load(_segment_path(number, "npy"))
+
+
+def _remove_segment(number: int):
+    for ext in ("jsonl", "npy"):
+        try:
+            os.remove(_segment_path(number, ext))
+        except FileNotFoundError:
+            pass
+
+
+def _next_segment_number() -> int:
+    return max([_read_base_info()["merged_through"]] + _segment_numbers()) + 1
+
+
+def _build_source_maps(chunks: ChunkStore, tombstones=()):
+    """Derive the source -> vector ids and source -> chunk hashes maps from the chunk store."""
+    source_ids: Dict[str, List[int]] = {}
+    source_hashes: Dict[str, Set[str]] = {}
+    codes, sources = chunks.column("source")
+    for position, code in enumerate(codes.tolist()):
+        if code < 0 or position in tombstones:
+            continue
+        source = sources[code]
+        source_ids.setdefault(source, []).append(position)
+        source_hashes.setdefault(source, set()).add(content_hash(chunks.text(position)))
+    return source_ids, source_hashes
+
+
+class _ChunkDocstore(Docstore):
+    """Read-only docstore view of a _LoadedIndex, for the LangChain FAISS wrapper."""
+
+    def __init__(self, index: "_LoadedIndex"):
+        self._index = index
+
+    def search(self, search: str):
+        position = int(search)
+        if not 0 <= position < len(self._index.chunks):
+            return f"ID {search} not found."
+        return self._index.chunks.document(position)
+
+
+class _PositionIds(Mapping):
+    """index_to_docstore_id for the wrapper: chunk ids are their positions."""
+
+    def __init__(self, index: "_LoadedIndex"):
+        self._index = index
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < len(self._index.chunks):
+            raise KeyError(position)
+        return str(position)
+
+    def __iter__(self):
+        return iter(range(len(self._index.chunks)))
+
+    def __len__(self) -> int:
+        return len(self._index.chunks)
+
+
+class _LoadedIndex:
+    """
+    A FAISS index and the chunks at its positions, plus its sidecars: the
+    source -> vector id map,
+    the content hashes of each source's chunks (for deduplication), the
+    tombstoned ids (deleted, but not yet compacted away) and the BM25 index,
+    whose positions match the FAISS ids.
+
+    A memory-mapped (``frozen``) base index is read-only, so vectors added
+    after loading go to a small flat ``delta`` index at the following
+    positions until the next merge writes a combined base.
+    """
+
+    def __init__(self, index: faiss.Index, chunks: ChunkStore, source_ids=None, tombstones=(), source_hashes=None, lexical=None, frozen=False):
+        self.index = index
+        self.chunks = chunks
+        self.frozen = frozen
+        self.delta: Optional[faiss.Index] = None
+        self.tombstones = set(tombstones)
+        if source_ids is None or source_hashes is None:
+            source_ids, source_hashes = _build_source_maps(chunks, self.tombstones)
+        self.source_ids = source_ids
+        self.source_hashes = source_hashes
+        if lexical is None or len(lexical) != self.ntotal:
+            lexical = BM25Index.from_texts(chunks.text(position) for position in range(self.ntotal))
+        self.lexical = lexical
+        self._tombstone_selector = None
+        self._tombstone_array = None
+        self._fingerprints: Dict[str, str] = {}
+        self._vectorstore: Optional[FAISS] = None
+        # Held while reading or appending; swapping in a new index never waits for it
+        self.lock = threading.RLock()
+        self.pins = 0
+        self.retired = False
+
+    def retire(self):
+        """This index was replaced; release it once no query has it pinned. Caller holds _lock."""
+        self.retired = True
+        if self.pins == 0:
+            self.close()
+
+    def close(self):
+        """Drop the FAISS index, chunk store and BM25 maps so their memory is returned."""
+        self.index = self.delta = self.chunks = self.lexical = self._vectorstore = None
+
+    @property
+    def vectorstore(self) -> FAISS:
+        """A LangChain FAISS wrapper over this index, for callers that want one."""
+        if self._vectorstore is None:
+            self._vectorstore = FAISS(get_embeddings(), self.index, _ChunkDocstore(self), _PositionIds(self))
+        return self._vectorstore
+
+    def _doc(self, position: int) -> Optional[Document]:
+        if not 0 <= position < len(self.chunks):
+            return None
+        return self.chunks.document(position)
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal + (self.delta.ntotal if self.delta is not None else 0)
+
+    @property
+    def live_count(self) -> int:
+        return self.ntotal - len(self.tombstones)
+
+    def add(self, texts, vectors, metadatas):
+        """Append already-embedded chunks."""
+        start = self.ntotal
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.frozen:
+            if self.delta is None:
+                self.delta = faiss.IndexFlatL2(self.index.d)
+            self.delta.add(vectors)
+        else:
+            self.index.add(vectors)
+        self.chunks.append(texts, metadatas)
+        self.lexical.add(texts)
+        for position, (text, metadata) in enumerate(zip(texts, metadatas), start):
+            if metadata.get("source") is not None:
+                self.source_ids.setdefault(metadata["source"], []).append(position)
+                self.source_hashes.setdefault(metadata["source"], set()).add(content_hash(text))
+                self._fingerprints.pop(metadata["source"], None)
+
+    def contains(self, source: Optional[str], text_hash: str) -> bool:
+        return text_hash in self.source_hashes.get(source, ())
+
+    def delete_source(self, source: str) -> int:
+        """Tombstone every vector of a document so it no longer shows up in search."""
+        positions = self.source_ids.pop(source, [])
+        self.source_hashes.pop(source, None)
+        self._fingerprints.pop(source, None)
+        if positions:
+            self.tombstones.update(positions)
+            self._tombstone_selector = None
+            self._tombstone_array = None
+        return len(positions)
+
+    def fingerprint(self, source: str) -> Optional[str]:
+        if source not in self._fingerprints:
+            hashes = self.source_hashes.get(source)
+            if not hashes:
+                return None
+            self._fingerprints[source] = content_hash("".join(sorted(hashes)))
+        return self._fingerprints[source]
+
+    def replay(self, number: int):
+        entries, vectors = _read_segment(number)
+        if vectors is None:
+            for entry in entries:
+                self.delete_source(entry["delete_source"])
+        else:
+            self.add(
+                [entry["text"] for entry in entries],
+                vectors,
+                [entry["metadata"] for entry in entries],
+            )
+
+    def needs_compaction(self) -> bool:
+        return bool(self.tombstones) and len(self.tombstones) >= TOMBSTONE_COMPACTION_RATIO * self.ntotal
+
+    def vectors(self, positions: Optional[List[int]] = None) -> np.ndarray:
+        """Stored vectors at ``positions`` (all if None), from the base and delta indexes."""
+        if positions is None:
+            positions = range(self.ntotal)
+        positions = np.asarray(positions, dtype=np.int64)
+        base_count = self.index.ntotal
+        in_base = positions < base_count
+        result = np.empty((len(positions), self.index.d), dtype=np.float32)
+        result[in_base] = ann.reconstruct(self.index, positions[in_base])
+        if not in_base.all():
+            result[~in_base] = ann.reconstruct(self.delta, positions[~in_base] - base_count)
+        return result
+
+    def _set_index(self, index: faiss.Index):
+        self.index = index
+        if self._vectorstore is not None:
+            self._vectorstore.index = index
+        self.delta = None
+        self.frozen = False
+
+    def materialize(self):
+        """Fold the delta into a writable copy of the base index."""
+        if not self.frozen:
+            return
+        index = ann.writable_copy(self.index)
+        if self.delta is not None:
+            index.add(ann.reconstruct(self.delta))
+        self._set_index(index)
+
+    def compact(self):
+        """
+        Physically drop tombstoned vectors; the remaining ones are renumbered.
+        The index is rebuilt from the kept vectors (HNSW and IVF ids cannot be
+        removed in place without breaking the positional id mapping).
+        """
+        if not self.tombstones:
+            return
+        kept = [position for position in range(self.ntotal) if position not in self.tombstones]
+        index = ann.empty_like(self.index)
+        if kept:
+            index.add(self.vectors(kept))
+        self.chunks = self.chunks.select(kept)
+        self._set_index(index)
+        self.lexical = self.lexical.compact(self.tombstones)
+        self.tombstones = set()
+        self._tombstone_selector = None
+        self._tombstone_array = None
+        self.source_ids, self.source_hashes = _build_source_maps(self.chunks)
+
+    def needs_rebuild(self, kind: Optional[str] = None) -> bool:
+        """True if the index is not of type ``kind`` (INDEX_TYPE) but has enough vectors to train one."""
+        kind = kind or INDEX_TYPE
+        return ann.index_type(self.index) != kind and ann.can_build(kind, self.live_count)
+
+    def rebuild(self, kind: Optional[str] = None):
+        """Train a new index of type ``kind`` (INDEX_TYPE) on the stored vectors and re-add them all."""
+        kind = kind or INDEX_TYPE
+        vectors = self.vectors()
+        live = [position for position in range(self.ntotal) if position not in self.tombstones]
+        index = ann.create_index(kind, vectors[live] if live else vectors)
+        index.add(vectors)
+        self._set_index(index)
+        self._tombstone_selector = None
+
+    def search(
+        self,
+        vector: np.ndarray,
+        k: int,
+        document_source: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+    ):
+        return self.search_many(vector, k, document_source, nprobe=nprobe, ef_search=ef_search)[0]
+
+    def search_many(
+        self,
+        vectors: np.ndarray,
+        k: int,
+        document_source: Optional[str] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """(position, distance) hits for each row of ``vectors``, from one FAISS search over the matrix."""
+        empty = [[] for _ in range(len(vectors))]
+        allowed = None
+        selector = None
+        if document_source is not None:
+            ids = self.source_ids.get(document_source)
+            if not ids:
+                return empty
+            k = min(k, len(ids))
+            allowed = np.asarray(ids, dtype=np.int64)
+            selector = faiss.IDSelectorBatch(allowed)
+        elif self.tombstones:
+            if self._tombstone_selector is None:
+                hidden = faiss.IDSelectorBatch(np.fromiter(self.tombstones, dtype=np.int64))
+                # Keep a reference to the inner selector; FAISS does not own it
+                self._tombstone_selector = (faiss.IDSelectorNot(hidden), hidden)
+            selector = self._tombstone_selector[0]
+        k = min(k, self.live_count)
+        if k <= 0 or not len(vectors):
+            return empty
+        base = self.index
+        params = ann.search_parameters(base, selector, nprobe=nprobe, ef_search=ef_search)
+        scores, positions = base.search(vectors, k, params=params)
+        results = [
+            [(int(position), float(score)) for score, position in zip(row_scores, row_positions) if position != -1]
+            for row_scores, row_positions in zip(scores, positions)
+        ]
+        if self.delta is not None and self.delta.ntotal:
+            delta = self._search_delta(vectors, k, allowed)
+            results = [sorted(hits + extra, key=lambda hit: hit[1])[:k] for hits, extra in zip(results, delta)]
+        return results
+
+    def _search_delta(self, vectors: np.ndarray, k: int, allowed: Optional[np.ndarray]):
+        offset = self.index.ntotal
+        if allowed is not None:
+            local = allowed[allowed >= offset] - offset
+        else:
+            local = np.setdiff1d(np.arange(self.delta.ntotal), np.fromiter(self.tombstones, dtype=np.int64) - offset)
+        if not len(local):
+            return [[] for _ in range(len(vectors))]
+        selector = faiss.IDSelectorBatch(local)
+        scores, positions = self.delta.search(vectors, min(k, len(local)), params=faiss.SearchParameters(sel=selector))
+        return [
+            [(int(position) + offset, float(score)) for score, position in zip(row_scores, row_positions) if position != -1]
+            for row_scores, row_positions in zip(scores, positions)
+        ]
+
+    def lexical_search(self, query: str, k: int, document_source: Optional[str] = None):
+        allowed = excluded = None
+        if document_source is not None:
+            ids = self.source_ids.get(document_source)
+            if not ids:
+                return []
+            allowed = np.asarray(ids, dtype=np.int64)
+        elif self.tombstones:
+            if self._tombstone_array is None:
+                self._tombstone_array = np.asarray(sorted(self.tombstones), dtype=np.int64)
+            excluded = self._tombstone_array
+        return self.lexical.search(query, k, allowed=allowed, excluded=excluded)
+
+    def documents(self, hits) -> List[Tuple[Document, float]]:
+        """Resolve (position, score) hits to documents."""
+        results = []
+        for position, score in hits:
+            doc = self._doc(position)
+            if doc is not None:
+                results.append((doc, score))
+        return results
+
+
+def _load_base(base_info: Optional[dict] = None) -> _LoadedIndex:
+    """
+    Map the base snapshot into memory. Only the vocabulary and sidecars are
+    parsed; vectors (with INDEX_MMAP), chunk texts and metadata stay on disk
+    until used.
+    """
+    directory = _base_dir(base_info)
+    if not chunkstore.exists(directory):
+        if os.path.exists(_path(LEGACY_DOCSTORE_FILE)):
+            raise LegacyStoreError(
+                f"{VECTORSTORE_PATH} uses the pickled index.pkl layout; "
+                "convert it with `python migrate_vectorstore.py`"
+            )
+        raise FileNotFoundError(f"No chunk store in {VECTORSTORE_PATH}")
+    index = ann.read_index(os.path.join(directory, INDEX_FILE), mmap=INDEX_MMAP)
+    chunks = ChunkStore.open(directory)
+    try:
+        with open(os.path.join(directory, TOMBSTONES_FILE)) as f:
+            tombstones = json.load(f)
+    except FileNotFoundError:
+        tombstones = []
+    lexical = BM25Index.load(directory)
+    try:
+        with open(os.path.join(directory, SOURCES_FILE)) as f:
+            source_ids = json.load(f)
+        with open(os.path.join(directory, HASHES_FILE)) as f:
+            source_hashes = {source: set(hashes) for source, hashes in json.load(f).items()}
+    except (FileNotFoundError, ValueError):
+        # Stores written before the sidecars existed: derive them from the docstore
+        source_ids = source_hashes = None
+    return _LoadedIndex(index, chunks, source_ids, tombstones, source_hashes, lexical, frozen=INDEX_MMAP)
+
+
+def _install(index: _LoadedIndex, base_version: int, applied_segment: int, generation: Optional[int] = None):
+    """Make ``index`` the shared index and retire the one it replaces. Caller holds _lock."""
+    global _index, _generation, _base_version, _applied_segment
+    previous = _index
+    _index = index
+    _base_version, _applied_segment = base_version, applied_segment
+    _generation = read_generation() if generation is None else generation
+    if previous is not None and previous is not index:
+        previous.retire()
+
+
+def _refresh():
+    """
+    Bring the in-memory store up to date with the disk, replaying only new
+    segments unless the base itself was rewritten. While the snapshot watcher
+    runs, a rewritten base is left to it: the current index keeps serving
+    (with its segments) until the new one is loaded in the background.
+    Caller holds _reader() and _lock.
+    """
+    global _generation, _applied_segment
+    base_info = _read_base_info()
+    if _index is None or base_info["version"] != _base_version:
+        if _index is not None and _watcher is not None:
+            return
+        index = _load_base(base_info)
+        applied = base_info["merged_through"]
+        for number in _segment_numbers(after=applied):
+            index.replay(number)
+            applied = number
+        _install(index, base_info["version"], applied)
+        return
+    with _index.lock:
+        for number in _segment_numbers(after=_applied_segment):
+            _index.replay(number)
+            _applied_segment = number
+    _generation = read_generation()
+
+
+def _get_index() -> _LoadedIndex:
+    generation = read_generation()
+    if _index is not None and generation == _generation:
+        return _index
+    with _reader(), _lock:
+        if _index is None or read_generation() != _generation:
+            _refresh()
+        return _index
+
+
+@contextmanager
+def _pinned():
+    """
+    Pin the current index for the duration of a query, so that a swap retires
+    it only after the query finishes. Read it while holding its ``lock``.
+    """
+    _get_index()
+    with _lock:
+        index = _index
+        index.pins += 1
+    try:
+        yield index
+    finally:
+        with _lock:
+            index.pins -= 1
+            if index.retired and index.pins == 0:
+                index.close()
+
+
+def _poll_snapshot() -> bool:
+    """
+    One watcher step: if the manifest points at a new base snapshot, load it
+    without holding any lock queries need, then replay newer segments onto it
+    and swap it in. Returns True if a new base was installed.
+    """
+    base_info = _read_base_info()
+    if _index is None or base_info["version"] == _base_version or not vectorstore_exists():
+        return False
+    started = time.perf_counter()
+    index = _load_base(base_info)
+    with _reader(), _lock:
+        if _read_base_info()["version"] != base_info["version"]:
+            return False  # superseded while loading; the next poll takes the newer one
+        applied = base_info["merged_through"]
+        for number in _segment_numbers(after=applied):
+            index.replay(number)
+            applied = number
+        _install(index, base_info["version"], applied)
+    SWAP_SECONDS.observe(time.perf_counter() - started)
+    return True
+
+
+def _watch(interval: float):
+    while not _watcher_stop.wait(interval):
+        try:
+            _poll_snapshot()
+        except FileNotFoundError:
+            pass  # the snapshot was pruned mid-load; the next poll reads the new manifest
+        except Exception as e:
+            print(f"⚠️ Index snapshot watcher: {e}")
+
+
+def start_snapshot_watcher(interval: float = SNAPSHOT_POLL_INTERVAL):
+    """
+    Poll the base manifest every ``interval`` seconds in a background thread
+    and hot-swap to new snapshots, so merges made by other processes are
+    picked up without a query ever waiting for a base to load.
+    """
+    global _watcher
+    with _lock:
+        if _watcher is not None and _watcher.is_alive():
+            return
+        _watcher_stop.clear()
+        _watcher = threading.Thread(target=_watch, args=(interval,), name="vectorstore-watcher", daemon=True)
+        _watcher.start()
+
+
+def stop_snapshot_watcher():
+    global _watcher
+    _watcher_stop.set()
+    if _watcher is not None:
+        _watcher.join()
+        _watcher = None
+
+
+def get_vectorstore() -> FAISS:
+    """
+    Return the shared vectorstore, catching up with the disk only when the
+    on-disk generation differs from the one held in memory. The wrapper is
+    not pinned: use it for the call at hand rather than keeping it across
+    snapshot swaps.
+    """
+    return _get_index().vectorstore
+
+
+def current_generation() -> Optional[int]:
+    """Generation of the index held in memory, or None if nothing is loaded."""
+    return _generation
+
+
+def _write_base(index: _LoadedIndex, version: int, merged_through: int):
+    """
+    Write ``index`` as a new immutable snapshot, then point the manifest at it.
+    Caller holds the exclusive store file lock.
+    """
+    name = f"{SNAPSHOTS_DIR}/base-{version:08d}"
+    directory = _path(name)
+    tmp_dir = directory + ".tmp"
+    # Either may be left over from a merge that crashed before the pointer flip
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    index.materialize()
+    faiss.write_index(index.index, os.path.join(tmp_dir, INDEX_FILE))
+    index.chunks.save(tmp_dir)
+    with open(os.path.join(tmp_dir, SOURCES_FILE), "w") as f:
+        json.dump(index.source_ids, f)
+    with open(os.path.join(tmp_dir, TOMBSTONES_FILE), "w") as f:
+        json.dump(sorted(index.tombstones), f)
+    with open(os.path.join(tmp_dir, HASHES_FILE), "w") as f:
+        json.dump({source: sorted(hashes) for source, hashes in index.source_hashes.items()}, f)
+    index.lexical.save(tmp_dir)
+    os.replace(tmp_dir, directory)
+    # Read chunk texts back through the new files instead of holding copies
+    index.chunks = ChunkStore.open(directory)
+    _atomic_write(_path(BASE_FILE), json.dumps({
+        "version": version, "merged_through": merged_through, "snapshot": name, "created": time.time(),
+    }))
+    _prune_snapshots()
+
+
+def _replace_store(index: _LoadedIndex) -> int:
+    """Write ``index`` as the new base, dropping pending segments. Caller holds _writer()."""
+    base_info = _read_base_info()
+    numbers = _segment_numbers()
+    merged_through = max([base_info["merged_through"]] + numbers)
+    version = base_info["version"] + 1
+    _write_base(index, version, merged_through)
+    for number in numbers:
+        _remove_segment(number)
+    with _lock:
+        generation = _bump_generation()
+        _install(index, version, merged_through, generation)
+        return generation
+
+
+def _from_langchain(vectorstore: FAISS, tombstones=()) -> _LoadedIndex:
+    """Copy a LangChain FAISS store's documents, in index order, into a chunk store."""
+    chunks = ChunkStore()
+    for position in range(vectorstore.index.ntotal):
+        doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id.get(position))
+        if isinstance(doc, Document):
+            chunks.append([doc.page_content], [doc.metadata])
+        else:
+            chunks.append([""], [{}])
+    return _LoadedIndex(vectorstore.index, chunks, tombstones=tombstones)
+
+
+def save_vectorstore(vectorstore: FAISS) -> int:
+    """
+    Replace the whole store with a LangChain FAISS ``vectorstore`` and make it
+    the shared instance. Pending segments are discarded, so the caller must
+    pass a complete store.
+    """
+    with _file_lock(MERGE_LOCK_FILE), _writer():
+        return _replace_store(_from_langchain(vectorstore))
+
+
+def migrate_vectorstore(keep_legacy: bool = False) -> int:
+    """
+    Convert a store saved in LangChain's pickled layout (index.faiss +
+    index.pkl) to the native chunk store in place. Vector positions, source
+    maps and tombstones are unchanged; pending segments are folded in.
+
+    This is the only place index.pkl is unpickled, so run it only on a store
+    you wrote yourself. Returns the number of chunks converted.
+    """
+    with _file_lock(MERGE_LOCK_FILE), _writer():
+        legacy_path = _path(LEGACY_DOCSTORE_FILE)
+        if not os.path.exists(legacy_path):
+            raise FileNotFoundError(f"No {LEGACY_DOCSTORE_FILE} to migrate in {VECTORSTORE_PATH}")
+        with open(legacy_path, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        vectorstore = FAISS(get_embeddings(), faiss.read_index(_path(INDEX_FILE)), docstore, index_to_docstore_id)
+        try:
+            with open(_path(TOMBSTONES_FILE)) as f:
+                tombstones = json.load(f)
+        except FileNotFoundError:
+            tombstones = []
+        index = _from_langchain(vectorstore, tombstones)
+        base_info = _read_base_info()
+        numbers = _segment_numbers(after=base_info["merged_through"])
+        for number in numbers:
+            index.replay(number)
+        version = base_info["version"] + 1
+        merged_through = numbers[-1] if numbers else base_info["merged_through"]
+        _write_base(index, version, merged_through)
+        for number in numbers:
+            _remove_segment(number)
+        if keep_legacy:
+            os.replace(legacy_path, legacy_path + ".bak")
+        else:
+            os.remove(legacy_path)
+        with _lock:
+            _install(index, version, merged_through, _bump_generation())
+        return index.ntotal
+
+
+def add_documents(chunks: List[Document]) -> int:
+    """
+    Add chunks to the shared vectorstore (creating it if needed).
+
+    The chunks are appended to the segment log and to the in-memory index;
+    the base index is not rewritten. Returns the new index generation.
+    """
+    if not chunks:
+        return read_generation()
+    # Encode outside the locks so queries and other writers are not blocked
+    vectors = get_embeddings().embed_documents([chunk.page_content for chunk in chunks])
+    return add_embedded_documents(chunks, vectors)
+
+
+def add_embedded_documents(chunks: List[Document], vectors, schedule: bool = True) -> int:
+    """
+    Append chunks whose embeddings were already computed, as one segment.
+
+    Chunks whose text is already indexed for the same source (or repeated
+    within the batch) are skipped, so re-ingesting a document does not grow
+    the index. With ``schedule=False`` no background merge is started; bulk
+    loaders call merge_segments() themselves when done.
+    """
+    global _generation, _applied_segment
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    with _writer():
+        index = _get_index() if vectorstore_exists() else None
+        seen = set()
+        keep = []
+        for position, chunk in enumerate(chunks):
+            key = (chunk.metadata.get("source"), content_hash(chunk.page_content))
+            if key in seen or (index is not None and index.contains(*key)):
+                continue
+            seen.add(key)
+            keep.append(position)
+        if not keep:
+            return read_generation()
+
+        texts = [chunks[position].page_content for position in keep]
+        metadatas = [dict(chunks[position].metadata) for position in keep]
+        ids = [str(uuid.uuid4()) for _ in keep]
+        vectors = vectors[keep]
+
+        CHUNKS_INDEXED.inc(len(keep))
+        if index is None:
+            index = _LoadedIndex(faiss.IndexFlatL2(vectors.shape[1]), ChunkStore())
+            index.add(texts, vectors, metadatas)
+            return _replace_store(index)
+
+        number = _next_segment_number()
+        _write_segment(number, ids, texts, vectors, metadatas)
+        with _lock, index.lock:
+            index.add(texts, vectors, metadatas)
+            _applied_segment = number
+            _generation = _bump_generation()
+            generation = _generation
+        pending = len(_segment_numbers(after=_read_base_info()["merged_through"]))
+
+    if schedule and pending >= SEGMENT_MERGE_THRESHOLD:
+        schedule_merge()
+    return generation
+
+
+def is_document_current(source: str, chunks: List[Document]) -> bool:
+    """True if ``source`` is indexed with exactly these chunk texts."""
+    if not vectorstore_exists():
+        return False
+    indexed = _get_index().source_hashes.get(source)
+    return indexed is not None and indexed == {content_hash(chunk.page_content) for chunk in chunks}
+
+
+def replace_document(source: str, chunks: List[Document], vectors=None) -> int:
+    """
+    Index a (re-)uploaded document. An unchanged document is left alone; a
+    changed one has its old chunks tombstoned before the new ones are added.
+    Unchanged chunks come from the embedding cache, unless the caller already
+    embedded ``chunks`` as ``vectors``. Returns the number of chunks written.
+    """
+    if is_document_current(source, chunks):
+        return 0
+    delete_document(source)
+    if vectors is None:
+        add_documents(chunks)
+    elif chunks:
+        add_embedded_documents(chunks, vectors)
+    return len({content_hash(chunk.page_content) for chunk in chunks})
+
+
+def delete_document(source: str) -> int:
+    """
+    Remove a document from search by tombstoning its vectors.
+
+    Nothing is re-embedded: the deletion is logged as a segment and takes
+    effect immediately; the vectors are physically dropped by the next merge
+    once tombstones pass TOMBSTONE_COMPACTION_RATIO. Returns the number of
+    chunks removed (0 if the source is not indexed).
+    """
+    global _generation, _applied_segment
+    if not vectorstore_exists():
+        return 0
+    with _writer():
+        index = _get_index()
+        with _lock, index.lock:
+            if source not in index.source_ids:
+                return 0
+            number = _next_segment_number()
+            _write_delete_segment(number, source)
+            removed = index.delete_source(source)
+            CHUNKS_DELETED.inc(removed)
+            _applied_segment = number
+            _generation = _bump_generation()
+            needs_compaction = index.needs_compaction()
+
+    if needs_compaction:
+        schedule_merge()
+    return removed
+
+
+def merge_segments(compact: Optional[bool] = None, rebuild: Optional[bool] = None) -> bool:
+    """
+    Fold all committed segments into the base index, compacting tombstoned
+    vectors away when ``compact`` is set (by default, once they pass
+    TOMBSTONE_COMPACTION_RATIO).
+
+    This is also the training step for ANN backends: the index is rebuilt as
+    INDEX_TYPE when ``rebuild`` is set, or by default once it is of another
+    type and holds enough vectors to train one.
+
+    The new base is built from the files on disk rather than the live index,
+    so queries and appends keep running while it is written. Returns False if
+    there was nothing to do or another merge is already running.
+    """
+    with _file_lock(MERGE_LOCK_FILE, blocking=False) as acquired:
+        if not acquired:
+            return False
+        # Only a merge rewrites the base or removes segments, and merges are
+        # exclusive, so reading them needs no store lock.
+        base_info = _read_base_info()
+        numbers = _segment_numbers(after=base_info["merged_through"])
+        if not numbers and not compact and not rebuild:
+            return False
+        started = time.perf_counter()
+        index = _load_base()
+        for number in numbers:
+            index.replay(number)
+        if compact is None:
+            compact = index.needs_compaction()
+        if rebuild is None:
+            rebuild = index.needs_rebuild()
+        elif rebuild and not ann.can_build(INDEX_TYPE, index.live_count):
+            rebuild = False
+        if not numbers and not index.tombstones and not rebuild:
+            return False
+        if compact:
+            index.compact()
+        if rebuild:
+            index.rebuild()
+        merged_through = numbers[-1] if numbers else base_info["merged_through"]
+
+        with _writer():
+            version = base_info["version"] + 1
+            _write_base(index, version, merged_through)
+            for number in numbers:
+                _remove_segment(number)
+            if INDEX_MMAP:
+                # Serve the new base from the mapped file, not the copy built in RAM
+                index = _load_base()
+            with _lock:
+                generation = _bump_generation()
+                if _index is not None:
+                    # Swap the merged index in, replaying anything appended
+                    # while it was being built; queries already running on
+                    # the old index finish on it.
+                    for number in _segment_numbers(after=merged_through):
+                        index.replay(number)
+                        merged_through = number
+                    _install(index, version, merged_through, generation)
+                source_ids = {source: list(ids) for source, ids in index.source_ids.items()}
+        MERGE_SECONDS.observe(time.perf_counter() - started)
+    for listener in list(_merge_listeners):
+        try:
+            listener(source_ids)
+        except Exception as e:
+            print(f"⚠️ Merge listener {getattr(listener, '__name__', listener)}: {e}")
+    return True
+
+
+def add_merge_listener(listener: Callable[[Dict[str, List[int]]], None]):
+    """
+    Call ``listener`` with the source -> vector positions map of each new
+    base this process merges (compaction renumbers positions).
+    """
+    if listener not in _merge_listeners:
+        _merge_listeners.append(listener)
+
+
+def compact_vectorstore() -> bool:
+    """Merge pending segments and physically drop every tombstoned vector."""
+    return merge_segments(compact=True)
+
+
+def rebuild_index() -> bool:
+    """
+    Merge pending segments and retrain the index as INDEX_TYPE (e.g. after
+    the corpus has grown enough that the IVF lists should be re-clustered).
+    Returns False if there are too few vectors to train it.
+    """
+    return merge_segments(rebuild=True)
+
+
+def schedule_merge():
+    """Run merge_segments() in a background thread unless one is running."""
+    global _merge_thread
+    with _lock:
+        if _merge_thread is not None and _merge_thread.is_alive():
+            return
+        _merge_thread = threading.Thread(target=merge_segments, name="vectorstore-merge", daemon=True)
+        _merge_thread.start()
+
+
+def document_fingerprint(source: str) -> Optional[str]:
+    """
+    Hash of a document's indexed chunk texts: stable while the document is
+    unchanged (including no-op re-uploads), different once it is re-uploaded
+    with new content, and None once it is deleted.
+    """
+    if not vectorstore_exists():
+        return None
+    with _pinned() as index, index.lock:
+        return index.fingerprint(source)
+
+
+def position_ranges(positions) -> List[List[int]]:
+    """Sorted positions as [start, end) runs, e.g. [3, 4, 5, 9] -> [[3, 6], [9, 10]]."""
+    ranges: List[List[int]] = []
+    for position in sorted(positions):
+        if ranges and ranges[-1][1] == position:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([position, position + 1])
+    return ranges
+
+
+def document_ranges(source: str) -> List[List[int]]:
+    """Positions of a document's live vectors in the index, as [start, end) runs."""
+    if not vectorstore_exists():
+        return []
+    with _pinned() as index, index.lock:
+        return position_ranges(index.source_ids.get(source, ()))
+
+
+def list_sources() -> List[str]:
+    """Document sources present in the index."""
+    return sorted(_get_index().source_ids)
+
+
+def similarity_search(
+    query: str,
+    k: int = 4,
+    document_source: Optional[str] = None,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Search the shared index, optionally restricted to one document's vectors.
+
+    Scoped searches pass an ID selector to FAISS, so the k nearest chunks of
+    that document are returned at the cost of an unfiltered search instead
+    of post-filtering a global top-k. Tombstoned vectors are excluded the
+    same way. ``nprobe`` (IVF) and ``ef_search`` (HNSW) override the
+    configured speed/recall trade-off for this query.
+    """
+    with span("embed_query"):
+        vector = np.array([get_embeddings().embed_query(query)], dtype=np.float32)
+    with span("vector_search", mode="vector", k=k), _pinned() as index, index.lock:
+        return index.documents(index.search(vector, k, document_source, nprobe=nprobe, ef_search=ef_search))
+
+
+def document_vectors(docs: List[Document]) -> np.ndarray:
+    """
+    Vectors of documents returned by a search, read back from the index by
+    position instead of re-embedded. Documents whose position no longer holds
+    their chunk (e.g. the index was compacted since) are embedded again.
+    """
+    positions = [int(doc.id) if doc.id and doc.id.isdigit() else -1 for doc in docs]
+    with _pinned() as index, index.lock:
+        stored = [
+            number for number, position in enumerate(positions)
+            if 0 <= position < index.ntotal and index.chunks.text(position) == docs[number].page_content
+        ]
+        vectors = np.empty((len(docs), index.index.d), dtype=np.float32)
+        if stored:
+            vectors[stored] = index.vectors([positions[number] for number in stored])
+    missing = sorted(set(range(len(docs))) - set(stored))
+    if missing:
+        vectors[missing] = np.asarray(
+            get_embeddings().embed_documents([docs[number].page_content for number in missing]), dtype=np.float32
+        )
+    return vectors
+
+
+def lexical_search(
+    query: str,
+    k: int = 4,
+    document_source: Optional[str] = None,
+) -> List[Tuple[Document, float]]:
+    """BM25 keyword search over the same chunks; scores are BM25 (higher is better)."""
+    with span("vector_search", mode="lexical", k=k), _pinned() as index, index.lock:
+        return index.documents(index.lexical_search(query, k, document_source))
+
+
+def _fuse(rankings, k: int) -> List[Tuple[int, float]]:
+    """Reciprocal rank fusion of several ranked hit lists."""
+    fused: Dict[int, float] = {}
+    for hits in rankings:
+        for rank, (position, _) in enumerate(hits):
+            fused[position] = fused.get(position, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def hybrid_search(
+    query: str,
+    k: int = 4,
+    document_source: Optional[str] = None,
+    candidates: int = HYBRID_CANDIDATES,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    Fuse the top ``candidates`` dense and BM25 hits with reciprocal rank
+    fusion, so chunks matching exact terms (clause numbers, defined terms,
+    party names) are found even when their embedding is not among the
+    nearest. Scores are RRF scores (higher is better).
+    """
+    with span("embed_query"):
+        vector = np.array([get_embeddings().embed_query(query)], dtype=np.float32)
+    with span("vector_search", mode="hybrid", k=k), _pinned() as index, index.lock:
+        depth = max(k, candidates)
+        dense = index.search(vector, depth, document_source, nprobe=nprobe, ef_search=ef_search)
+        return index.documents(_fuse([dense, index.lexical_search(query, depth, document_source)], k))
+
+
+def embed_queries(queries: List[str]) -> np.ndarray:
+    """
+    Embed several queries in one model call. The configured sentence-transformers
+    model encodes queries and documents alike, so the batch goes through
+    ``embed_documents`` of the uncached model and does not fill the chunk cache.
+    """
+    embeddings = get_embeddings()
+    model = getattr(embeddings, "embeddings", embeddings)
+    return np.asarray(model.embed_documents(list(queries)), dtype=np.float32).reshape(len(queries), -1)
+
+
+def batch_search(
+    queries: List[str],
+    k: int = 4,
+    document_source: Optional[str] = None,
+    search_type: str = RETRIEVAL_MODE,
+    vectors: Optional[np.ndarray] = None,
+    candidates: int = HYBRID_CANDIDATES,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+) -> List[List[Tuple[Document, float]]]:
+    """
+    Results for many queries at once: one embedding call (skipped if
+    ``vectors`` are given, e.g. to reuse them across documents), one FAISS
+    search over the query matrix, and BM25 per query for "hybrid" and
+    "lexical". A chunk retrieved by several queries is read once and the
+    same Document is returned to each, so shared context is not duplicated.
+    Scores are as in the single-query search of the same ``search_type``.
+    """
+    if search_type not in ("vector", "lexical", "hybrid"):
+        raise ValueError(f"Unknown search type {search_type!r}")
+    if not queries:
+        return []
+    if search_type != "lexical" and vectors is None:
+        with span("embed_query", queries=len(queries)):
+            vectors = embed_queries(queries)
+    with span("vector_search", mode=search_type, k=k, queries=len(queries)), _pinned() as index:
+        with index.lock:
+            depth = max(k, candidates) if search_type == "hybrid" else k
+            if search_type == "lexical":
+                ranked = [index.lexical_search(query, k, document_source) for query in queries]
+            else:
+                dense = index.search_many(vectors, depth, document_source, nprobe=nprobe, ef_search=ef_search)
+                if search_type == "vector":
+                    ranked = dense
+                else:
+                    ranked = [
+                        _fuse([hits, index.lexical_search(query, depth, document_source)], k)
+                        for query, hits in zip(queries, dense)
+                    ]
+            docs = {position: index._doc(position) for position in {position for hits in ranked for position, _ in hits}}
+    return [[(docs[position], score) for position, score in hits if docs[position] is not None] for hits in ranked]
+
+
+def reset_vectorstore():
+    """Drop the in-memory index so the next access reloads it from disk."""
+    global _index, _generation, _base_version, _applied_segment
+    with _lock:
+        if _index is not None:
+            _index.retire()
+        _index = None
+        _generation = None
+        _base_version = None
+        _applied_segment = 0
+
+
+def _index_collector():
+    """Index size and generation, read at scrape time without loading the index."""
+    index = _index
+    yield "legalview_index_generation", "gauge", "On-disk index generation", [({}, read_generation())]
+    if index is None:
+        return
+    yield "legalview_index_vectors", "gauge", "Vectors in the loaded index, tombstoned ones included", [({}, index.ntotal)]
+    yield "legalview_index_live_vectors", "gauge", "Searchable vectors in the loaded index", [({}, index.live_count)]
+    yield "legalview_index_documents", "gauge", "Documents in the loaded index", [({}, len(index.source_ids))]
+    pending = len(_segment_numbers(after=_read_base_info()["merged_through"]))
+    yield "legalview_index_pending_segments", "gauge", "Segments not yet merged into the base", [({}, pending)]
+    yield "legalview_index_base_version", "gauge", "Version of the base snapshot being served", [({}, _base_version or 0)]
+    size = 0
+    directory = _base_dir()
+    if chunkstore.exists(directory):
+        for name in [INDEX_FILE] + chunkstore.store_files(directory):
+            try:
+                size += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    yield "legalview_index_base_bytes", "gauge", "Size of the base index and chunk store on disk", [({}, size)]
+
+
+REGISTRY.add_collector(_index_collector)
+
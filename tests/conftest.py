@@ -0,0 +1,32 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import modules.answer_cache as answer_cache
+import modules.catalog as catalog
+import modules.embeddings as embeddings_module
+import modules.summaries as summaries
+import modules.terms as terms
+import modules.vectorstore as vectorstore
+
+
+@pytest.fixture
+def fake_store(tmp_path, monkeypatch):
+    """Point the registry at a temporary directory with a fake embedding model"""
+    embeddings = DeterministicFakeEmbedding(size=16)
+    monkeypatch.setattr(vectorstore, "VECTORSTORE_PATH", str(tmp_path / "vectorstore"))
+    monkeypatch.setattr(embeddings_module, "_embeddings", embeddings)
+    monkeypatch.setattr(answer_cache, "_answer_cache", answer_cache.AnswerCache(str(tmp_path / "answer_cache")))
+    monkeypatch.setattr(catalog, "_catalog", catalog.DocumentCatalog(str(tmp_path / "catalog.db")))
+    monkeypatch.setattr(terms, "_term_index", terms.TermIndex(str(tmp_path / "terms.db")))
+    monkeypatch.setattr(summaries, "_store", summaries.SummaryStore(str(tmp_path / "summaries.db")))
+    monkeypatch.setattr(summaries, "_summarizer", summaries.StubSummarizer())
+    vectorstore.reset_vectorstore()
+    yield vectorstore
+    vectorstore.stop_snapshot_watcher()
+    if vectorstore._merge_thread is not None:
+        vectorstore._merge_thread.join()
+    vectorstore.reset_vectorstore()
@@ -0,0 +1,58 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain.schema import Document
+
+import modules.ann as ann
+
+
+def _chunks(count, source="data/corpus.txt"):
+    return [Document(page_content=f"Clause {i} of the corpus.", metadata={"source": source}) for i in range(count)]
+
+
+@pytest.mark.parametrize("kind", ["ivfpq", "hnsw"])
+def test_merge_trains_configured_index(fake_store, monkeypatch, kind):
+    monkeypatch.setattr(fake_store, "INDEX_TYPE", kind)
+    monkeypatch.setattr(ann, "IVF_NLIST", 8)
+    monkeypatch.setattr(ann, "PQ_NBITS", 4)
+    fake_store.add_documents(_chunks(700))
+    fake_store.add_documents(_chunks(5, source="data/nda.txt"))
+    assert ann.index_type(fake_store.get_vectorstore().index) == "flat"
+
+    assert fake_store.merge_segments()
+    fake_store.reset_vectorstore()
+    assert ann.index_type(fake_store.get_vectorstore().index) == kind
+
+    hits = fake_store.similarity_search("Clause 3 of the corpus.", k=3, nprobe=8, ef_search=128)
+    assert hits[0][0].page_content == "Clause 3 of the corpus."
+    scoped = fake_store.similarity_search("Clause 3 of the corpus.", k=10, document_source="data/nda.txt", nprobe=8)
+    assert {doc.metadata["source"] for doc, _ in scoped} == {"data/nda.txt"}
+
+    # Deletion and compaction rebuild the index without losing its type
+    fake_store.delete_document("data/nda.txt")
+    assert fake_store.compact_vectorstore()
+    fake_store.reset_vectorstore()
+    assert ann.index_type(fake_store.get_vectorstore().index) == kind
+    assert fake_store.get_vectorstore().index.ntotal == 700
+    assert fake_store.similarity_search("Clause 3 of the corpus.", k=1, nprobe=8)[0][0].page_content == "Clause 3 of the corpus."
+
+
+def test_memory_mapped_base_takes_appends(fake_store, monkeypatch):
+    fake_store.add_documents(_chunks(20))
+    fake_store.merge_segments()
+    monkeypatch.setattr(fake_store, "INDEX_MMAP", True)
+    fake_store.reset_vectorstore()
+
+    fake_store.add_documents([Document(page_content="Late addendum.", metadata={"source": "data/addendum.txt"})])
+    assert fake_store.similarity_search("Late addendum.", k=1)[0][0].page_content == "Late addendum."
+    assert fake_store.similarity_search("Clause 7 of the corpus.", k=1)[0][0].page_content == "Clause 7 of the corpus."
+    fake_store.delete_document("data/addendum.txt")
+    assert fake_store.similarity_search("Late addendum.", k=30)[0][0].page_content != "Late addendum."
+
+    fake_store.add_documents([Document(page_content="Second addendum.", metadata={"source": "data/addendum2.txt"})])
+    assert fake_store.merge_segments(compact=True)
+    assert fake_store._index.frozen
+    assert fake_store._index.ntotal == 21
+    assert fake_store.similarity_search("Second addendum.", k=1)[0][0].page_content == "Second addendum."
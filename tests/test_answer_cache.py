@@ -0,0 +1,113 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import modules.rag_chain as rag_chain
+from modules.answer_cache import AnswerCache, normalize_query
+
+
+def _docs(source, clauses):
+    return [Document(page_content=f"Clause {i}: {text}", metadata={"source": source}) for i, text in enumerate(clauses)]
+
+
+def _put(cache, query, source, document_source=None):
+    cache.put(query, document_source, "v1", "model", f"answer to {query}", [Document(page_content="x", metadata={"source": source})], 1.5)
+
+
+def test_exact_hit_survives_restart(fake_store, tmp_path):
+    fake_store.add_documents(_docs("data/lease.txt", ["rent is due monthly"]))
+    cache = AnswerCache(str(tmp_path / "answers"))
+    assert cache.get("When is rent due?", None, "v1", "model") is None
+    _put(cache, "When is rent due?", "data/lease.txt")
+
+    reloaded = AnswerCache(str(tmp_path / "answers"))
+    hit = reloaded.get("  when IS rent due ", None, "v1", "model")
+    assert hit["cached"] == "exact"
+    assert hit["result"] == "answer to When is rent due?"
+    assert hit["source_documents"][0].metadata["source"] == "data/lease.txt"
+    assert reloaded.get("When is rent due?", None, "v2", "model") is None
+    assert reloaded.get("When is rent due?", "data/lease.txt", "v1", "model") is None
+    stats = reloaded.stats()
+    assert stats["exact_hits"] == 1 and stats["misses"] == 2
+    assert stats["latency_saved_seconds"] == 1.5
+
+
+def test_invalidated_when_cited_document_changes(fake_store, tmp_path):
+    fake_store.add_documents(_docs("data/lease.txt", ["rent is due monthly"]))
+    fake_store.add_documents(_docs("data/nda.txt", ["keep secrets"]))
+    cache = AnswerCache(str(tmp_path / "answers"))
+    _put(cache, "When is rent due?", "data/lease.txt", "data/lease.txt")
+    _put(cache, "What is confidential?", "data/nda.txt", "data/nda.txt")
+
+    # Unrelated and no-op updates keep an answer scoped to one document
+    fake_store.replace_document("data/nda.txt", _docs("data/nda.txt", ["keep secrets"]))
+    fake_store.add_documents(_docs("data/other.txt", ["unrelated"]))
+    assert cache.get("When is rent due?", "data/lease.txt", "v1", "model") is not None
+
+    fake_store.replace_document("data/lease.txt", _docs("data/lease.txt", ["rent is due weekly"]))
+    assert cache.get("When is rent due?", "data/lease.txt", "v1", "model") is None
+    fake_store.delete_document("data/nda.txt")
+    assert cache.get("What is confidential?", "data/nda.txt", "v1", "model") is None
+    assert cache.stats()["invalidations"] == 2
+    assert AnswerCache(str(tmp_path / "answers")).get("When is rent due?", "data/lease.txt", "v1", "model") is None
+
+
+def test_unfiltered_answers_expire_when_documents_are_indexed(fake_store, tmp_path):
+    from modules.catalog import get_catalog
+
+    fake_store.add_documents(_docs("data/lease.txt", ["rent is due monthly"]))
+    get_catalog().record_indexed("data/lease.txt")
+    cache = AnswerCache(str(tmp_path / "answers"))
+    _put(cache, "When is rent due?", "data/lease.txt")
+    _put(cache, "When is rent due?", "data/lease.txt", "data/lease.txt")
+
+    fake_store.add_documents(_docs("data/addendum.txt", ["rent is due weekly from now on"]))
+    get_catalog().record_indexed("data/addendum.txt")
+    assert cache.get("When is rent due?", None, "v1", "model") is None
+    assert cache.get("When is rent due?", "data/lease.txt", "v1", "model") is not None
+
+
+def test_semantic_hit_and_lru_eviction(fake_store, tmp_path, monkeypatch):
+    fake_store.add_documents(_docs("data/lease.txt", ["rent is due monthly"]))
+    vocabulary = ["rent", "due", "termination", "clauses", "when", "is"]
+
+    def embed(text):
+        vector = np.array([float(word in text.split()) for word in vocabulary], dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    cache = AnswerCache(str(tmp_path / "answers"), max_entries=2, threshold=0.85)
+    monkeypatch.setattr(cache, "_embed", embed)
+    _put(cache, "when is rent due", "data/lease.txt")
+    assert cache.get("rent is due when", None, "v1", "model")["cached"] == "semantic"
+    assert cache.get("termination clauses", None, "v1", "model") is None
+
+    _put(cache, "termination clauses", "data/lease.txt")
+    _put(cache, "is rent", "data/lease.txt")
+    assert cache.get("when is rent due", None, "v1", "model") is None  # least recently used
+    assert cache.stats()["entries"] == 2
+
+
+def test_normalize_query():
+    assert normalize_query('  "Force   Majeure?" ') == "force majeure"
+
+
+def test_answer_query_uses_cache(fake_store, monkeypatch):
+    fake_store.add_documents(_docs("data/lease.txt", ["rent is due monthly", "tenant pays utilities"]))
+    llm = FakeListChatModel(responses=["Monthly.", "Weekly."])
+    monkeypatch.setattr(rag_chain, "_llm", llm)
+    monkeypatch.setattr(rag_chain, "_chain", None)
+
+    template = "Define '{question}'"
+    first = rag_chain.answer_query("rent", question_template=template)
+    assert first["cached"] is None and first["result"] == "Monthly."
+    second = rag_chain.answer_query("Rent", question_template=template)
+    assert second["cached"] == "exact" and second["result"] == "Monthly."
+    assert rag_chain.answer_query("rent")["result"] == "Weekly."  # other template, other key
+
+    events = list(rag_chain.stream_answer("rent", question_template=template))
+    assert events[0]["cached"] == "exact"
+    assert [event["text"] for event in events[1:]] == ["Monthly."]
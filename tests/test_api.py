@@ -0,0 +1,78 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from langchain.schema import Document
+
+from backend import main
+
+
+@pytest.fixture
+def client(fake_store, tmp_path, monkeypatch):
+    """The API over the fake store, with data/ in a temporary directory (no lifespan workers)"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    return TestClient(main.app)
+
+
+def test_delete_removes_document_chunks_from_search(client, fake_store, tmp_path):
+    (tmp_path / "data" / "nda.txt").write_text("Confidential information stays confidential.")
+    fake_store.add_documents([
+        Document(page_content=f"Clause {i}: confidential information", metadata={"source": "data/nda.txt"})
+        for i in range(3)
+    ] + [Document(page_content="Clause 1: rent is due monthly", metadata={"source": "data/lease.txt"})])
+
+    response = client.delete("/documents/nda.txt")
+    assert response.status_code == 200
+    assert response.json()["removed_chunks"] == 3
+    assert not (tmp_path / "data" / "nda.txt").exists()
+    hits = fake_store.similarity_search("confidential information", k=4)
+    assert {doc.metadata["source"] for doc, _ in hits} == {"data/lease.txt"}
+
+    assert client.delete("/documents/nda.txt").status_code == 404
+
+
+def test_upload_is_queued_and_indexed_by_a_worker(client, fake_store, tmp_path, monkeypatch):
+    from modules import catalog, jobs
+
+    queue = jobs.JobQueue(str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(jobs, "_queue", queue)
+    response = client.post("/upload", files={"file": ("nda.txt", b"Confidential Information means any information.")})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert client.get(f"/jobs/{job_id}").json()["status"] == jobs.QUEUED
+    assert catalog.get_catalog().get("nda.txt")["status"] == catalog.QUEUED
+
+    assert jobs.process_next(queue, "w")
+    assert client.get(f"/jobs/{job_id}").json()["status"] == jobs.SUCCEEDED
+    assert client.get("/documents/nda.txt").json()["status"] == catalog.INDEXED
+
+
+def test_query_filter_must_name_an_indexed_document(client, fake_store):
+    from modules import catalog
+
+    fake_store.add_documents([Document(page_content="Rent is due monthly.", metadata={"source": "data/lease.txt"})])
+    catalog.get_catalog().record_upload("data/draft-lease.txt", 10)
+
+    response = client.post("/query", json={"query": "When is rent due?", "document_filter": "draft-lease"})
+    assert response.status_code == 409 and "queued" in response.json()["detail"]
+    response = client.post("/query", json={"query": "When is rent due?", "document_filter": "contract"})
+    assert response.status_code == 404
+
+
+def test_every_frontend_query_type_is_accepted(client, fake_store, monkeypatch):
+    from modules.rag_chain import QUERY_TEMPLATES
+
+    fake_store.add_documents([Document(page_content="Rent is due monthly.", metadata={"source": "data/lease.txt"})])
+
+    async def answer(question, document_source, question_template):
+        return {"result": question_template, "source_documents": []}
+
+    monkeypatch.setattr(main, "aanswer_query", answer)
+    # The chat interface's mode buttons send these
+    for query_type in ("general", "term", "summary"):
+        response = client.post("/query", json={"query": "notice", "query_type": query_type})
+        assert response.status_code == 200 and response.json()["answer"] == QUERY_TEMPLATES[query_type]
+    assert client.post("/query", json={"query": "notice", "query_type": "poem"}).status_code == 400
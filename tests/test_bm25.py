@@ -0,0 +1,56 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+
+from modules.bm25 import BM25Index, tokenize
+
+
+def test_tokenize_keeps_clause_numbers():
+    assert tokenize("See Section 4.2(b) of the Non-Disclosure Agreement.") == [
+        "see", "section", "4.2", "b", "non-disclosure", "agreement"
+    ]
+
+
+def test_search_save_load_and_compact(tmp_path):
+    index = BM25Index.from_texts([
+        "The tenant shall pay rent monthly.",
+        "Force majeure excuses performance.",
+        "Rent increases are capped; rent is due on the first.",
+    ])
+    assert [position for position, _ in index.search("rent", 3)] == [2, 0]
+    assert index.search("rent", 3, excluded=[2])[0][0] == 0
+    assert index.search("rent", 3, allowed=[0, 1])[0][0] == 0
+
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    loaded.add(["Force majeure: floods and strikes."])
+    assert {position for position, _ in loaded.search("force majeure", 5)} == {1, 3}
+
+    compacted = loaded.compact([0, 1])
+    assert len(compacted) == 2
+    assert [position for position, _ in compacted.search("rent", 5)] == [0]
+    assert [position for position, _ in compacted.search("floods", 5)] == [1]
+
+
+def test_hybrid_search_finds_exact_terms(fake_store):
+    chunks = [
+        Document(page_content=f"Clause {i}: general provisions about notices and payments.", metadata={"source": "data/msa.txt"})
+        for i in range(30)
+    ]
+    chunks.append(Document(page_content="Acme Holdings indemnifies the Licensee.", metadata={"source": "data/license.txt"}))
+    fake_store.add_documents(chunks)
+
+    # Fake embeddings are random, so only the lexical side can find the party name
+    hits = fake_store.hybrid_search("Who does Acme Holdings indemnify?", k=3)
+    assert "data/license.txt" in [doc.metadata["source"] for doc, _ in hits]
+    assert fake_store.lexical_search("Acme", k=3, document_source="data/msa.txt") == []
+
+    fake_store.delete_document("data/license.txt")
+    assert fake_store.lexical_search("Acme", k=3) == []
+    fake_store.add_documents([Document(page_content="Acme Holdings may terminate.", metadata={"source": "data/license.txt"})])
+    fake_store.compact_vectorstore()
+    fake_store.reset_vectorstore()
+    hits = fake_store.lexical_search("Acme", k=3)
+    assert [doc.page_content for doc, _ in hits] == ["Acme Holdings may terminate."]
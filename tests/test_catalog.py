@@ -0,0 +1,60 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.catalog as catalog
+import modules.jobs as jobs
+from ingest import ingest
+
+
+def test_lookups_by_exact_name_then_prefix(tmp_path):
+    documents = catalog.DocumentCatalog(str(tmp_path / "catalog.db"))
+    for name in ("Lease.pdf", "lease-2024.pdf", "leasehold.txt", "NDA.pdf"):
+        documents.record_upload(f"data/{name}", 10, catalog.INDEXED)
+    documents.record_upload("data/contract.pdf", 10)
+
+    assert documents.get("lease.PDF")["source"] == "data/Lease.pdf"
+    assert [doc["name"] for doc in documents.find_prefix("lease")] == ["lease-2024.pdf", "Lease.pdf", "leasehold.txt"]
+    assert documents.find_prefix("lease-")[0]["name"] == "lease-2024.pdf"
+    assert documents.resolve("nda.pdf") == "data/NDA.pdf"
+    assert documents.resolve("lease") == "data/Lease.pdf"  # exact stem before longer names
+    assert documents.resolve("leaseh") == "data/leasehold.txt"
+    assert documents.resolve("All Documents") is None
+    # Only indexed documents can be searched; the lookup still finds the others
+    assert documents.resolve("contract") is None
+    assert documents.lookup("contract")["status"] == catalog.QUEUED
+    assert documents.resolve("contract", status=None) == "data/contract.pdf"
+    assert documents.list(status=catalog.QUEUED)[0]["status"] == catalog.QUEUED
+
+
+def test_ingestion_records_counts_ranges_and_failures(fake_store, tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    for name in ("a", "b"):
+        (corpus / f"{name}.txt").write_text(f"Agreement {name}. " + "The tenant shall pay rent monthly. " * 60)
+    ingest(str(corpus), workers=1)
+
+    documents = catalog.get_catalog()
+    indexed = documents.list(status=catalog.INDEXED)
+    assert [doc["name"] for doc in indexed] == ["a.txt", "b.txt"]
+    ranges = {doc["source"]: doc["vector_ranges"] for doc in indexed}
+    for doc in indexed:
+        assert doc["chunks"] > 1 and doc["pages"] == 1
+        assert doc["content_hash"] == catalog.file_hash(doc["source"])
+        assert sum(end - start for start, end in doc["vector_ranges"]) == doc["chunks"]
+
+    # Compaction renumbers the vectors; the catalog follows through the merge listener
+    first = str(corpus / "a.txt")
+    fake_store.delete_document(first)
+    assert fake_store.merge_segments(compact=True)
+    moved = documents.get("b.txt")["vector_ranges"]
+    assert moved != ranges[str(corpus / "b.txt")] and moved == fake_store.document_ranges(str(corpus / "b.txt"))
+
+    queue = jobs.JobQueue(str(tmp_path / "jobs.db"))
+    missing = str(tmp_path / "gone.txt")
+    documents.record_upload(missing)
+    queue.enqueue(missing, max_attempts=1)
+    jobs.process_next(queue, "w")
+    failed = documents.get("gone.txt")
+    assert failed["status"] == catalog.FAILED and "FileNotFoundError" in failed["error"]
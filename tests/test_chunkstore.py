@@ -0,0 +1,44 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.chunkstore import ChunkStore, write_store
+
+
+def test_roundtrip_append_and_select(tmp_path):
+    write_store(str(tmp_path), [
+        ("Clause 1: términos", {"source": "data/a.pdf", "page": 1}),
+        ("", {"source": "data/a.pdf"}),
+        ("Clause 3", {"source": "data/b.pdf", "page": 1, "tags": ["nda", "mutual"]}),
+    ])
+    store = ChunkStore.open(str(tmp_path))
+    assert len(store) == 3
+    assert store.text(0) == "Clause 1: términos"
+    assert store.text(1) == ""
+    assert store.metadata(1) == {"source": "data/a.pdf"}
+    assert store.metadata(2) == {"source": "data/b.pdf", "page": 1, "tags": ["nda", "mutual"]}
+
+    store.append(["Clause 4"], [{"source": "data/c.pdf"}])
+    codes, values = store.column("source")
+    assert [values[code] for code in codes] == ["data/a.pdf", "data/a.pdf", "data/b.pdf", "data/c.pdf"]
+
+    kept = store.select([0, 2, 3])
+    assert [kept.text(position) for position in range(len(kept))] == ["Clause 1: términos", "Clause 3", "Clause 4"]
+    os.makedirs(tmp_path / "compacted")
+    kept.save(str(tmp_path / "compacted"))
+    compacted = ChunkStore.open(str(tmp_path / "compacted"))
+    assert compacted.metadata(0) == {"source": "data/a.pdf", "page": 1}
+    assert compacted.document(2).metadata == {"source": "data/c.pdf"}
+
+
+def test_open_store_survives_replacement(tmp_path):
+    """A reader keeps the files it opened when a merge swaps in a new store"""
+    write_store(str(tmp_path), [("Old text", {"source": "data/a.pdf"})])
+    store = ChunkStore.open(str(tmp_path))
+    replacement = tmp_path / "new"
+    os.makedirs(replacement)
+    write_store(str(replacement), [("New", {"page": 9})])
+    for name in os.listdir(replacement):
+        os.replace(replacement / name, tmp_path / name)
+    assert store.document(0).page_content == "Old text"
+    assert store.metadata(0) == {"source": "data/a.pdf"}
@@ -0,0 +1,39 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from modules.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return super().embed_documents(texts)
+
+
+def test_cache_serves_repeated_texts(tmp_path):
+    """Only unseen texts reach the model; cached vectors match the originals"""
+    model = CountingEmbeddings(size=8)
+    cached = CachedEmbeddings(model, EmbeddingCache("test/model", path=str(tmp_path)))
+
+    first = cached.embed_documents(["clause a", "clause b", "clause a"])
+    assert model.calls == 2
+    second = cached.embed_documents(["clause b", "clause a", "clause c"])
+    assert model.calls == 3
+    assert second[0] == pytest.approx(first[1])
+    assert second[1] == pytest.approx(first[0])
+
+
+def test_cache_persists_across_instances(tmp_path):
+    """A second process opening the same cache directory sees earlier vectors"""
+    model = CountingEmbeddings(size=8)
+    CachedEmbeddings(model, EmbeddingCache("test/model", path=str(tmp_path))).embed_documents(["definitions"])
+
+    reopened = EmbeddingCache("test/model", path=str(tmp_path))
+    assert reopened.get_many(["definitions"])[0] is not None
+    assert EmbeddingCache("other/model", path=str(tmp_path)).get_many(["definitions"]) == [None]
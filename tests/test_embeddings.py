@@ -0,0 +1,46 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from modules.embeddings import PARITY_SAMPLES, EmbeddingParityError, SentenceEmbeddings, parity_check
+
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    """A small randomly initialized MiniLM-shaped model, built locally so no download is needed"""
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+    from sentence_transformers import SentenceTransformer, models
+
+    directory = tmp_path_factory.mktemp("tiny_model")
+    words = sorted({word.strip('".,?\'').lower() for text in PARITY_SAMPLES for word in text.split()})
+    (directory / "vocab.txt").write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words))
+    BertTokenizerFast(str(directory / "vocab.txt")).save_pretrained(str(directory / "hf"))
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=len(words) + 5, hidden_size=64, num_hidden_layers=2,
+                        num_attention_heads=4, intermediate_size=128)
+    BertModel(config).save_pretrained(str(directory / "hf"))
+    transformer = models.Transformer(str(directory / "hf"))
+    SentenceTransformer(modules=[transformer, models.Pooling(64), models.Normalize()]).save(str(directory / "st"))
+    return str(directory / "st")
+
+
+def test_int8_backend_matches_fp32(tiny_model):
+    reference = SentenceEmbeddings(tiny_model)
+    quantized = SentenceEmbeddings(tiny_model, backend="int8", batch_size=3)
+
+    assert any(isinstance(module, torch.ao.nn.quantized.dynamic.Linear) for module in quantized.model.modules())
+    assert quantized.cache_name == f"{tiny_model}@int8" and reference.cache_name == tiny_model
+    parity = parity_check(quantized, reference, min_cosine=0.99)
+    assert parity["mean_cosine"] >= parity["min_cosine"] >= 0.99
+    assert len(quantized.embed_query("Governing law")) == 64
+
+
+def test_parity_check_rejects_drifted_vectors(tiny_model):
+    with pytest.raises(EmbeddingParityError):
+        parity_check(DeterministicFakeEmbedding(size=64), SentenceEmbeddings(tiny_model))
+    with pytest.raises(ValueError):
+        SentenceEmbeddings(tiny_model, backend="fp16")
@@ -0,0 +1,51 @@
+import pytest
+import os
+import sys
+import asyncio
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.executor import BoundedExecutor, ConcurrencyLimiter, PoolSaturated
+
+
+def test_bounded_executor_rejects_when_queue_is_full():
+    """Work beyond workers + queue is refused with the current queue depth"""
+    executor = BoundedExecutor("test", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolSaturated) as excinfo:
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(*running)
+        return excinfo.value
+
+    error = asyncio.run(scenario())
+    assert error.queue_depth == 1
+    assert error.to_dict()["pool"] == "test"
+    assert executor.in_flight == 0
+
+
+def test_limiter_caps_concurrency():
+    """At most `limit` holders run at once; the rest wait until the queue fills"""
+    limiter = ConcurrencyLimiter("llm", limit=2, max_queue=1)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.in_flight - limiter.queue_depth)
+            await asyncio.sleep(0.02)
+
+    async def scenario():
+        tasks = [asyncio.ensure_future(call()) for _ in range(3)]
+        await asyncio.sleep(0)
+        with pytest.raises(PoolSaturated):
+            await call()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert peak == 2
+    assert limiter.in_flight == 0
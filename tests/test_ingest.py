@@ -0,0 +1,76 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ingest
+
+
+def _write_corpus(directory, count):
+    for i in range(count):
+        (directory / f"contract_{i}.txt").write_text(
+            " ".join(f"Clause {j} of contract {i}: the parties agree to term {j}." for j in range(60))
+        )
+    (directory / "notes.md").write_text("ignored")
+
+
+def test_ingest_directory_in_parallel(fake_store, tmp_path):
+    """Directory ingestion parses in worker processes and commits in segments"""
+    corpus = tmp_path / "data"
+    corpus.mkdir()
+    _write_corpus(corpus, 4)
+
+    stats = ingest.ingest(str(corpus), workers=2, batch_size=4, commit_size=8)
+    assert stats.files_done == 4
+    assert stats.files_failed == 0
+    assert stats.chunks > 8
+    assert stats.chunks_per_second > 0
+
+    fake_store.reset_vectorstore()
+    assert fake_store.get_vectorstore().index.ntotal == stats.chunks
+    assert len(fake_store.list_sources()) == 4
+    assert fake_store._segment_numbers() == []  # merged at the end of the run
+
+
+def test_ingest_invalid_path(fake_store, tmp_path):
+    assert ingest.ingest(str(tmp_path / "missing")) is None
+
+
+def test_reingest_unchanged_corpus_is_skipped(fake_store, tmp_path):
+    """A second run over the same files embeds nothing and keeps the index size"""
+    corpus = tmp_path / "data"
+    corpus.mkdir()
+    _write_corpus(corpus, 2)
+    first = ingest.ingest(str(corpus), workers=1)
+    size = fake_store.get_vectorstore().index.ntotal
+
+    second = ingest.ingest(str(corpus), workers=1)
+    assert second.files_unchanged == 2
+    assert second.chunks == 0
+    assert fake_store.get_vectorstore().index.ntotal == size == first.chunks
+
+
+def test_large_pdf_is_streamed_and_reingest_is_skipped(fake_store, tmp_path, monkeypatch):
+    """Large PDFs go through the page pool and are embedded as pages arrive"""
+    from modules import loader
+    from test_loader import write_pdf
+
+    monkeypatch.setattr(loader, "PDF_PARALLEL_MIN_PAGES", 4)
+    monkeypatch.setattr(ingest, "PDF_PARALLEL_MIN_PAGES", 4)
+    corpus = tmp_path / "data"
+    corpus.mkdir()
+    _write_corpus(corpus, 1)
+    write_pdf(corpus / "agreement.pdf", [[f"Section {n}.1 Payment", f"Clause {n}: the buyer pays invoice {n}."] for n in range(6)])
+
+    first = ingest.ingest(str(corpus), workers=2, batch_size=2, commit_size=3)
+    assert first.files_done == 2 and first.files_failed == 0
+    assert first.pages == 7
+    results = fake_store.lexical_search("invoice 4", k=1, document_source=str(corpus / "agreement.pdf"))
+    assert results[0][0].metadata["page"] == 4
+    assert results[0][0].metadata["section"] == "Section 4.1 Payment"
+
+    size = fake_store.get_vectorstore().index.ntotal
+    second = ingest.ingest(str(corpus), workers=2, batch_size=2, commit_size=3)
+    assert second.files_unchanged == 2
+    assert second.chunks == 0
+    assert fake_store.get_vectorstore().index.ntotal == size
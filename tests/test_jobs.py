@@ -0,0 +1,95 @@
+import pytest
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.jobs as jobs
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return jobs.JobQueue(str(tmp_path / "jobs.db"))
+
+
+def test_claims_by_priority_then_age(queue):
+    """Higher priorities run first; equal priorities in upload order"""
+    low = queue.enqueue("data/low.txt")
+    first = queue.enqueue("data/first.txt", priority=5)
+    second = queue.enqueue("data/second.txt", priority=5)
+
+    assert [queue.claim("w")["id"] for _ in range(3)] == [first["id"], second["id"], low["id"]]
+    assert queue.claim("w") is None
+    assert queue.get(low["id"])["status"] == jobs.RUNNING
+
+
+def test_failures_retry_with_backoff_then_fail(queue, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_RETRY_DELAY", 60)
+    job = queue.enqueue("data/a.txt", max_attempts=2)
+
+    queue.claim("w")
+    assert queue.fail(job["id"], "w", "boom") == jobs.QUEUED
+    retrying = queue.get(job["id"])
+    assert retrying["error"] == "boom" and retrying["available_at"] >= time.time() + 50
+    assert queue.claim("w") is None  # still backing off
+
+    with queue._transaction() as db:
+        db.execute("UPDATE jobs SET available_at = 0")
+    assert queue.claim("w")["attempts"] == 2
+    assert queue.fail(job["id"], "w", "boom again") == jobs.FAILED
+    assert queue.get(job["id"])["status"] == jobs.FAILED
+
+    assert queue.retry(job["id"])["status"] == jobs.QUEUED
+    assert queue.claim("w")["attempts"] == 1
+
+
+def test_silent_worker_job_is_reclaimed(queue, monkeypatch):
+    job = queue.enqueue("data/a.txt")
+    queue.claim("dead-worker")
+    assert queue.claim("w") is None
+
+    monkeypatch.setattr(jobs, "JOB_STALE_SECONDS", -1)
+    reclaimed = queue.claim("w")
+    assert reclaimed["id"] == job["id"] and reclaimed["worker"] == "w" and reclaimed["attempts"] == 2
+
+    # The presumed-dead worker comes back: its reports no longer apply to the job
+    assert not queue.complete(job["id"], "dead-worker", 1, 1)
+    assert queue.fail(job["id"], "dead-worker", "late") is None
+    assert queue.get(job["id"])["status"] == jobs.RUNNING
+    assert queue.complete(job["id"], "w", 1, 1)
+    assert queue.get(job["id"])["status"] == jobs.SUCCEEDED
+
+
+def test_job_that_keeps_killing_workers_is_failed(fake_store, queue, tmp_path, monkeypatch):
+    from modules import catalog
+
+    path = str(tmp_path / "poison.pdf")
+    catalog.get_catalog().record_upload(path, 1)
+    job = queue.enqueue(path, max_attempts=2)
+    queue.claim("first")
+    monkeypatch.setattr(jobs, "JOB_STALE_SECONDS", -1)
+    assert queue.claim("second")["attempts"] == 2
+
+    # The second worker dies too: no attempts are left, so the job is not requeued
+    assert not jobs.process_next(queue, "third")
+    failed = queue.get(job["id"])
+    assert failed["status"] == jobs.FAILED and "attempt 2 of 2" in failed["error"]
+    assert catalog.get_catalog().get_by_source(path)["status"] == catalog.FAILED
+
+
+def test_worker_indexes_queued_upload(fake_store, queue, tmp_path):
+    path = tmp_path / "nda.txt"
+    path.write_text("Confidential Information means any information disclosed by either party.")
+    missing = queue.enqueue(str(tmp_path / "gone.txt"), max_attempts=1)
+    job = queue.enqueue(str(path), priority=1)
+
+    assert jobs.process_next(queue, "w")
+    done = queue.get(job["id"])
+    assert done["status"] == jobs.SUCCEEDED and done["progress"] == 1
+    assert done["chunks"] == done["indexed_chunks"] == 1
+    assert fake_store.similarity_search("Confidential Information", k=1, document_source=str(path))
+
+    assert jobs.process_next(queue, "w")
+    assert "FileNotFoundError" in queue.get(missing["id"])["error"]
+    assert not jobs.process_next(queue, "w")
+    assert queue.stats()["jobs"] == {"queued": 0, "running": 0, "succeeded": 1, "failed": 1}
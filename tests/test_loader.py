@@ -0,0 +1,61 @@
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+import modules.loader as loader
+from modules.splitter import iter_split, split_documents
+
+
+def write_pdf(path, pages):
+    """Write a PDF whose pages hold the given lines of text"""
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    for lines in pages:
+        page = writer.add_blank_page(612, 792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)})
+        })
+        escaped = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines]
+        content = DecodedStreamObject()
+        content.set_data(("BT /F1 11 Tf 14 TL 72 720 Td " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET").encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+def test_find_headings():
+    text = "ARTICLE IV\nSection 4.2 Termination\nThe Tenant shall pay rent, monthly,\n4.3 Fees\n12. The parties agree that this is a sentence.\nDEFINITIONS AND INTERPRETATION"
+    assert loader.find_headings(text) == ["ARTICLE IV", "Section 4.2 Termination", "4.3 Fees", "DEFINITIONS AND INTERPRETATION"]
+
+
+def test_pages_stream_in_order_with_sections(tmp_path, monkeypatch):
+    """Pages of a large PDF come from the page pool in order, carrying the section in effect"""
+    pages = []
+    for number in range(12):
+        lines = [f"Body text of page {number} about the lease."]
+        if number % 4 == 0:
+            lines = [f"ARTICLE {number // 4 + 1}"] + lines
+        pages.append(lines)
+    path = write_pdf(tmp_path / "lease.pdf", pages)
+    monkeypatch.setattr(loader, "PDF_PARALLEL_MIN_PAGES", 8)
+
+    timings = []
+    documents = list(loader.iter_pdf_pages(path, workers=2, page_batch=3, timings=timings))
+    assert [doc.metadata["page"] for doc in documents] == list(range(12))
+    assert [doc.metadata["section"] for doc in documents] == [f"ARTICLE {n // 4 + 1}" for n in range(12)]
+    assert documents[5].metadata["total_pages"] == 12
+    assert documents[5].metadata["page_label"] == "6"
+    assert "page 5 about" in documents[5].page_content
+    assert sorted(page for page, _ in timings) == list(range(12))
+
+    # Streaming split yields what splitting the whole document does
+    assert [c.page_content for c in iter_split(iter(documents))] == [c.page_content for c in split_documents(documents)]
+    assert [d.page_content for d in loader.load_document(path, workers=1)] == [d.page_content for d in documents]
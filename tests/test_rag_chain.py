@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from langchain.schema import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import modules.rag_chain as rag_chain
+
+
+@pytest.fixture
+def fake_chain(fake_store, monkeypatch):
+    """Shared chain over the fake store with a canned LLM answer"""
+    fake_store.add_documents([
+        Document(page_content=f"Clause {i}: the tenant shall pay rent.", metadata={"source": "data/lease.txt", "page": i})
+        for i in range(3)
+    ] + [Document(page_content="Force majeure excuses performance.", metadata={"source": "data/nda.txt", "page": 0})])
+    monkeypatch.setattr(rag_chain, "_llm", FakeListChatModel(responses=["Rent is due monthly."]))
+    monkeypatch.setattr(rag_chain, "_chain", None)
+    return fake_store
+
+
+def test_stream_answer_sources_then_tokens(fake_chain):
+    events = list(rag_chain.stream_answer("When is rent due?", document_source="data/lease.txt"))
+    assert events[0]["event"] == "sources"
+    assert {doc.metadata["source"] for doc in events[0]["documents"]} == {"data/lease.txt"}
+    tokens = [event["text"] for event in events[1:]]
+    assert all(event["event"] == "token" for event in events[1:])
+    assert len(tokens) > 1
+    assert "".join(tokens) == "Rent is due monthly."
+
+
+def test_astream_answer_matches_invoke(fake_chain):
+    async def collect():
+        return [event async for event in rag_chain.astream_answer("When is rent due?")]
+
+    events = asyncio.run(collect())
+    result = rag_chain.get_rag_chain().invoke({"query": "When is rent due?"})
+    assert events[0]["documents"] == result["source_documents"]
+    assert "".join(event["text"] for event in events[1:]) == result["result"]
+
+
+def test_batch_answers_every_pair_with_one_embedding_call(fake_chain, monkeypatch):
+    calls = []
+    model = type(fake_chain.get_embeddings())
+    embed_documents = model.embed_documents
+    monkeypatch.setattr(model, "embed_documents", lambda self, texts: calls.append(list(texts)) or embed_documents(self, texts))
+
+    questions = ["When is rent due?", "What is force majeure?", "When is rent due?"]
+    items = list(rag_chain.answer_batch(questions, ["data/lease.txt", "data/nda.txt"], concurrency=2))
+
+    assert len(calls) == 1 and len(calls[0]) == 2  # distinct questions, one call
+    assert sorted((item["document_source"], item["index"]) for item in items) == sorted(
+        (source, index) for source in ("data/lease.txt", "data/nda.txt") for index in range(3)
+    )
+    for item in items:
+        assert item["result"] == "Rent is due monthly."
+        assert item["source_documents"] == rag_chain.retrieve_context(item["question"], item["document_source"])
+
+    async def collect():
+        return [item async for item in rag_chain.aanswer_batch(questions + ["Who pays for repairs?"], ["data/lease.txt"])]
+
+    # Answered pairs are now served from the answer cache; its lookups (and the new
+    # answer's cache entry) use one embedding call for all questions, not one per pair
+    calls.clear()
+    monkeypatch.setattr(model, "embed_query", lambda self, text: pytest.fail("question embedded on its own"))
+    items = asyncio.run(collect())
+    assert {item["cached"] for item in items if item["index"] < 3} == {"exact"}
+    assert [item["cached"] for item in items if item["index"] == 3] == [None]
+    assert len(calls[0]) == 3 and len(calls) == 2  # cache lookups, then retrieval of the new question
+
+
+def test_context_merges_overlapping_neighbours_within_budget(fake_store):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text = " ".join(f"Sentence {i} of the lease sets out obligation {i}." for i in range(40))
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=60)
+    chunks = splitter.split_documents([Document(page_content=text, metadata={"source": "data/lease.txt"})])
+    fake_store.add_documents(chunks)
+    candidates = [doc for doc, _ in fake_store.lexical_search("lease obligation", k=len(chunks))]
+    assert len(candidates) == len(chunks) > 3
+
+    merged = rag_chain.assemble_context(candidates, token_budget=10_000)
+    assert [doc.page_content for doc in merged] == [text]  # the overlap appears once
+    assert rag_chain.estimate_tokens(text) < sum(rag_chain.estimate_tokens(doc.page_content) for doc in chunks)
+
+    packed = rag_chain.assemble_context(candidates, token_budget=120)
+    assert rag_chain._context_tokens(packed) <= 120
+    assert candidates[0].page_content in "".join(doc.page_content for doc in packed)
+    assert rag_chain.assemble_context(candidates, token_budget=0) == candidates[:3]
+
+
+def test_context_prefers_new_information_over_repeats(fake_store):
+    clause = "The tenant shall keep the premises in good repair."
+    fake_store.add_documents([
+        Document(page_content=clause, metadata={"source": "data/lease.txt"}),
+        Document(page_content=clause, metadata={"source": "data/sublease.txt"}),
+        Document(page_content="Rent is payable monthly in advance.", metadata={"source": "data/schedule.txt"}),
+    ])
+    candidates = [doc for doc, _ in fake_store.lexical_search("tenant repair rent", k=3)]
+    candidates.sort(key=lambda doc: (doc.metadata["source"] == "data/schedule.txt", doc.metadata["source"]))  # repeats first
+
+    budget = rag_chain._context_tokens(candidates[:2])
+    context = rag_chain.assemble_context(candidates, token_budget=budget, mmr_lambda=0.5)
+    assert [doc.metadata["source"] for doc in context] == ["data/lease.txt", "data/schedule.txt"]
@@ -0,0 +1,134 @@
+import pytest
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+from multiprocessing.connection import Listener
+
+import modules.shards as shards
+
+SOURCES = [f"data/contract-{i}.pdf" for i in range(6)]
+
+
+def _chunks():
+    return [
+        Document(page_content=f"Clause {i} of {source} on {topic}", metadata={"source": source, "page": i})
+        for source in SOURCES for i, topic in enumerate(("rent", "notice", "indemnity"))
+    ]
+
+
+def test_router_places_documents_by_source_and_merges_shard_results(fake_store):
+    """Two node processes hold whole documents; fan-out results match a single index"""
+    chunks = _chunks()
+    vectors = fake_store.get_embeddings().embed_documents([chunk.page_content for chunk in chunks])
+    fake_store.add_embedded_documents(chunks, vectors)  # the unsharded reference, at the store root
+
+    with shards.ShardNodes(2):
+        router = shards.ShardRouter(2, addresses=[], deadline_ms=5000)
+        router.add_embedded_documents(chunks, vectors)
+        assert router.list_sources() == sorted(SOURCES)
+        for shard, client in enumerate(router.clients):
+            placed = client.call("sources")[0]["sources"]
+            assert placed == sorted(source for source in SOURCES if shards.shard_for(source, 2) == shard)
+
+        queries = ["Clause 1 on notice", "indemnity"]
+        for search_type in ("vector", "lexical"):
+            sharded = router.batch_search(queries, k=5, search_type=search_type)
+            single = fake_store.batch_search(queries, k=5, search_type=search_type)
+            if search_type == "vector":
+                assert [[doc.page_content for doc, _ in hits] for hits in sharded] == \
+                       [[doc.page_content for doc, _ in hits] for hits in single]
+            assert all(len(hits) == 5 for hits in sharded)
+
+        scoped = router.similarity_search("Clause 2", k=3, document_source=SOURCES[4])
+        assert {doc.metadata["source"] for doc, _ in scoped} == {SOURCES[4]}
+        docs = [doc for doc, _ in router.batch_search(["rent"], k=6, search_type="vector")[0]]
+        expected = fake_store.get_embeddings().embed_documents([doc.page_content for doc in docs])
+        assert router.document_vectors(docs) == pytest.approx(fake_store.np.asarray(expected, dtype="float32"))
+
+        assert router.is_document_current(SOURCES[0], [chunk for chunk in chunks if chunk.metadata["source"] == SOURCES[0]])
+        assert router.delete_document(SOURCES[0]) == 3
+        assert router.document_fingerprint(SOURCES[0]) is None
+        assert SOURCES[0] not in router.list_sources()
+
+
+def _stand_in_node(address, results, delay):
+    """A node on a local socket that answers every request with ``results`` after ``delay`` seconds"""
+    listener = Listener(address, authkey=shards.authkey_for(address))
+
+    def serve():
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return
+            while True:
+                try:
+                    message, _ = shards._recv(conn)
+                except (EOFError, OSError):
+                    break
+                time.sleep(delay)
+                try:
+                    shards._send(conn, {"results": [results for _ in message["queries"]]})
+                except OSError:
+                    break
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener
+
+
+def test_slow_shard_is_dropped_at_the_deadline(fake_store, tmp_path):
+    hit = [{"text": "Notice period", "metadata": {"source": "data/fast.pdf"}, "id": "0"}, 0.5]
+    fast = _stand_in_node(str(tmp_path / "fast.sock"), [hit], 0)
+    slow = _stand_in_node(str(tmp_path / "slow.sock"), [], 5)
+    router = shards.ShardRouter(2, addresses=[], deadline_ms=200)
+    router.clients = [shards.ShardClient(0, fast.address), shards.ShardClient(1, slow.address)]
+    timeouts = shards.SHARD_TIMEOUTS.samples()
+
+    started = time.perf_counter()
+    hits = router.lexical_search("notice", k=3)
+    assert time.perf_counter() - started < 1.0
+    assert [(doc.page_content, score) for doc, score in hits] == [("Notice period", 0.5)]
+    assert shards.SHARD_TIMEOUTS.samples() != timeouts
+
+    slow_source = next(f"data/{i}.pdf" for i in range(100) if shards.shard_for(f"data/{i}.pdf", 2) == 1)
+    with pytest.raises(shards.ShardTimeout):
+        router.lexical_search("notice", k=3, document_source=slow_source)
+    fast.close()
+    slow.close()
+
+
+def test_failed_shards_are_skipped_and_reported_as_errors_not_timeouts(fake_store, tmp_path):
+    hit = [{"text": "Notice period", "metadata": {"source": "data/fast.pdf"}, "id": "0"}, 0.5]
+    fast = _stand_in_node(str(tmp_path / "fast.sock"), [hit], 0)
+    router = shards.ShardRouter(2, addresses=[], deadline_ms=200)
+    router.clients = [shards.ShardClient(0, fast.address), shards.ShardClient(1, str(tmp_path / "gone.sock"), b"key")]
+    errors = shards.SHARD_ERRORS.samples()
+
+    assert [doc.page_content for doc, _ in router.lexical_search("notice", k=3)] == ["Notice period"]
+    assert shards.SHARD_ERRORS.samples() != errors
+
+    gone_source = next(f"data/{i}.pdf" for i in range(100) if shards.shard_for(f"data/{i}.pdf", 2) == 1)
+    with pytest.raises(shards.ShardError, match="not reachable") as raised:
+        router.lexical_search("notice", k=3, document_source=gone_source)
+    assert not isinstance(raised.value, shards.ShardTimeout)
+    fast.close()
+
+
+def test_nodes_authenticate_with_a_private_key_and_tcp_needs_one_set(fake_store, tmp_path, monkeypatch):
+    monkeypatch.setattr(shards, "SHARD_AUTHKEY", None)
+    key = shards.authkey_for(shards.node_address(0, []))
+    path = os.path.join(fake_store.VECTORSTORE_PATH, shards.SHARDS_DIR, shards.KEY_FILE)
+    assert len(key) == 64 and os.stat(path).st_mode & 0o777 == 0o600
+    assert shards.local_authkey() == key  # shared by every process using this store
+
+    with pytest.raises(ValueError, match="SHARD_AUTHKEY"):
+        shards.ShardRouter(2, addresses=["10.0.0.1:7001", "10.0.0.2:7001"])
+    with pytest.raises(ValueError, match="SHARD_AUTHKEY"):
+        shards.serve_shard(0, str(tmp_path / "shard"), ("127.0.0.1", 0))
+
+    monkeypatch.setattr(shards, "SHARD_AUTHKEY", b"shared secret")
+    assert shards.ShardRouter(2, addresses=["10.0.0.1:7001", "10.0.0.2:7001"]).clients[1].authkey == b"shared secret"
@@ -0,0 +1,64 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+
+from modules.legal_splitter import LegalStructureSplitter
+from modules.splitter import iter_split, split_documents
+
+AGREEMENT = """MASTER SERVICES AGREEMENT
+This Agreement is made between Acme and Borealis.
+ARTICLE I
+DEFINITIONS
+"Affiliate" means any entity controlling a party.
+"Business Day" means a day other than a weekend.
+ARTICLE II
+2.1 Services. The Supplier shall provide the services.
+(a) on time; and
+(b) with due care, including:
+(i) trained staff;
+(ii) adequate tools.
+2.2 Fees. The Customer shall pay the fees within thirty days.
+Section 2.3 Termination
+Either party may terminate on ninety days notice.
+"""
+
+
+def test_chunks_follow_clause_boundaries_with_hierarchy():
+    chunks = LegalStructureSplitter(chunk_size=130).split_documents([Document(page_content=AGREEMENT, metadata={"source": "msa.txt"})])
+    by_start = {chunk.page_content.split("\n")[0]: chunk.metadata for chunk in chunks}
+    assert by_start["ARTICLE I"] == {
+        "source": "msa.txt", "section": "Article I", "section_path": "Article I", "defined_terms": ["Affiliate", "Business Day"],
+    }
+    assert by_start["(i) trained staff;"]["section"] == "Section 2.1(b)(i)–(ii)"
+    assert by_start["(i) trained staff;"]["section_path"].startswith("Article II > Section 2.1 > Section 2.1(b)")
+    assert by_start["Section 2.3 Termination"]["section"] == "Section 2.3"
+    # No clause is cut and nothing is stored twice
+    assert sum(len(chunk.page_content) + 1 for chunk in chunks) == len(AGREEMENT)
+    for line in AGREEMENT.strip().splitlines():
+        assert any(line in chunk.page_content.splitlines() for chunk in chunks)
+
+
+def test_hierarchy_spans_pages_and_overlap_is_optional():
+    pages = [
+        Document(page_content="ARTICLE III\n3.1 Liability. Liability is capped at the fees paid.", metadata={"source": "msa.pdf", "page": 0}),
+        Document(page_content="The cap does not apply to fraud.\n3.2 Insurance. Each party keeps insurance.", metadata={"source": "msa.pdf", "page": 1}),
+    ]
+    chunks = list(iter_split(pages, mode="legal"))
+    assert [chunk.metadata["section"] for chunk in chunks] == ["Article III", "Section 3.1–3.2"]
+
+    plain = LegalStructureSplitter(chunk_size=60).split_documents(pages)
+    overlapped = LegalStructureSplitter(chunk_size=60, chunk_overlap=20).split_documents(pages)
+    assert [chunk.metadata for chunk in overlapped] == [chunk.metadata for chunk in plain]
+    assert overlapped[0].page_content == plain[0].page_content
+    assert overlapped[1].page_content.endswith(plain[1].page_content)
+    assert len(overlapped[1].page_content) > len(plain[1].page_content)
+
+
+def test_recursive_mode_is_default_and_unknown_mode_is_rejected():
+    docs = [Document(page_content="word " * 500, metadata={"source": "a.txt"})]
+    assert len(split_documents(docs)) == 3
+    with pytest.raises(ValueError):
+        split_documents(docs, mode="sentences")
@@ -0,0 +1,174 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import modules.rag_chain as rag_chain
+import modules.summaries as summaries
+
+SOURCE = "data/lease.pdf"
+TOPICS = ["rent", "deposit", "repairs", "insurance", "termination", "notice", "assignment", "utilities"]
+
+
+def _chunks(changed=None):
+    return [
+        Document(
+            page_content=(f"The tenant pays {topic} as set out in clause {i}. " if topic != changed
+                          else f"The landlord now covers {topic} under clause {i}. ") + "Further detail follows. " * 20,
+            metadata={"source": SOURCE, "page": i // 2, "section_path": f"Article {i + 1} > Section {i + 1}.1"},
+        )
+        for i, topic in enumerate(TOPICS)
+    ]
+
+
+def test_tree_is_built_once_and_answers_summary_questions(fake_store, monkeypatch):
+    store = summaries.get_summary_store()
+    assert store.submit(SOURCE, _chunks())
+    worker = summaries.SummaryWorker(1, poll_interval=0.05)
+    worker.start()
+    try:
+        for _ in range(100):
+            if store.document(SOURCE)["status"] == summaries.READY:
+                break
+            summaries.time.sleep(0.05)
+    finally:
+        worker.stop()
+
+    tree = store.tree(SOURCE)
+    assert [leaf["label"] for leaf in tree["levels"][0]] == [f"Article {i + 1}" for i in range(8)]
+    assert len(tree["levels"]) == 2 and tree["root"]["summary"].startswith("The tenant pays rent")
+    assert store.document(SOURCE)["llm_calls"] == 9  # eight sections, one combine
+    assert not store.submit(SOURCE, _chunks())  # unchanged re-upload: nothing to rebuild
+
+    # Summary questions come from the tree, without retrieval or the LLM
+    monkeypatch.setattr(rag_chain, "_llm", FakeListChatModel(responses=["LLM summary"]))
+    monkeypatch.setattr(rag_chain, "_chain", None)
+    events = list(rag_chain.stream_answer("insurance", SOURCE, question_template=rag_chain.SUMMARY_TEMPLATE))
+    assert events[0]["cached"] == "summary"
+    answer = events[1]["text"]
+    assert answer.startswith("**lease.pdf**\n\nThe tenant pays rent")
+    assert "* **Article 4**: The tenant pays insurance" in answer and "Article 2**" not in answer
+    overview = rag_chain.answer_query("main clauses", SOURCE, question_template=rag_chain.SUMMARY_TEMPLATE)
+    assert overview["result"].count("* **Article") == 6
+
+    # No tree for a document yet, no document selected, or a topic no section
+    # mentions: answered by retrieval and the LLM as before
+    fake_store.add_documents([Document(page_content="Rent is due monthly.", metadata={"source": "data/other.pdf"})])
+    for question, document_source in (("rent", "data/other.pdf"), ("main clauses", None), ("arbitration", SOURCE)):
+        result = rag_chain.answer_query(question, document_source, question_template=rag_chain.SUMMARY_TEMPLATE)
+        assert result["cached"] is None and result["result"] == "LLM summary"
+
+
+def test_reupload_resummarizes_only_changed_sections(fake_store):
+    store = summaries.get_summary_store()
+    store.submit(SOURCE, _chunks())
+    assert summaries.summarize_next(store, "w")
+    first = store.tree(SOURCE)
+
+    calls = []
+    stub = summaries.StubSummarizer()
+    counting = type("Counting", (), {
+        "summarize_section": lambda self, label, text: calls.append(label) or stub.summarize_section(label, text),
+        "combine": lambda self, children: calls.append("combine") or stub.combine(children),
+    })()
+    assert store.submit(SOURCE, _chunks(changed="repairs"))
+    # The old tree summarizes the superseded sections: not served until rebuilt
+    assert store.tree(SOURCE) is None and summaries.answer_summary("repairs", SOURCE) is None
+    assert summaries.summarize_next(store, "w", counting)
+    assert not summaries.summarize_next(store, "w", counting)
+
+    assert calls == ["Article 3", "combine"]
+    second = store.tree(SOURCE)
+    assert second["levels"][0][2]["summary"].startswith("The landlord now covers repairs")
+    assert [leaf for number, leaf in enumerate(second["levels"][0]) if number != 2] == \
+           [leaf for number, leaf in enumerate(first["levels"][0]) if number != 2]
+    assert second["root"] != first["root"] and store.document(SOURCE)["llm_calls"] == 2
+
+    store.remove(SOURCE)
+    assert store.tree(SOURCE) is None and summaries.answer_summary("rent", SOURCE) is None
+
+
+def test_sections_that_only_moved_keep_their_summaries(fake_store):
+    def pages(inserted=False):
+        chunks = [
+            Document(page_content=f"Clause {i} covers {TOPICS[i % 8]}. " + "Further detail follows. " * 20,
+                     metadata={"source": SOURCE, "page": i + inserted})
+            for i in range(40)
+        ]
+        if inserted:
+            chunks.insert(0, Document(page_content="Schedule of amendments. " * 5, metadata={"source": SOURCE, "page": 0}))
+        return chunks
+
+    store = summaries.get_summary_store()
+    store.submit(SOURCE, pages())
+    assert summaries.summarize_next(store, "w")
+    first = store.tree(SOURCE)["levels"][0]
+
+    calls = []
+    stub = summaries.StubSummarizer()
+    counting = type("Counting", (), {
+        "summarize_section": lambda self, label, text: calls.append(label) or stub.summarize_section(label, text),
+        "combine": lambda self, children: stub.combine(children),
+    })()
+    # A page inserted at the front shifts the page labels of every section after it
+    assert store.submit(SOURCE, pages(inserted=True))
+    assert summaries.summarize_next(store, "w", counting)
+
+    second = store.tree(SOURCE)["levels"][0]
+    assert [leaf["label"] for leaf in first] == ["Pages 1–32", "Pages 33–36", "Pages 37–40"]
+    assert [leaf["label"] for leaf in second] == ["Pages 1–4", "Pages 5–33", "Pages 34–37", "Pages 38–41"]
+    assert calls == ["Pages 1–4", "Pages 5–33"]
+    assert [leaf["summary"] for leaf in second[2:]] == [leaf["summary"] for leaf in first[1:]]
+    assert not store.submit(SOURCE, pages(inserted=True))
+
+
+def test_builds_heartbeat_and_failed_builds_are_retried_a_bounded_number_of_times(fake_store, monkeypatch):
+    monkeypatch.setattr(summaries, "JOB_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(summaries, "JOB_RETRY_DELAY", 0)
+    store = summaries.get_summary_store()
+    failing = type("Failing", (), {"summarize_section": lambda self, label, text: 1 / 0})()
+
+    store.submit(SOURCE, _chunks())
+    assert summaries.summarize_next(store, "w", failing)
+    retrying = store.document(SOURCE)
+    assert retrying["status"] == summaries.QUEUED and "ZeroDivisionError" in retrying["error"]
+    assert summaries.summarize_next(store, "w", failing)
+    assert store.document(SOURCE)["status"] == summaries.FAILED and not summaries.summarize_next(store, "w")
+
+    # A new upload starts over; the worker heartbeats after every summary it generates
+    heartbeats = []
+    heartbeat = store.heartbeat
+    monkeypatch.setattr(store, "heartbeat", lambda source, worker: heartbeats.append(source) or heartbeat(source, worker))
+    store.submit(SOURCE, _chunks())
+    assert summaries.summarize_next(store, "w")
+    assert store.document(SOURCE)["status"] == summaries.READY and heartbeats == [SOURCE] * 9
+
+    # A build whose worker went silent is taken over, and failed once out of attempts
+    store.submit(SOURCE, _chunks(changed="rent"))
+    store.claim("dead-worker")
+    monkeypatch.setattr(summaries, "JOB_STALE_SECONDS", -1)
+    assert store.claim("w")["attempts"] == 2
+    assert not store.save_tree(SOURCE, "dead-worker", [], 0, 0)
+    assert store.claim("other") is None
+    assert store.document(SOURCE)["status"] == summaries.FAILED
+    assert store.tree(SOURCE) is None  # the last good tree is of the previous upload
+
+
+def test_inserted_section_regenerates_one_node_per_level():
+    texts = [f"Clause {i} sets out obligation number {i}. It applies to both parties." for i in range(32)]
+
+    def sections(texts):
+        return [(f"Part {number + 1}", summaries.content_hash(text), text) for number, text in enumerate(texts)]
+
+    stub = summaries.StubSummarizer()
+    first, _ = summaries.build_tree(sections(texts), {}, stub, fanout=4)
+    previous = {(level, input_hash): summary for level, _, _, input_hash, summary in first}
+    assert max(node[0] for node in first) == 3
+
+    # Group boundaries follow the sections, so the later groups are not shifted by the new one
+    second, calls = summaries.build_tree(sections(["Preamble 0: recitals of the agreement."] + texts), previous, stub, fanout=4)
+    fresh = [node[0] for node in second if (node[0], node[3]) not in previous]
+    assert fresh == [0, 1, 2, 3] and calls == 4
@@ -0,0 +1,56 @@
+import asyncio
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import modules.rag_chain as rag_chain
+import modules.telemetry as telemetry
+
+
+def test_registry_renders_prometheus_text():
+    registry = telemetry.Registry()
+    registry.counter("jobs_total", "Jobs", ["kind"]).inc(2, kind='a "b"')
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    registry.add_collector(lambda: [("queue_depth", "gauge", "Depth", [({"pool": "cpu"}, 3)])])
+    lines = registry.render().splitlines()
+    assert 'jobs_total{kind="a \\"b\\""} 2' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in lines
+    assert "latency_seconds_count 2" in lines
+    assert "# TYPE queue_depth gauge" in lines and 'queue_depth{pool="cpu"} 3' in lines
+
+
+def test_chain_spans_share_the_request_trace(fake_store, tmp_path, monkeypatch):
+    traces = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(telemetry, "TRACE_OTLP_FILE", str(traces))
+    fake_store.add_documents([Document(page_content="Rent is due monthly.", metadata={"source": "data/lease.txt"})])
+    monkeypatch.setattr(rag_chain, "_llm", FakeListChatModel(responses=["Monthly."], callbacks=[telemetry.LLMSpanHandler()]))
+    monkeypatch.setattr(rag_chain, "_chain", None)
+    prompt_builds = telemetry.STAGE_SECONDS.count(stage="prompt_build")
+
+    parent = telemetry.parse_traceparent("00-" + "a" * 32 + "-" + "b" * 16 + "-01")
+
+    async def ask():
+        with telemetry.span("request", parent=parent):
+            return await rag_chain.aanswer_query("When is rent due?")
+
+    assert asyncio.run(ask())["result"] == "Monthly."
+    spans = [
+        span
+        for line in traces.read_text().splitlines()
+        for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    ]
+    by_name = {span["name"]: span for span in spans}
+    assert {"request", "rag_chain", "embed_query", "vector_search", "prompt_build", "llm"} <= set(by_name)
+    assert {span["traceId"] for span in spans} == {"a" * 32}
+    assert by_name["request"]["parentSpanId"] == "b" * 16
+    # Retrieval runs on the CPU pool and the LLM via a callback, both under the chain's span
+    for name in ("embed_query", "vector_search", "llm"):
+        assert by_name[name]["parentSpanId"] == by_name["rag_chain"]["spanId"]
+    assert telemetry.STAGE_SECONDS.count(stage="prompt_build") == prompt_builds + 1
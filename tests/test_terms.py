@@ -0,0 +1,76 @@
+import pytest
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+import modules.rag_chain as rag_chain
+import modules.terms as terms
+from ingest import ingest
+
+LEASE = """1. DEFINITIONS
+"Force Majeure Event" means any event beyond the reasonable control of a Party, including fire, flood and war; "Business Day" means a day other than a Saturday or Sunday on which banks in London are open.
+"Confidential Information" (or "CI") shall have the meaning given in Section 7.
+
+2. PARTIES
+This Lease is made between Acme Corp. (the "Landlord") and John Doe (the "Tenant"). The Tenant shall pay rent on each Business Day.
+"""
+
+
+def test_extracts_definitions_with_aliases(fake_store):
+    definitions = {d["term"]: d for d in terms.extract_definitions([
+        Document(page_content=LEASE, metadata={"source": "data/lease.txt", "page": 2, "section": "Section 1"}),
+    ])}
+    assert set(definitions) == {"Force Majeure Event", "Business Day", "Confidential Information", "Landlord", "Tenant"}
+    assert definitions["Business Day"]["text"].startswith('"Business Day" means a day other than')
+    assert definitions["Business Day"]["text"].endswith("are open.")
+    assert definitions["Force Majeure Event"]["clause"] == "Section 1"
+    assert {"fme", "force majeure events"} <= set(definitions["Force Majeure Event"]["aliases"])
+    assert "ci" in definitions["Confidential Information"]["aliases"]
+    assert definitions["Landlord"]["text"] == 'This Lease is made between Acme Corp. (the "Landlord") and John Doe (the "Tenant").'
+
+    index = terms.get_term_index()
+    index.replace_document("data/lease.txt", list(definitions.values()))
+    assert [row["term"] for row in index.lookup("business days")] == ["Business Day"]
+    assert [row["term"] for row in index.lookup("FME")] == ["Force Majeure Event"]
+    assert [row["term"] for row in index.lookup("force majuere event")] == ["Force Majeure Event"]  # fuzzy
+    assert index.lookup("indemnity") == []
+    assert index.lookup("Tenant", document_source="data/other.txt") == []
+
+
+def test_definition_questions_skip_the_llm(fake_store, tmp_path, monkeypatch):
+    path = tmp_path / "lease.txt"
+    path.write_text(LEASE)
+    ingest(str(path), workers=1)
+    monkeypatch.setattr(rag_chain, "_llm", FakeListChatModel(responses=["An LLM explanation."]))
+    monkeypatch.setattr(rag_chain, "_chain", None)
+
+    events = list(rag_chain.stream_answer("force majeure event", question_template=rag_chain.DEFINITION_TEMPLATE))
+    assert events[0]["cached"] == "definitions"
+    assert events[1]["text"].startswith('* **Force Majeure Event**: "Force Majeure Event" means any event')
+    assert "_(lease.txt" in events[1]["text"]
+    assert events[0]["documents"][0].metadata["defined_term"] == "Force Majeure Event"
+
+    # General questions phrased as definition requests are served from the index too
+    result = rag_chain.answer_query("What does Business Day mean?", document_source=str(path))
+    assert result["cached"] == "definitions" and "Saturday or Sunday" in result["result"]
+    # ...but not questions that merely start like one
+    result = rag_chain.answer_query("What does the Tenant do?", document_source=str(path))
+    assert result["cached"] is None and result["result"] == "An LLM explanation."
+
+    # Explanations and unknown terms go to the LLM
+    for question in ("explain the Force Majeure Event clause", "indemnity"):
+        result = rag_chain.answer_query(question, question_template=rag_chain.DEFINITION_TEMPLATE)
+        assert result["cached"] is None and result["result"] == "An LLM explanation."
+
+    terms.get_term_index().remove(str(path))
+    assert terms.answer_definition("define Tenant") is None
+
+
+def test_parse_definition_question():
+    assert terms.parse_definition_question('What does "Business Day" mean?') == ("Business Day", False)
+    assert terms.parse_definition_question("define the term Force Majeure Event") == ("Force Majeure Event", False)
+    assert terms.parse_definition_question("what does CI stand for") == ("CI", False)
+    assert terms.parse_definition_question("What does the Service Provider do?") == (None, False)
@@ -0,0 +1,263 @@
+import pytest
+import os
+import shutil
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain.schema import Document
+
+
+def test_registry_reuses_loaded_index(fake_store):
+    """The index is loaded once and shared until the generation changes"""
+    generation = fake_store.add_documents([Document(page_content="Termination clause", metadata={"source": "data/a.txt"})])
+    assert generation == 1
+
+    first = fake_store.get_vectorstore()
+    assert fake_store.get_vectorstore() is first
+
+    fake_store.add_documents([Document(page_content="Force majeure", metadata={"source": "data/b.txt"})])
+    assert fake_store.get_vectorstore() is first
+    assert first.index.ntotal == 2
+
+
+def test_registry_catches_up_with_other_writers(fake_store):
+    """Segments from another process are replayed; a rewritten base is reloaded"""
+    fake_store.add_documents([Document(page_content="Governing law", metadata={"source": "data/a.txt"})])
+    first = fake_store.get_vectorstore()
+
+    vectors = fake_store.get_embeddings().embed_documents(["Indemnity"])
+    fake_store._write_segment(1, ["other-1"], ["Indemnity"], fake_store.np.asarray(vectors, dtype="float32"), [{"source": "data/b.txt"}])
+    fake_store._write_generation(fake_store.read_generation() + 1)
+    assert fake_store.get_vectorstore() is first
+    assert first.index.ntotal == 2
+
+    base_info = fake_store._read_base_info()
+    fake_store._atomic_write(fake_store._path(fake_store.BASE_FILE), fake_store.json.dumps(dict(base_info, version=base_info["version"] + 1)))
+    fake_store._write_generation(fake_store.read_generation() + 1)
+    assert fake_store.get_vectorstore() is not first
+
+
+def test_scoped_search_returns_k_hits_for_small_document(fake_store):
+    """Per-document search is pre-filtered inside FAISS, not after a global top-k"""
+    big = [Document(page_content=f"Payment schedule item {i}", metadata={"source": "data/big.txt"}) for i in range(50)]
+    small = [
+        Document(page_content=f"Confidentiality obligation {i}", metadata={"source": "data/small.txt"})
+        for i in range(3)
+    ]
+    fake_store.add_documents(big)
+    fake_store.add_documents(small)
+
+    results = fake_store.similarity_search("Payment schedule item 1", k=3, document_source="data/small.txt")
+    assert len(results) == 3
+    assert all(doc.metadata["source"] == "data/small.txt" for doc, _ in results)
+    assert fake_store.similarity_search("anything", k=3, document_source="data/missing.txt") == []
+
+
+def test_retriever_uses_document_scope(fake_store):
+    """One retriever instance serves both scoped and unscoped queries"""
+    from modules.retriever import get_retriever, document_scope
+
+    fake_store.add_documents([Document(page_content=f"Clause {i}", metadata={"source": "data/a.txt"}) for i in range(5)])
+    fake_store.add_documents([Document(page_content="Clause 1", metadata={"source": "data/b.txt"})])
+
+    retriever = get_retriever()
+    with document_scope("data/b.txt"):
+        docs = retriever.invoke("Clause 1")
+    assert [doc.metadata["source"] for doc in docs] == ["data/b.txt"]
+    assert len(retriever.invoke("Clause 1")) == 3
+
+
+def test_appends_write_segments_not_the_base(fake_store):
+    """Uploads append a segment; the base index file is left untouched"""
+    fake_store.add_documents([Document(page_content="Base clause", metadata={"source": "data/a.txt"})])
+    base_mtime = os.stat(fake_store._base_path("index.faiss")).st_mtime_ns
+
+    fake_store.add_documents([Document(page_content="New clause", metadata={"source": "data/b.txt"})])
+    assert os.stat(fake_store._base_path("index.faiss")).st_mtime_ns == base_mtime
+    assert fake_store._segment_numbers() == [1]
+
+    # A fresh process replays the segment on load
+    fake_store.reset_vectorstore()
+    assert fake_store.get_vectorstore().index.ntotal == 2
+    assert fake_store.list_sources() == ["data/a.txt", "data/b.txt"]
+
+
+def test_merge_folds_segments_into_base(fake_store):
+    """Merging keeps the live index valid and leaves no segments behind"""
+    fake_store.add_documents([Document(page_content="Clause 0", metadata={"source": "data/a.txt"})])
+    for i in range(1, 4):
+        fake_store.add_documents([Document(page_content=f"Clause {i}", metadata={"source": f"data/{i}.txt"})])
+
+    assert fake_store.merge_segments()
+    assert fake_store._segment_numbers() == []
+    assert fake_store.get_vectorstore().index.ntotal == 4
+
+    fake_store.reset_vectorstore()
+    assert fake_store.get_vectorstore().index.ntotal == 4
+    assert [doc.metadata["source"] for doc, _ in fake_store.similarity_search("Clause 2", k=1, document_source="data/2.txt")] == ["data/2.txt"]
+
+
+def test_concurrent_appends_are_serialized(fake_store):
+    """Writers from several threads never overwrite each other's chunks"""
+    import threading
+
+    fake_store.add_documents([Document(page_content="Seed", metadata={"source": "data/seed.txt"})])
+    threads = [
+        threading.Thread(
+            target=fake_store.add_documents,
+            args=([Document(page_content=f"Doc {i} chunk {j}", metadata={"source": f"data/{i}.txt"}) for j in range(5)],),
+        )
+        for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    fake_store.reset_vectorstore()
+    assert fake_store.get_vectorstore().index.ntotal == 41
+
+
+def test_delete_hides_document_and_compaction_drops_it(fake_store, monkeypatch):
+    """Deleted documents vanish from search at once and from the index after compaction"""
+    monkeypatch.setattr(fake_store, "TOMBSTONE_COMPACTION_RATIO", 1.0)  # compact only on demand
+    fake_store.add_documents([Document(page_content=f"Lease term {i}", metadata={"source": "data/lease.txt"}) for i in range(4)])
+    fake_store.add_documents([Document(page_content=f"Lease term {i}", metadata={"source": "data/nda.txt"}) for i in range(2)])
+
+    assert fake_store.delete_document("data/lease.txt") == 4
+    assert fake_store.delete_document("data/lease.txt") == 0
+    results = fake_store.similarity_search("Lease term 1", k=5)
+    assert [doc.metadata["source"] for doc, _ in results] == ["data/nda.txt", "data/nda.txt"]
+    assert fake_store.get_vectorstore().index.ntotal == 6
+
+    # Another process sees the deletion through the segment log
+    fake_store.reset_vectorstore()
+    assert fake_store.list_sources() == ["data/nda.txt"]
+
+    assert fake_store.compact_vectorstore()
+    assert fake_store.get_vectorstore().index.ntotal == 2
+    fake_store.reset_vectorstore()
+    assert fake_store.get_vectorstore().index.ntotal == 2
+    assert len(fake_store.similarity_search("Lease term 1", k=5, document_source="data/nda.txt")) == 2
+
+
+def test_reingesting_identical_chunks_does_not_grow_index(fake_store):
+    """Chunks already indexed for a source are skipped, as are in-batch duplicates"""
+    chunks = [Document(page_content=f"Section {i}", metadata={"source": "data/a.txt"}) for i in range(3)]
+    fake_store.add_documents(chunks + [chunks[0]])
+    generation = fake_store.read_generation()
+
+    assert fake_store.add_documents(chunks) == generation
+    assert fake_store.get_vectorstore().index.ntotal == 3
+    # The same text under another document is a separate chunk
+    fake_store.add_documents([Document(page_content="Section 0", metadata={"source": "data/b.txt"})])
+    assert fake_store.get_vectorstore().index.ntotal == 4
+
+
+def test_replace_document_swaps_changed_chunks(fake_store):
+    """Re-uploading a changed file replaces its chunks; an unchanged one is a no-op"""
+    old = [Document(page_content=f"Term {i}", metadata={"source": "data/a.txt"}) for i in range(3)]
+    assert fake_store.replace_document("data/a.txt", old) == 3
+    assert fake_store.replace_document("data/a.txt", old) == 0
+
+    new = old[:2] + [Document(page_content="Term 3 amended", metadata={"source": "data/a.txt"})]
+    assert fake_store.replace_document("data/a.txt", new) == 3
+    texts = {doc.page_content for doc, _ in fake_store.similarity_search("Term", k=10)}
+    assert texts == {"Term 0", "Term 1", "Term 3 amended"}
+
+
+def test_store_is_pickle_free_and_legacy_layout_migrates(fake_store):
+    """Bases are written without pickle; an index.pkl store must be migrated before use"""
+    from langchain_community.vectorstores import FAISS
+
+    fake_store.add_documents([Document(page_content="Native chunk", metadata={"source": "data/a.txt"})])
+    assert not os.path.exists(fake_store._path("index.pkl"))
+    assert [doc.page_content for doc in fake_store.get_vectorstore().similarity_search("Native chunk", k=1)] == ["Native chunk"]
+
+    legacy = FAISS.from_texts(
+        ["Arbitration in London", "Notice period of 30 days"],
+        fake_store.get_embeddings(),
+        metadatas=[{"source": "data/old.txt"}, {"source": "data/old.txt", "page": 2}],
+    )
+    fake_store.reset_vectorstore()
+    for name in os.listdir(fake_store.VECTORSTORE_PATH):
+        if os.path.isdir(fake_store._path(name)):
+            shutil.rmtree(fake_store._path(name))
+        elif not name.startswith("."):
+            os.remove(fake_store._path(name))
+    legacy.save_local(fake_store.VECTORSTORE_PATH)
+    with pytest.raises(fake_store.LegacyStoreError):
+        fake_store.get_vectorstore()
+
+    assert fake_store.migrate_vectorstore() == 2
+    assert not os.path.exists(fake_store._path("index.pkl"))
+    fake_store.reset_vectorstore()
+    assert fake_store.list_sources() == ["data/old.txt"]
+    doc, _ = fake_store.similarity_search("Notice period of 30 days", k=1)[0]
+    assert (doc.page_content, doc.metadata) == ("Notice period of 30 days", {"source": "data/old.txt", "page": 2})
+
+
+def test_batch_search_matches_single_queries(fake_store):
+    fake_store.add_documents([
+        Document(page_content=f"Clause {i} on {topic}", metadata={"source": f"data/{topic}.pdf"})
+        for i in range(4) for topic in ("rent", "notice")
+    ])
+    queries = ["Clause 1 on rent", "Clause 2 on notice", "Clause 1 on rent"]
+    for search_type, search in (("vector", fake_store.similarity_search), ("hybrid", fake_store.hybrid_search), ("lexical", fake_store.lexical_search)):
+        for source in (None, "data/notice.pdf"):
+            batch = fake_store.batch_search(queries, k=3, document_source=source, search_type=search_type)
+            assert batch == [search(query, k=3, document_source=source) for query in queries]
+    first, _, repeat = fake_store.batch_search(queries, k=3)
+    assert all(a is b for (a, _), (b, _) in zip(first, repeat))  # shared context is read once
+
+
+def test_merges_write_immutable_snapshots_and_prune_old_ones(fake_store, monkeypatch):
+    monkeypatch.setattr(fake_store, "SNAPSHOT_GRACE_SECONDS", 0)
+    fake_store.add_documents([Document(page_content="Clause 0", metadata={"source": "data/a.txt"})])
+    for i in range(1, 4):
+        fake_store.add_documents([Document(page_content=f"Clause {i}", metadata={"source": "data/a.txt"})])
+        assert fake_store.merge_segments()
+
+    base_info = fake_store._read_base_info()
+    assert base_info["snapshot"] == "snapshots/base-00000004"
+    assert sorted(os.listdir(fake_store._path("snapshots"))) == ["base-00000003", "base-00000004"]
+    assert not os.path.exists(fake_store._path("index.faiss"))
+    fake_store.reset_vectorstore()
+    assert fake_store.get_vectorstore().index.ntotal == 4
+
+
+def test_inflight_query_finishes_on_the_old_index(fake_store):
+    """A merge swaps the index under a running query; the old one is released when it finishes"""
+    fake_store.add_documents([Document(page_content="Clause 0", metadata={"source": "data/a.txt"})])
+    fake_store.add_documents([Document(page_content="Clause 1", metadata={"source": "data/b.txt"})])
+    with fake_store._pinned() as old:
+        assert fake_store.merge_segments()
+        assert fake_store._index is not old and old.retired
+        assert [doc.page_content for doc, _ in old.documents(old.lexical_search("Clause 1", 1))] == ["Clause 1"]
+    assert old.index is None and old.chunks is None
+    assert [doc.page_content for doc, _ in fake_store.lexical_search("Clause 1", k=1)] == ["Clause 1"]
+
+
+def test_watcher_hot_swaps_to_a_snapshot_written_elsewhere(fake_store):
+    """With the watcher running, queries keep using the loaded index until the new snapshot is swapped in"""
+    fake_store.add_documents([Document(page_content="Clause 0", metadata={"source": "data/a.txt"})])
+    fake_store.add_documents([Document(page_content="Clause 1", metadata={"source": "data/b.txt"})])
+    old = fake_store._get_index()
+    fake_store.start_snapshot_watcher(interval=3600)  # polled by hand below
+
+    # Another process merges: a new snapshot, the manifest flip, a generation bump
+    base_info = fake_store._read_base_info()
+    merged = fake_store._load_base()
+    for number in fake_store._segment_numbers(after=base_info["merged_through"]):
+        merged.replay(number)
+    merged.compact()
+    with fake_store._writer():
+        fake_store._write_base(merged, base_info["version"] + 1, fake_store._segment_numbers()[-1])
+        fake_store._bump_generation()
+
+    assert fake_store._get_index() is old
+    assert fake_store._poll_snapshot()
+    assert fake_store._get_index() is not old and old.retired
+    assert fake_store._base_version == base_info["version"] + 1
+    assert fake_store.list_sources() == ["data/a.txt", "data/b.txt"]
+    assert not fake_store._poll_snapshot()